@@ -0,0 +1,84 @@
+'''Serialization cost of calendar-sized /logs/data payloads: flask.jsonify vs the app's JSON provider.
+
+    python -m benchmarks.bench_json [--sizes 42 365 5000] [--repeat 200]
+
+"flask_jsonify" is the previous path: ids and dates turned into strings by
+hand, then the stdlib encoder via flask.jsonify. "provider_stdlib" and
+"provider_orjson" encode the raw ObjectId/datetime values through
+serialization.JSONProvider. Request-body parsing of a create_log payload is
+timed the same way.
+'''
+import argparse
+import json
+from datetime import datetime, timedelta
+
+import flask
+from bson import ObjectId
+
+from benchmarks.common import app, timeit
+from flask_app.logs.routes import log_event
+from flask_app.serialization import JSONProvider
+
+TYPES = ["Period", "Ovulation", "Sexual Activity", "Treatment", "Event"]
+REQUEST_BODY = json.dumps({
+    "type": "Treatment",
+    "description": "500mg with dinner",
+    "treatment_name": "Metformin",
+    "start_date": "2024-03-01T00:00:00",
+    "end_date": "2024-03-02T00:00:00",
+}).encode()
+
+
+def raw_logs(n):
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "type": TYPES[i % len(TYPES)],
+            "description": f"entry {i}",
+            "treatment_name": "Metformin" if TYPES[i % len(TYPES)] == "Treatment" else "",
+            "start_date": start + timedelta(days=i),
+            "end_date": start + timedelta(days=i + 1),
+        }
+        for i in range(n)
+    ]
+
+
+def stringified(event):
+    return dict(event, id=str(event["id"]), start=event["start"].isoformat(), end=event["end"].isoformat())
+
+
+def run(sizes, repeat=200):
+    results = []
+    stdlib, fast = JSONProvider(use_orjson=False), JSONProvider()
+    with app.test_request_context():
+        for n in sizes:
+            events = [log_event(log, show_treatments=True) for log in raw_logs(n)]
+            reps = max(5, repeat * 42 // max(n, 42))
+            results.append({
+                "events": n,
+                "bytes": len(fast.dumps_bytes(events)),
+                "flask_jsonify": timeit(lambda: flask.jsonify([stringified(e) for e in events]), repeat=reps),
+                "provider_stdlib": timeit(lambda: stdlib.response(events), repeat=reps),
+                "provider_orjson": timeit(lambda: fast.response(events), repeat=reps),
+            })
+    with app.test_request_context(data=REQUEST_BODY, content_type="application/json"):
+        results.append({
+            "request_body": len(REQUEST_BODY),
+            # What request.get_json() does, minus its per-request cache
+            "flask_json_loads": timeit(lambda: flask.json.loads(flask.request.get_data()), repeat=repeat),
+            "provider_orjson": timeit(lambda: fast.loads(flask.request.get_data()), repeat=repeat),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[42, 365, 5000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+'''Read latency, storage size and index size of the document and bucket Log layouts.
+
+    python -m benchmarks.bench_log_buckets [--mongo-uri URI] [--sizes 365 1825 3650]
+
+For each history size one user gets a daily log, /logs/data is timed for a
+one-month window and for the full history with LOG_STORAGE="documents",
+then the logs are packed into monthly buckets with migrate_to_buckets() and
+timed again with LOG_STORAGE="buckets". Sizes come from collStats, so
+storage and index sizes are only reported against a real mongod; under
+mongomock only the BSON size of the documents is.
+'''
+import argparse
+import json
+from datetime import datetime, timedelta
+
+import bson
+import mongoengine
+
+from benchmarks.common import app, use_database, seed_user, logged_in_client, timeit
+from flask_app.logs.storage import migrate_to_buckets
+from flask_app.models import Log, LogBucket
+
+
+def collection_stats(document_cls):
+    collection = document_cls._get_collection()
+    try:
+        stats = mongoengine.get_db().command({"collStats": collection.name})
+    except NotImplementedError:
+        # mongomock
+        return {
+            "documents": collection.count_documents({}),
+            "size_bytes": sum(len(bson.encode(doc)) for doc in collection.find()),
+            "storage_bytes": None,
+            "index_bytes": None,
+        }
+    return {
+        "documents": stats["count"],
+        "size_bytes": stats["size"],
+        "storage_bytes": stats["storageSize"],
+        "index_bytes": stats["totalIndexSize"],
+    }
+
+
+def measure(client, windowed_url, repeat):
+    windowed = timeit(lambda: client.get(windowed_url), repeat=repeat)
+    windowed["events"] = len(client.get(windowed_url).get_json())
+    full = timeit(lambda: client.get("/logs/data"), repeat=max(3, repeat // 4))
+    full["events"] = len(client.get("/logs/data").get_json())
+    return {"windowed": windowed, "full_history": full}
+
+
+def run(sizes, mongo_uri=None, repeat=20):
+    results = []
+    layout = app.config.get("LOG_STORAGE", "documents")
+    try:
+        for n_logs in sizes:
+            use_database(mongo_uri)
+            start = datetime(2015, 1, 1)
+            user = seed_user(f"bench{n_logs}", n_logs, start=start)
+            client = logged_in_client(user)
+            # A month in the middle of the history, like a returning user would open
+            window_start = start + timedelta(days=n_logs // 2)
+            windowed_url = (f"/logs/data?start={window_start.isoformat()}"
+                            f"&end={(window_start + timedelta(days=35)).isoformat()}")
+
+            app.config["LOG_STORAGE"] = "documents"
+            documents = measure(client, windowed_url, repeat)
+            documents["collection"] = collection_stats(Log)
+
+            migrate_to_buckets(delete_source=True)
+            app.config["LOG_STORAGE"] = "buckets"
+            buckets = measure(client, windowed_url, repeat)
+            buckets["collection"] = collection_stats(LogBucket)
+
+            results.append({"logs": n_logs, "documents": documents, "buckets": buckets})
+    finally:
+        app.config["LOG_STORAGE"] = layout
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[365, 1825, 3650])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.mongo_uri, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+'''Latency of /logs/data for a one-month window as a user's history grows.
+
+    python -m benchmarks.bench_logs_data [--mongo-uri URI] [--sizes 100 1000 10000]
+
+With the visible-range filter the response size stays constant, so latency
+should stay flat as history grows. Against a real mongod the
+(user, start_date, end_date) index keeps the scan flat too; mongomock has
+no indexes, so there only the payload side is flat.
+'''
+import argparse
+import json
+from datetime import datetime, timedelta
+
+from benchmarks.common import use_database, seed_user, logged_in_client, timeit
+
+
+def run(sizes, mongo_uri=None, repeat=20):
+    results = []
+    for n_logs in sizes:
+        use_database(mongo_uri)
+        start = datetime(2015, 1, 1)
+        user = seed_user(f"bench{n_logs}", n_logs, start=start)
+        client = logged_in_client(user)
+
+        # Look at the month in the middle of the history, like a returning user would
+        window_start = start + timedelta(days=n_logs // 2)
+        window_end = window_start + timedelta(days=35)
+        windowed_url = f"/logs/data?start={window_start.isoformat()}&end={window_end.isoformat()}"
+
+        windowed = timeit(lambda: client.get(windowed_url), repeat=repeat)
+        windowed["events"] = len(client.get(windowed_url).get_json())
+        full = timeit(lambda: client.get("/logs/data"), repeat=max(3, repeat // 4))
+        full["events"] = len(client.get("/logs/data").get_json())
+        results.append({"logs": n_logs, "windowed": windowed, "full_history": full})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.mongo_uri, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+'''Peak RSS of a full-history /logs/data response, buffered (jsonify) vs streamed.
+
+    python -m benchmarks.bench_logs_memory [--logs 100000] [--mongo-uri URI]
+
+Each path runs in its own interpreter, since peak RSS only ever grows. The
+user is seeded first and the peak is reset (Linux /proc/self/clear_refs), so
+the number reported is the growth caused by serving the response. The body
+is consumed chunk by chunk and discarded, like a WSGI server sending it.
+Against mongomock the seeded logs live in the same process; pass
+--mongo-uri to see the response alone.
+'''
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime
+
+PATHS = ("buffered", "streamed")
+
+
+def rss_kb(field):
+    """VmRSS / VmHWM in kB from /proc, or ru_maxrss where /proc is unavailable."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak():
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure(path, n_logs, mongo_uri=None):
+    from benchmarks.common import app, use_database, seed_user, logged_in_client
+
+    use_database(mongo_uri)
+    user = seed_user(f"memory{n_logs}", n_logs, start=datetime(1900, 1, 1))
+    client = logged_in_client(user)
+    app.config["STREAM_JSON"] = path == "streamed"
+    client.get("/logs/data?show_treatments=true", buffered=False).close()  # warm up imports and caches
+
+    peak_reset = reset_peak()
+    before = rss_kb("VmRSS")
+    tracemalloc.start()
+    response = client.get("/logs/data?show_treatments=true", buffered=False)
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "path": path,
+        "logs": n_logs,
+        "body_mb": round(size / 2**20, 1),
+        "peak_rss_growth_mb": round((rss_kb("VmHWM") - before) / 1024, 1) if peak_reset else None,
+        "peak_python_alloc_mb": round(traced_peak / 2**20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logs", type=int, default=100000)
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--path", choices=PATHS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.path:
+        print(json.dumps(measure(args.path, args.logs, args.mongo_uri)))
+        return
+
+    results = []
+    for path in PATHS:
+        command = [sys.executable, "-m", "benchmarks.bench_logs_memory", "--path", path, "--logs", str(args.logs)]
+        if args.mongo_uri:
+            command += ["--mongo-uri", args.mongo_uri]
+        output = subprocess.run(command, capture_output=True, text=True, check=True, env=os.environ)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+'''Latency of anonymous pages with the page cache off, in memory and in shared files.
+
+    python -m benchmarks.bench_pages [--paths / /places /community /missing] [--repeat 200]
+
+"uncached" renders every request. "memory" and "file" replay the stored
+response after the first request (the file backend lives in a temporary
+directory here). A logged-in /places request is timed as well: it bypasses
+the page cache but reuses the cached head/footer fragments.
+'''
+import argparse
+import json
+import tempfile
+
+from benchmarks.common import app, use_database, seed_user, logged_in_client, timeit
+from flask_app.extensions import page_cache
+
+BACKENDS = ("none", "memory", "file")
+
+
+def run(paths, repeat=200):
+    use_database()
+    user = seed_user("pages", 0)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in BACKENDS:
+            # A TTL of 0 turns fragment caching off too
+            ttl = 0 if backend == "none" else 3600
+            app.config.update(PAGE_CACHE_BACKEND=backend, PAGE_CACHE_DIR=directory, PAGE_CACHE_TTL=ttl)
+            page_cache.init_app(app)
+            client = app.test_client()
+            row = {"backend": "uncached" if backend == "none" else backend}
+            for path in paths:
+                row[path] = timeit(lambda: client.get(path), repeat=repeat)
+            authed = logged_in_client(user)
+            row["/places (logged in)"] = timeit(lambda: authed.get("/places"), repeat=repeat)
+            results.append(row)
+            page_cache.clear()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", nargs="+", default=["/", "/places", "/community", "/missing"])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(run(args.paths, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+'''Load test: /places/review latency no longer follows upstream latency.
+
+    python -m benchmarks.bench_review_latency [--delays 0 0.5 2] [--requests 200] [--concurrency 8]
+
+For each simulated Lambda delay, concurrent clients post reviews while the
+outbox worker delivers them in the background. p99 of the route should stay
+flat; `upstream_call_ms` is what every request used to wait for.
+'''
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_app.extensions import lambda_client
+from flask_app.models import Review
+from flask_app.reviews import outbox
+from benchmarks.common import use_database, seed_user, logged_in_client
+from benchmarks.stub_lambda import StubLambdaServer
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(len(samples) * q))], 3)
+
+
+def run(delays, n_requests=200, concurrency=8, mongo_uri=None):
+    results = []
+    for delay in delays:
+        use_database(mongo_uri)
+        user = seed_user("reviewer", 0)
+        with StubLambdaServer(delay=delay) as stub:
+            lambda_client.review_url = stub.url
+            outbox.worker.enabled = True
+            outbox.worker.interval = 0.1
+
+            started = time.perf_counter()
+            lambda_client.submit_review({"warmup": True})
+            upstream_ms = (time.perf_counter() - started) * 1000
+
+            def post_one(i):
+                client = logged_in_client(user)
+                started = time.perf_counter()
+                response = client.post('/places/review', json={
+                    "place_id": f"place-{i % 20}", "rating": 1 + i % 5, "comment": "bench",
+                })
+                assert response.status_code == 202
+                return (time.perf_counter() - started) * 1000
+
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = list(pool.map(post_one, range(n_requests)))
+
+            results.append({
+                "upstream_delay_s": delay,
+                "upstream_call_ms": round(upstream_ms, 3),
+                "route_p50_ms": percentile(samples, 0.50),
+                "route_p99_ms": percentile(samples, 0.99),
+                "delivered_so_far": Review.objects(status="SENT").count(),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--delays", type=float, nargs="+", default=[0, 0.5, 2])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    print(json.dumps(run(args.delays, args.requests, args.concurrency, args.mongo_uri), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+'''Bytes read and request latency for the Flask-Login user loader.
+
+    python -m benchmarks.bench_user_loader [--mongo-uri URI] [--legacy-refs 0 5000]
+
+Compares the old full-document loader with the projected loader, with and
+without the per-process user cache, on /logs/data and /profile. Users are
+seeded with `--legacy-refs` entries in the old reference arrays to model
+accounts that have not been through `flask migrate-user-refs` yet.
+'''
+import argparse
+import json
+
+import bson
+from bson import ObjectId
+
+from flask_app.extensions import login_manager, user_cache
+from flask_app.models import User, load_user, USER_IDENTITY_FIELDS
+from benchmarks.common import use_database, seed_user, logged_in_client, timeit
+
+
+def load_full_user(user_id):
+    return User.objects(username=user_id).first()
+
+
+LOADERS = {
+    "full_document": (load_full_user, 0),
+    "projected": (load_user, 0),
+    "projected_cached": (load_user, 300),
+}
+
+
+def run(legacy_sizes, mongo_uri=None, repeat=30):
+    results = []
+    original_loader = login_manager._user_callback
+    try:
+        for legacy_refs in legacy_sizes:
+            use_database(mongo_uri)
+            user = seed_user(f"loader{legacy_refs}", 200)
+            refs = [ObjectId() for _ in range(legacy_refs)]
+            User._get_collection().update_one(
+                {"_id": user.id}, {"$set": {"logs": refs, "problems": refs[:100], "insights": []}}
+            )
+            collection = User._get_collection()
+            projection = {field if field != "id" else "_id": 1 for field in USER_IDENTITY_FIELDS}
+            row = {
+                "legacy_refs": legacy_refs,
+                "bytes_full_document": len(bson.encode(collection.find_one({"_id": user.id}))),
+                "bytes_projected": len(bson.encode(collection.find_one({"_id": user.id}, projection))),
+            }
+
+            client = logged_in_client(user)
+            for name, (loader, ttl) in LOADERS.items():
+                login_manager.user_loader(loader)
+                user_cache.configure(ttl=ttl)
+                row[name] = {
+                    "logs_data": timeit(lambda: client.get("/logs/data?start=2015-02-01&end=2015-03-08"), repeat=repeat),
+                    "profile": timeit(lambda: client.get("/profile"), repeat=repeat),
+                }
+            results.append(row)
+    finally:
+        login_manager.user_loader(original_loader)
+        user_cache.configure(ttl=0)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--legacy-refs", type=int, nargs="+", default=[0, 5000])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+    print(json.dumps(run(args.legacy_refs, args.mongo_uri, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
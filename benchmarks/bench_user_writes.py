@@ -0,0 +1,89 @@
+'''Write throughput of log creation under the three User-array strategies.
+
+    python -m benchmarks.bench_user_writes [--mongo-uri URI] [--history 0 1000 10000]
+
+Each strategy writes the same Log documents for a user that already has
+`history` entries:
+
+* legacy_save   - the old path: append to User.logs and save() the user
+* atomic_push   - keep the array but update it with a single $push
+* back_ref_only - the current path: only the Log is written, found via Log.user
+'''
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+import bson
+from bson import ObjectId
+
+from flask_app.extensions import db
+from flask_app.models import Log
+from benchmarks.common import use_database, seed_user
+
+
+class LegacyUser(db.Document):
+    '''The pre-migration User shape, kept in its own collection for comparison.'''
+    username = db.StringField()
+    logs = db.ListField(db.ReferenceField('Log'))
+    meta = {'collection': 'bench_legacy_user'}
+
+
+def legacy_save(legacy, log):
+    legacy.logs.append(log)
+    legacy.save()
+
+
+def atomic_push(legacy, log):
+    LegacyUser.objects(id=legacy.id).update_one(push__logs=log)
+
+
+def back_ref_only(legacy, log):
+    pass
+
+
+STRATEGIES = {
+    "legacy_save": legacy_save,
+    "atomic_push": atomic_push,
+    "back_ref_only": back_ref_only,
+}
+
+
+def run(history_sizes, writes=200, mongo_uri=None):
+    results = []
+    for history in history_sizes:
+        row = {"history": history}
+        for name, strategy in STRATEGIES.items():
+            use_database(mongo_uri)
+            user = seed_user(f"writer{history}", 0)
+            legacy = LegacyUser(username=user.username, logs=[ObjectId() for _ in range(history)]).save()
+            # Reload so legacy_save starts from a freshly loaded document, as a request would
+            legacy = LegacyUser.objects(id=legacy.id).first()
+
+            day = datetime(2024, 1, 1)
+            started = time.perf_counter()
+            for i in range(writes):
+                log = Log(user=user, type="Event", start_date=day + timedelta(days=i),
+                          end_date=day + timedelta(days=i + 1)).save()
+                strategy(legacy, log)
+            elapsed = time.perf_counter() - started
+            raw_user = LegacyUser._get_collection().find_one({"_id": legacy.id})
+            row[name] = {
+                "writes_per_sec": round(writes / elapsed, 1),
+                "user_doc_bytes": len(bson.encode(raw_user)),
+            }
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 1000, 10000])
+    parser.add_argument("--writes", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(run(args.history, args.writes, args.mongo_uri), indent=2))
+
+
+if __name__ == "__main__":
+    main()
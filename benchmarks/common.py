@@ -0,0 +1,86 @@
+'''Shared helpers for the benchmark scripts.
+
+Benchmarks run offline against mongomock by default. Pass a MongoDB URI
+(e.g. ``--mongo-uri mongodb://localhost:27017/pcos_bench``) to run them
+against a real ``mongod``, which is the only way index effects show up.
+'''
+import os
+import time
+import statistics
+from datetime import datetime, timedelta
+
+# config.py reads these at import time
+os.environ.setdefault("MONGODB_HOST", "mongodb://localhost:27017/pcos_bench")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+import mongoengine
+import mongomock
+
+from flask_app.run import app
+from flask_app.models import User, Log, LogBucket
+
+
+def use_database(mongo_uri=None):
+    '''Points the default connection at mongomock, or at a real server when a URI is given.'''
+    mongoengine.disconnect()
+    if mongo_uri:
+        conn = mongoengine.connect(host=mongo_uri)
+    else:
+        conn = mongoengine.connect("pcos_bench", mongo_client_class=mongomock.MongoClient)
+    db_name = mongoengine.get_db().name
+    conn.drop_database(db_name)
+    # Collections are dropped above, so recreate the declared indexes
+    Log.ensure_indexes()
+    LogBucket.ensure_indexes()
+    User.ensure_indexes()
+    return conn
+
+
+def seed_user(username, n_logs, start=datetime(2015, 1, 1)):
+    '''Creates a user with one daily log per day starting at `start`, inserted in bulk.'''
+    user = User(username=username, email=f"{username}@example.com", password="bench").save()
+    types = ["Period", "Ovulation", "Sexual Activity", "Treatment", "Event"]
+    docs = []
+    for i in range(n_logs):
+        day = start + timedelta(days=i)
+        log_type = types[i % len(types)]
+        docs.append({
+            "user": user.id,
+            "type": log_type,
+            "description": f"entry {i}",
+            "start_date": day,
+            "end_date": day + timedelta(days=1),
+            "treatment_name": "Metformin" if log_type == "Treatment" else "",
+        })
+    for offset in range(0, len(docs), 10000):
+        Log._get_collection().insert_many(docs[offset:offset + 10000])
+    return user
+
+
+def logged_in_client(user):
+    '''Returns a test client with a logged-in session for `user`.'''
+    app.config["TESTING"] = True
+    app.config["WTF_CSRF_ENABLED"] = False
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = user.get_id()
+        session["_fresh"] = True
+    return client
+
+
+def timeit(fn, repeat=20, warmup=2):
+    '''Calls `fn` repeatedly and returns latency stats in milliseconds.'''
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "min_ms": round(samples[0], 3),
+    }
@@ -0,0 +1,78 @@
+'''Cold-start import profile of the serverless entry point, with a budget check.
+
+    python -m benchmarks.import_time [--budget-ms 600] [--top 15] [--repeat 3]
+
+Runs `python -X importtime -c "import flask_app.run"` in a fresh interpreter
+(what Vercel pays on every cold start: imports plus create_app()) and prints
+the slowest top-level imports. Exits non-zero if the best of --repeat runs
+is over budget or if a module in DEFERRED is imported at startup.
+'''
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ENTRY_POINT = "flask_app.run"
+# Imported on first use by the code that needs them, never at startup
+DEFERRED = ("numpy", "requests", "boto3")
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def profile():
+    """Returns [(module, self_us, cumulative_us, depth)] for one cold import."""
+    env = dict(os.environ)
+    env.setdefault("MONGODB_HOST", "mongodb://localhost:27017/pcos")
+    env.setdefault("SECRET_KEY", "import-time")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {ENTRY_POINT}"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def total_ms(rows):
+    return next(cumulative for module, _, cumulative, _ in rows if module == ENTRY_POINT) / 1000
+
+
+def deferred_imports(rows):
+    return sorted({module for module, *_ in rows if module in DEFERRED})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=600)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # The first run also warms the filesystem cache; keep the fastest
+    rows = min((profile() for _ in range(args.repeat)), key=total_ms)
+    total = total_ms(rows)
+
+    # Direct imports of the flask_app package: extensions, blueprints, config
+    top_level = sorted((r for r in rows if r[3] == 2), key=lambda r: r[2], reverse=True)
+    print(f"{'cumulative ms':>14}  module")
+    for module, _, cumulative, _ in top_level[:args.top]:
+        print(f"{cumulative / 1000:14.1f}  {module}")
+    print(f"{total:14.1f}  total ({ENTRY_POINT}, budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    eager = deferred_imports(rows)
+    if eager:
+        print(f"Imported at startup but should be deferred: {', '.join(eager)}")
+        failed = True
+    if total > args.budget_ms:
+        print(f"Over budget by {total - args.budget_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
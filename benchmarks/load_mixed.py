@@ -0,0 +1,175 @@
+'''Load test: /logs/data latency while place searches wait on a slow Lambda.
+
+    python -m benchmarks.load_mixed [--servers wsgi asgi] [--threads 4] [--searchers 8]
+                                    [--readers 4] [--delay 2] [--duration 10]
+
+Each server runs in its own process on mongomock with one seeded user:
+"wsgi" is the Flask app under waitress with --threads threads (like a gthread
+gunicorn worker), "asgi" is flask_app.asgi under uvicorn with the same number
+of threads for the Flask routes. --searchers clients post distinct searches
+(cache misses) to a stub Lambda that answers after --delay seconds, while
+--readers clients fetch a month of calendar data. Under WSGI the searches
+take every thread and calendar p99 follows the Lambda delay; under ASGI it
+should not.
+'''
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+SERVERS = ("wsgi", "asgi")
+LOGS_URL = "/logs/data?start=2024-03-01&end=2024-04-01"
+
+
+def serve(kind, port, threads, lambda_url, n_logs):
+    os.environ["LAMBDA_API_URL_FIND"] = lambda_url
+    os.environ["ASGI_WSGI_THREADS"] = str(threads)
+    os.environ["PAGE_CACHE_BACKEND"] = "none"
+    # Every search is slow on purpose
+    os.environ["SLOW_REQUEST_MS"] = "60000"
+    from benchmarks.common import app, use_database, seed_user, logged_in_client
+
+    use_database()
+    user = seed_user("loadtest", n_logs, start=datetime(2024, 1, 1))
+    client = logged_in_client(user)
+    cookie = next(c.value for c in client.cookie_jar if c.name == app.session_cookie_name)
+    print(json.dumps({"cookie": {app.session_cookie_name: cookie}}), flush=True)
+
+    if kind == "wsgi":
+        import logging
+        import waitress
+        # Every queued request is logged as a warning otherwise
+        logging.getLogger("waitress.queue").setLevel(logging.ERROR)
+        waitress.serve(app, host="127.0.0.1", port=port, threads=threads, _quiet=True)
+    else:
+        import uvicorn
+        from flask_app.asgi import app as asgi_app
+        uvicorn.run(asgi_app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(base_url, timeout=30):
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + "/places", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"server at {base_url} did not start")
+
+
+def drive(base_url, cookie, searchers, readers, duration, delay):
+    import requests
+    # Not at module level: importing it creates the app, and --serve must set the environment first
+    from benchmarks.bench_review_latency import percentile
+
+    stop = time.monotonic() + duration
+    search_status, search_ms, logs_ms, logs_errors = {}, [], [], [0]
+    lock = threading.Lock()
+
+    def search_loop(worker):
+        session = requests.Session()
+        i = 0
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                status = session.post(base_url + "/places/search", json={"address": f"search {worker}-{i}"},
+                                      timeout=delay + 30).status_code
+            except requests.RequestException:
+                status = "error"
+            with lock:
+                search_status[status] = search_status.get(status, 0) + 1
+                search_ms.append((time.perf_counter() - started) * 1000)
+            i += 1
+
+    def logs_loop():
+        session = requests.Session()
+        session.cookies.update(cookie)
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                ok = session.get(base_url + LOGS_URL, timeout=delay + 30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                if ok:
+                    logs_ms.append((time.perf_counter() - started) * 1000)
+                else:
+                    logs_errors[0] += 1
+
+    workers = [threading.Thread(target=search_loop, args=(n,)) for n in range(searchers)]
+    workers += [threading.Thread(target=logs_loop) for _ in range(readers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return {
+        "logs_requests": len(logs_ms),
+        "logs_errors": logs_errors[0],
+        "logs_p50_ms": percentile(logs_ms, 0.50) if logs_ms else None,
+        "logs_p99_ms": percentile(logs_ms, 0.99) if logs_ms else None,
+        "search_statuses": {str(k): v for k, v in sorted(search_status.items(), key=str)},
+        "search_p50_ms": percentile(search_ms, 0.50) if search_ms else None,
+    }
+
+
+def run(servers, threads=4, searchers=8, readers=4, delay=2.0, duration=10.0, n_logs=365):
+    from benchmarks.stub_lambda import StubLambdaServer
+
+    results = []
+    with StubLambdaServer(delay=delay) as stub:
+        for kind in servers:
+            port = free_port()
+            command = [sys.executable, "-m", "benchmarks.load_mixed", "--serve", kind, "--port", str(port),
+                       "--threads", str(threads), "--lambda-url", stub.url, "--logs", str(n_logs)]
+            server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, env=os.environ)
+            try:
+                cookie = json.loads(server.stdout.readline())["cookie"]
+                base_url = f"http://127.0.0.1:{port}"
+                wait_until_up(base_url)
+                row = {"server": kind, "threads": threads, "searchers": searchers, "readers": readers,
+                       "lambda_delay_s": delay}
+                row.update(drive(base_url, cookie, searchers, readers, duration, delay))
+                results.append(row)
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", nargs="+", choices=SERVERS, default=list(SERVERS))
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--searchers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=2.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--logs", type=int, default=365)
+    parser.add_argument("--serve", choices=SERVERS, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--lambda-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.threads, args.lambda_url, args.logs)
+        return
+    print(json.dumps(run(args.servers, args.threads, args.searchers, args.readers, args.delay,
+                         args.duration, args.logs), indent=2))
+
+
+if __name__ == "__main__":
+    main()
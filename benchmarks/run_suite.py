@@ -0,0 +1,146 @@
+'''Endpoint micro-benchmark suite over seeded datasets.
+
+    python -m benchmarks.run_suite [--sizes 100 10000 100000] [--mongo-uri URI] [--output FILE]
+    python -m benchmarks.run_suite --compare BASE.json HEAD.json [--threshold 0.2]
+
+Seeds one user per dataset size and times the main endpoints through the
+Flask test client. Results are written as JSON (by default to
+benchmarks/results/<commit>.json) so two commits can be compared with
+--compare, which lists endpoints whose p50 got slower than the threshold.
+'''
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime, timedelta
+
+from flask_app.models import Problem
+from flask_app.constants import SYMPTOMS
+from benchmarks.common import app, use_database, seed_user, logged_in_client, timeit
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+PROFILE_PROBLEMS = 200
+
+
+def repeat_for(n_logs, base):
+    # Keep the 100k runs finishing in reasonable time on mongomock
+    return max(3, base // max(1, n_logs // 10000))
+
+
+def bench_dataset(n_logs, mongo_uri=None, repeat=20):
+    use_database(mongo_uri)
+    start = datetime(2015, 1, 1)
+    user = seed_user(f"suite{n_logs}", n_logs, start=start)
+    Problem._get_collection().insert_many([
+        {"name": f"{SYMPTOMS[i % len(SYMPTOMS)]} #{i}", "user": user.id, "details": ""}
+        for i in range(PROFILE_PROBLEMS)
+    ])
+    client = logged_in_client(user)
+    reps = repeat_for(n_logs, repeat)
+
+    middle = start + timedelta(days=n_logs // 2)
+    window = f"start={middle.isoformat()}&end={(middle + timedelta(days=42)).isoformat()}"
+    results = {
+        "logs_data_concise": timeit(lambda: client.get(f"/logs/data?show_treatments=false&{window}"), repeat=reps),
+        "logs_data_detailed": timeit(lambda: client.get(f"/logs/data?show_treatments=true&{window}"), repeat=reps),
+    }
+
+    days = itertools.count()
+    created = []
+
+    def create():
+        day = (middle + timedelta(days=next(days) % 30)).isoformat()
+        response = client.post("/logs", json={"type": "Event", "start_date": day, "end_date": day})
+        created.append(response.get_json()["id"])
+
+    results["create_log"] = timeit(create, repeat=reps)
+    results["update_log"] = timeit(
+        lambda: client.put(f"/logs/{created[0]}", json={"description": "edited"}), repeat=reps
+    )
+    results["delete_log"] = timeit(lambda: client.delete(f"/logs/{created.pop()}"), repeat=min(reps, len(created) - 3), warmup=1)
+    results["profile"] = timeit(lambda: client.get("/profile"), repeat=reps)
+
+    anonymous = app.test_client()
+    usernames = (f"new{n_logs}_{i}" for i in itertools.count())
+
+    def register():
+        name = next(usernames)
+        anonymous.post("/register", data={
+            "username": name, "email": f"{name}@example.com",
+            "password": "secret1", "confirm_password": "secret1",
+        })
+
+    results["register"] = timeit(register, repeat=max(3, reps // 4), warmup=1)
+
+    def login():
+        fresh = app.test_client()
+        fresh.post("/login", data={"username": f"new{n_logs}_0", "password": "secret1"})
+
+    results["login"] = timeit(login, repeat=max(3, reps // 4), warmup=1)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(sizes, mongo_uri=None, repeat=20):
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "backend": "mongod" if mongo_uri else "mongomock",
+            "python": platform.python_version(),
+        },
+        "results": {str(n): bench_dataset(n, mongo_uri, repeat) for n in sizes},
+    }
+
+
+def compare(base_path, head_path, threshold):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(head_path) as f:
+        head = json.load(f)
+    regressions = []
+    for size, benches in head["results"].items():
+        for name, stats in benches.items():
+            before = base["results"].get(size, {}).get(name)
+            if not before:
+                continue
+            change = stats["p50_ms"] / before["p50_ms"] - 1
+            flag = "REGRESSION" if change > threshold else ""
+            print(f"{size:>7} {name:<20} {before['p50_ms']:>10.2f} -> {stats['p50_ms']:>10.2f} ms  {change:+7.1%} {flag}")
+            if flag:
+                regressions.append((size, name))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-uri", default=None)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"))
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.compare:
+        raise SystemExit(1 if compare(*args.compare, args.threshold) else 0)
+
+    report = run(args.sizes, args.mongo_uri, args.repeat)
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+'''A local stand-in for the API Gateway Lambdas with configurable latency.'''
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLambdaServer:
+    '''Serves find_places and submit_review on 127.0.0.1 after `delay` seconds.'''
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        # Raw response body to send instead of the JSON result
+        self.body = None
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.calls += 1
+                time.sleep(stub.delay)
+                payload = stub.body or json.dumps({"places": [{"name": body.get("reference")}], "ok": True}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,5 +1,5 @@
 from flask import Flask, render_template
-from .extensions import db, login_manager, bcrypt
+from .extensions import db, login_manager, bcrypt, user_cache, lambda_client, json_provider, assets, page_cache
 
 from flask_login import (
     LoginManager, 
@@ -13,8 +13,15 @@ from werkzeug.utils import secure_filename
 from .users.routes import users
 from .logs.routes import logs
 from .places.routes import places
+from .prediction.routes import prediction
+from .treatments.routes import treatments
+from .commands import commands
+from .reviews import outbox
+from .pages import cache_page
+from . import metrics, mongo
 
 
+@cache_page(key="404")
 def custom_404(e):
     return render_template("404.html"), 404
 
@@ -25,13 +32,28 @@ def create_app(test_config=None):
     if test_config:
         app.config.update(test_config)
         
+    # Before db.init_app so the command listener sees the MongoClient being created
+    metrics.init_app(app)
     db.init_app(app)
+    mongo.init_app(app)
     login_manager.init_app(app)
     bcrypt.init_app(app)
+    user_cache.configure(
+        maxsize=app.config.get("USER_CACHE_SIZE", 1024),
+        ttl=app.config.get("USER_CACHE_TTL", 0),
+    )
+    lambda_client.init_app(app)
+    json_provider.init_app(app)
+    assets.init_app(app)
+    page_cache.init_app(app)
+    outbox.worker.init_app(app)
     
     app.register_blueprint(users)
     app.register_blueprint(logs)
     app.register_blueprint(places)
+    app.register_blueprint(prediction)
+    app.register_blueprint(treatments)
+    app.register_blueprint(commands)
     
     app.register_error_handler(404, custom_404)
     
@@ -0,0 +1,104 @@
+# ASGI entry point: `uvicorn flask_app.asgi:app`, or gunicorn -c gunicorn.conf.py.
+#
+# POST /places/search can wait on the find_places Lambda for up to
+# LAMBDA_TIMEOUT seconds. Under a WSGI server that wait holds a worker thread,
+# so a handful of slow searches can leave none for the calendar. Here the
+# search is served on the event loop with AsyncLambdaClient. Every other route
+# runs the unchanged Flask app in a2wsgi's thread pool (ASGI_WSGI_THREADS),
+# which searches no longer occupy. /places/review needs no async version: it
+# only stores the review, and the outbox worker talks to the Lambda.
+import asyncio
+
+from a2wsgi import WSGIMiddleware
+
+from . import metrics
+from .async_client import AsyncLambdaClient
+from .client import LambdaError
+from .extensions import lambda_client
+from .places import store
+from .places.routes import upstream_error
+from .run import app as flask_app
+from .serialization import provider
+
+async_lambda = AsyncLambdaClient(lambda_client)
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def search_place(body):
+    """The async twin of places.routes.search_place: (status, payload, headers)."""
+    try:
+        data = provider().loads(body) if body else None
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return 400, {"error": "Request body must be a JSON object"}, {}
+    address = str(data.get("address") or "").strip()
+    if not address:
+        return 400, {"error": "Missing address"}, {}
+
+    try:
+        result = await async_lambda.find_places(address)
+    except LambdaError as e:
+        payload, status, headers = upstream_error(e)
+        return status, payload, headers
+    return 200, await asyncio.to_thread(store.with_ratings, result), {}
+
+
+class PlacesASGI:
+    """Serves the upstream-bound routes natively and everything else through Flask."""
+
+    # (method, path) -> (Flask endpoint it replaces, for metrics; handler)
+    routes = {("POST", "/places/search"): ("places.search_place", search_place)}
+
+    def __init__(self, app, threads):
+        self.flask_app = app
+        self.wsgi = WSGIMiddleware(app, workers=threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        route = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if route is None:
+            return await self.wsgi(scope, receive, send)
+        endpoint, handler = route
+
+        body = await read_body(receive)
+        # Flask's app context, so handlers (and their to_thread calls) can use
+        # current_app, the database and the JSON provider
+        with self.flask_app.app_context():
+            # Flask's before/after_request hooks don't run here
+            timed = self.flask_app.config.get("METRICS_ENABLED", True)
+            if timed:
+                metrics.start_request()
+            status, payload, headers = await handler(body)
+            content = provider().dumps_bytes(payload) + b"\n"
+            if timed:
+                metrics.record(scope["method"], endpoint)
+        headers = {"Content-Type": "application/json", "Content-Length": str(len(content)), **headers}
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await async_lambda.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = PlacesASGI(flask_app, threads=flask_app.config.get("ASGI_WSGI_THREADS", 10))
@@ -0,0 +1,139 @@
+# Fingerprinted static assets served with immutable caching.
+#
+# asset_url('logs.js') in a template yields /assets/logs.<hash>.js, where the
+# hash is taken from the file's contents when the app starts. The URL changes
+# whenever the file does, so browsers may cache it for a year and never
+# revalidate. `flask build-assets` regenerates static/constants.js from
+# constants.py and writes .gz (and .br, if the brotli package is installed)
+# variants into static/dist, which are served to clients that accept them.
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import Blueprint, abort, current_app, request, send_file, url_for
+
+from . import constants
+
+# Files under static/ that get fingerprinted URLs
+FINGERPRINTED = ("output.css", "logs.js", "constants.js")
+HASH_LENGTH = 12
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(filename, data):
+    root, ext = os.path.splitext(filename)
+    return f"{root}.{fingerprint(data)}{ext}"
+
+
+def render_constants_js():
+    """constants.py's treatment and symptom lists as a script defining window.PCOS_CONSTANTS."""
+    values = {
+        "SYMPTOMS": constants.SYMPTOMS,
+        "TREATMENTS": constants.TREATMENTS,
+    }
+    body = json.dumps(values, indent=2, ensure_ascii=False)
+    return (
+        "// Generated from flask_app/constants.py by `flask build-assets`; do not edit.\n"
+        f"window.PCOS_CONSTANTS = Object.freeze({body});\n"
+    )
+
+
+def build(static_dir):
+    """Writes constants.js and the compressed variants of every fingerprinted file.
+
+    Returns the list of files written, relative to `static_dir`.
+    """
+    written = []
+    with open(os.path.join(static_dir, "constants.js"), "w", encoding="utf-8") as f:
+        f.write(render_constants_js())
+    written.append("constants.js")
+
+    dist = os.path.join(static_dir, "dist")
+    os.makedirs(dist, exist_ok=True)
+    for filename in FINGERPRINTED:
+        with open(os.path.join(static_dir, filename), "rb") as f:
+            data = f.read()
+        name = hashed_name(filename, data)
+        variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append((".br", brotli.compress(data, quality=11)))
+        for suffix, compressed in variants:
+            with open(os.path.join(dist, name + suffix), "wb") as f:
+                f.write(compressed)
+            written.append(os.path.join("dist", name + suffix))
+    return written
+
+
+class Assets:
+    """Maps static files to content-hashed URLs and serves them."""
+
+    def __init__(self):
+        self.urls = {}      # "logs.js" -> "logs.<hash>.js"
+        self.sources = {}   # "logs.<hash>.js" -> "logs.js"
+        self.static_dir = None
+
+    def init_app(self, app):
+        self.static_dir = app.static_folder
+        self.urls.clear()
+        self.sources.clear()
+        for filename in FINGERPRINTED:
+            path = os.path.join(self.static_dir, filename)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                name = hashed_name(filename, f.read())
+            self.urls[filename] = name
+            self.sources[name] = filename
+        app.add_template_global(self.url, "asset_url")
+        app.register_blueprint(assets_blueprint)
+        app.extensions["assets"] = self
+
+    def url(self, filename):
+        """The fingerprinted URL of a static file, or its plain /static URL if it isn't fingerprinted."""
+        name = self.urls.get(filename)
+        if name is None:
+            return url_for("static", filename=filename)
+        return url_for("assets.asset", filename=name)
+
+    def precompressed(self, name):
+        """(path, encoding) of the best built variant the client accepts, or (None, None)."""
+        for encoding, suffix in ENCODINGS:
+            if encoding in request.accept_encodings:
+                path = os.path.join(self.static_dir, "dist", name + suffix)
+                if os.path.exists(path):
+                    return path, encoding
+        return None, None
+
+
+assets_blueprint = Blueprint("assets", __name__)
+
+@assets_blueprint.route("/assets/<filename>")
+def asset(filename):
+    assets = current_app.extensions["assets"]
+    source = assets.sources.get(filename)
+    if source is None:
+        # Unknown or outdated hash
+        abort(404)
+    path, encoding = assets.precompressed(filename)
+    mimetype = mimetypes.guess_type(source)[0]
+    if path is None:
+        response = send_file(os.path.join(assets.static_dir, source), mimetype=mimetype, conditional=True)
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True)
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Cache-Control"] = IMMUTABLE
+    response.vary.add("Accept-Encoding")
+    return response
@@ -0,0 +1,99 @@
+# Async access to the find_places Lambda, for the ASGI entry point (asgi.py).
+#
+# It wraps the app's LambdaClient and shares its search cache, on_search hook,
+# concurrency slots, timeouts and stats, so a search cached by either path is
+# a hit on both and the process stays within one budget of calls in flight.
+# Waiting on API Gateway here costs an event-loop task, not a thread.
+import asyncio
+import time
+
+from .client import LambdaError, normalize_address
+
+# How often a search waiting out LAMBDA_QUEUE_TIMEOUT checks for a free slot
+SLOT_POLL_SECONDS = 0.01
+
+
+class AsyncLambdaClient:
+    """httpx-based, single-flight find_places with the same limits as `shared`."""
+
+    def __init__(self, shared):
+        self.shared = shared
+        self._client = None
+        self._inflight = {}
+
+    @property
+    def client(self):
+        # Created on first use, inside the worker's running event loop
+        if self._client is None:
+            import httpx
+
+            size = self.shared._pool_size
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+                # No httpx deadline (5 s by default): _post's wait_for applies LAMBDA_TIMEOUT
+                timeout=None,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _acquire(self, upstream):
+        """Takes one of the shared client's slots without blocking the event loop."""
+        slot = self.shared._slots[upstream]
+        give_up = time.monotonic() + self.shared.queue_timeout
+        while not slot.acquire(blocking=False):
+            if time.monotonic() >= give_up:
+                raise self.shared._busy(upstream)
+            await asyncio.sleep(SLOT_POLL_SECONDS)
+        return slot
+
+    async def _post(self, upstream, url, payload, headers=None):
+        import httpx
+
+        deadline = self.shared.timeout
+        slot = await self._acquire(upstream)
+        self.shared._count("upstream_calls")
+        try:
+            resp = await asyncio.wait_for(self.client.post(url, json=payload, headers=headers), deadline)
+            resp.raise_for_status()
+            return resp.json()
+        except asyncio.TimeoutError:
+            raise LambdaError(f"{upstream} call exceeded its {deadline}s deadline") from None
+        except (httpx.HTTPError, ValueError) as e:
+            # ValueError: a 200 whose body isn't JSON
+            raise LambdaError(str(e)) from e
+        finally:
+            slot.release()
+
+    async def find_places(self, address):
+        key = normalize_address(address)
+        cached = self.shared.search_cache.get(key)
+        if cached is not None:
+            return cached
+
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.shared._count("coalesced")
+            # shield: a cancelled waiter mustn't cancel the leader's call
+            return await asyncio.shield(flight)
+
+        flight = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._post("find", f"{self.shared.find_url}find_places", {"reference": address})
+            self.shared.search_cache.set(key, result)
+            flight.set_result(result)
+        except BaseException as e:
+            # Waiters see a cancelled leader as a failed search, not as their own cancellation
+            flight.set_exception(e if isinstance(e, Exception) else LambdaError("search was cancelled"))
+            # Marks the error as retrieved when nobody was waiting on it
+            flight.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        if self.shared.on_search is not None:
+            # Runs database writes; to_thread keeps the caller's app context
+            await asyncio.to_thread(self.shared.searched, result)
+        return result
@@ -0,0 +1,201 @@
+# Client for the places Lambdas behind API Gateway
+#
+# Each upstream (find, review) has one concurrency limit per process, shared
+# by the WSGI routes and the ASGI entry point (async_client.py). A call waits
+# at most LAMBDA_QUEUE_TIMEOUT for a free slot (by default not at all) and
+# then LAMBDA_TIMEOUT for the Lambda itself. A slow Lambda can then hold at
+# most `limit` server threads or tasks; requests beyond that fail fast with
+# LambdaBusy instead of queueing.
+import logging
+import threading
+
+from .cache import TTLCache
+
+UPSTREAMS = ("find", "review")
+
+logger = logging.getLogger(__name__)
+
+
+class LambdaError(Exception):
+    """A Lambda call failed to connect, timed out or returned an HTTP error."""
+
+
+class LambdaBusy(LambdaError):
+    """The upstream's concurrency limit stayed full for the queue timeout."""
+
+
+def normalize_address(address):
+    """Cache key for a search: case and whitespace differences don't change the result."""
+    return " ".join(address.lower().split())
+
+
+class _Flight:
+    """An upstream call in progress that identical requests can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LambdaClient:
+    """Pooled, cached access to the find_places and submit_review Lambdas.
+
+    Searches are cached by normalized address, and concurrent identical
+    searches share a single upstream call (single-flight).
+    """
+
+    def __init__(self, find_url=None, review_url=None, timeout=10,
+                 cache_size=512, cache_ttl=300, pool_size=10, limits=None, queue_timeout=0):
+        self.find_url = find_url
+        self.review_url = review_url
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.search_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.rejected = 0
+        self.set_limits(dict(dict.fromkeys(UPSTREAMS, pool_size), **(limits or {})))
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._pool_size = pool_size
+        self._session = None
+        # Called with each result fetched from upstream (not with cache hits)
+        self.on_search = None
+
+    @property
+    def session(self):
+        # Built on first use: importing requests costs cold starts that never call a Lambda
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._new_session()
+        return self._session
+
+    def _new_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # Keep-alive connections are reused across requests instead of a new
+        # TLS handshake to API Gateway per search
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self._pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def init_app(self, app):
+        self.find_url = app.config.get("LAMBDA_API_URL_FIND")
+        self.review_url = app.config.get("LAMBDA_API_URL_REVIEW")
+        self.timeout = app.config.get("LAMBDA_TIMEOUT", 10)
+        self.queue_timeout = app.config.get("LAMBDA_QUEUE_TIMEOUT", 0)
+        self._pool_size = app.config.get("LAMBDA_POOL_SIZE", 10)
+        self._session = None
+        self.set_limits({
+            "find": app.config.get("LAMBDA_FIND_CONCURRENCY", 8),
+            "review": app.config.get("LAMBDA_REVIEW_CONCURRENCY", 4),
+        })
+        self.search_cache.configure(
+            maxsize=app.config.get("PLACES_CACHE_SIZE", 512),
+            ttl=app.config.get("PLACES_CACHE_TTL", 300),
+        )
+
+    def set_limits(self, limits):
+        """Calls allowed in flight per upstream; only call while none are."""
+        self.limits = dict(limits)
+        self._slots = {name: threading.BoundedSemaphore(n) for name, n in self.limits.items()}
+
+    def _count(self, stat):
+        with self._lock:
+            setattr(self, stat, getattr(self, stat) + 1)
+
+    def _busy(self, upstream):
+        self._count("rejected")
+        return LambdaBusy(f"{self.limits[upstream]} {upstream} calls already in flight")
+
+    def _post(self, upstream, url, payload, headers=None):
+        slot = self._slots[upstream]
+        if self.queue_timeout > 0:
+            acquired = slot.acquire(timeout=self.queue_timeout)
+        else:
+            acquired = slot.acquire(blocking=False)
+        if not acquired:
+            raise self._busy(upstream)
+        self._count("upstream_calls")
+        from requests import RequestException
+
+        try:
+            # requests applies the timeout to connect and to each read, which
+            # for a small JSON response is the whole call
+            resp = self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+            resp.raise_for_status()  # raise exception for HTTP errors
+            return resp.json()
+        except (RequestException, ValueError) as e:
+            # ValueError: a 200 whose body isn't JSON
+            raise LambdaError(str(e)) from e
+        finally:
+            slot.release()
+
+    def find_places(self, address):
+        key = normalize_address(address)
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._post("find", f"{self.find_url}find_places", {"reference": address})
+            self.search_cache.set(key, flight.result)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+        self.searched(flight.result)
+        return flight.result
+
+    def searched(self, result):
+        """Passes an upstream result to on_search; a failing hook doesn't fail the search."""
+        if self.on_search is None:
+            return
+        try:
+            self.on_search(result)
+        except Exception:
+            logger.exception("on_search hook failed")
+
+    def submit_review(self, review_data, idempotency_key=None):
+        # The key lets the Lambda drop a review it already stored on a retry
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        return self._post("review", f"{self.review_url}submit_review", review_data, headers=headers)
+
+    def stats(self):
+        return {
+            "hits": self.search_cache.hits,
+            "misses": self.search_cache.misses,
+            "coalesced": self.coalesced,
+            "upstream_calls": self.upstream_calls,
+            "rejected": self.rejected,
+            "cached_searches": len(self.search_cache),
+        }
+
+    def reset_stats(self):
+        self.search_cache.clear()
+        with self._lock:
+            self.coalesced = 0
+            self.upstream_calls = 0
+            self.rejected = 0
@@ -0,0 +1,154 @@
+# Maintenance commands, run with `FLASK_APP=flask_app.run flask <command>`
+import click
+from flask import Blueprint
+from pymongo import UpdateOne
+from .logs import storage
+from .models import User, Insight, Log, LogBucket, Place, Problem, Treatment, TreatmentOutcome
+from .reviews import outbox
+
+commands = Blueprint("commands", __name__, cli_group=None)
+
+LEGACY_USER_ARRAYS = ["logs", "problems", "insights"]
+HAS_LEGACY_ARRAYS = {"$or": [{field: {"$exists": True}} for field in LEGACY_USER_ARRAYS]}
+
+
+def migrate_user_refs():
+    """Drops the denormalized reference arrays from every User document."""
+    result = User._get_collection().update_many(
+        HAS_LEGACY_ARRAYS,
+        {"$unset": {field: "" for field in LEGACY_USER_ARRAYS}},
+    )
+    return result.modified_count
+
+
+@commands.cli.command("migrate-user-refs")
+@click.option("--dry-run", is_flag=True, help="Only count the users that still carry the arrays.")
+def migrate_user_refs_command(dry_run):
+    """Remove User.logs/problems/insights; data is read through each document's `user` field."""
+    if dry_run:
+        count = User._get_collection().count_documents(HAS_LEGACY_ARRAYS)
+        click.echo(f"{count} user(s) still carry legacy reference arrays.")
+        return
+    click.echo(f"Migrated {migrate_user_refs()} user(s).")
+
+
+def duplicate_problems():
+    """(kept _id, [duplicate _ids]) for every (user, name) stored more than once, oldest kept."""
+    # Read without Problem._get_collection(), which would try to build the
+    # unique (user, name) index that these duplicates make fail
+    collection = Problem._get_db()[Problem._get_collection_name()]
+    groups = collection.aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": {"user": "$user", "name": "$name"}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ])
+    return [(group["ids"][0], group["ids"][1:]) for group in groups]
+
+
+def dedupe_problems():
+    """Merges duplicate Problems into the oldest of each (user, name).
+
+    Insights, treatments and logs (in either storage layout) that point at a
+    duplicate are repointed first. Returns the number of problems removed.
+    """
+    collection = Problem._get_db()[Problem._get_collection_name()]
+    removed = 0
+    for keep, duplicates in duplicate_problems():
+        for document_cls in (Insight, Treatment, Log):
+            document_cls._get_collection().update_many(
+                {"problem": {"$in": duplicates}}, {"$set": {"problem": keep}}
+            )
+        for duplicate in duplicates:
+            # entries.$ updates one matching entry per bucket at a time
+            while LogBucket._get_collection().update_many(
+                {"entries.p": duplicate}, {"$set": {"entries.$.p": keep}}
+            ).modified_count:
+                pass
+        removed += collection.delete_many({"_id": {"$in": duplicates}}).deleted_count
+    Problem.ensure_indexes()
+    return removed
+
+
+@commands.cli.command("dedupe-problems")
+@click.option("--dry-run", is_flag=True, help="Only count the duplicate problems.")
+def dedupe_problems_command(dry_run):
+    """Merge duplicate (user, name) problems; run before deploying the unique Problem index."""
+    if dry_run:
+        count = sum(len(duplicates) for _, duplicates in duplicate_problems())
+        click.echo(f"{count} duplicate problem(s).")
+        return
+    click.echo(f"Removed {dedupe_problems()} duplicate problem(s).")
+
+
+def migrate_treatment_logs():
+    """Copies every "Treatment" Log into the Treatment collection.
+
+    Each Treatment keeps its Log's _id, so running this again only inserts
+    logs added since. Returns the number of treatments inserted.
+    """
+    updates = [
+        UpdateOne({"_id": log["_id"]}, {"$setOnInsert": {
+            "user": log["user"],
+            "name": log.get("treatment_name") or "Treatment",
+            "details": log.get("description"),
+            "start_date": log["start_date"],
+            "end_date": log["end_date"],
+            "problem": log.get("problem"),
+        }}, upsert=True)
+        for log in storage.log_store().find(
+            None, fields=("user", *storage.LOG_FIELDS), match={"type": "Treatment"}
+        )
+    ]
+    if not updates:
+        return 0
+    return Treatment._get_collection().bulk_write(updates, ordered=False).upserted_count
+
+
+@commands.cli.command("migrate-treatment-logs")
+def migrate_treatment_logs_command():
+    """Copy calendar "Treatment" logs into the Treatment model behind /treatments."""
+    click.echo(f"Migrated {migrate_treatment_logs()} treatment(s).")
+
+
+@commands.cli.command("flush-reviews")
+@click.option("--batch-size", default=outbox.BATCH_SIZE, show_default=True)
+def flush_reviews_command(batch_size):
+    """Deliver pending reviews to the review Lambda; use from cron where no worker thread runs."""
+    click.echo(f"Processed {outbox.flush_all(batch_size)} review(s).")
+
+
+@commands.cli.command("rebuild-treatment-outcomes")
+def rebuild_treatment_outcomes_command():
+    """Recompute the community treatment-outcome counters from every Insight."""
+    click.echo(f"Rebuilt {TreatmentOutcome.rebuild()} problem/treatment pair(s).")
+
+
+@commands.cli.command("build-assets")
+def build_assets_command():
+    """Regenerate static/constants.js and precompress the fingerprinted static files."""
+    from flask import current_app
+    from .assets import build, brotli
+
+    for path in build(current_app.static_folder):
+        click.echo(f"Wrote static/{path}")
+    if brotli is None:
+        click.echo("brotli is not installed; skipped the .br variants.")
+
+
+@commands.cli.command("rebuild-place-ratings")
+def rebuild_place_ratings_command():
+    """Recompute every place's review count, rating sum and histogram from Review."""
+    click.echo(f"Rebuilt ratings for {Place.rebuild_ratings()} place(s).")
+
+
+@commands.cli.command("migrate-log-storage")
+@click.argument("layout", type=click.Choice(sorted(storage.STORES)))
+@click.option("--delete-source", is_flag=True, help="Remove what was copied from the old layout.")
+def migrate_log_storage_command(layout, delete_source):
+    """Copy every log into LAYOUT ("buckets" or "documents"); then set LOG_STORAGE to match."""
+    if layout == "buckets":
+        logs, buckets = storage.migrate_to_buckets(delete_source)
+        click.echo(f"Packed {logs} log(s) into {buckets} bucket(s).")
+    else:
+        logs, buckets = storage.migrate_to_documents(delete_source)
+        click.echo(f"Unpacked {logs} log(s) from {buckets} bucket(s).")
@@ -0,0 +1,60 @@
+# Conditional GET support for per-user data responses.
+#
+# Every write to a user's logs or problems bumps User.data_version; responses
+# that only depend on that data carry an ETag built from it, so a client
+# revalidating with If-None-Match gets a 304 after one _id lookup on User.
+import zlib
+from datetime import datetime
+from functools import wraps
+
+from flask import request, make_response
+from flask_login import current_user
+
+from .models import User
+
+
+def bump_data_version(user):
+    """Marks the user's calendar/profile data as changed."""
+    User.objects(id=user.id).update_one(inc__data_version=1, set__data_updated_at=datetime.utcnow())
+
+
+def data_version(user):
+    """Returns (version, updated_at) for the user without loading the document."""
+    row = User.objects(id=user.id).only("data_version", "data_updated_at").as_pymongo().first() or {}
+    return row.get("data_version", 0), row.get("data_updated_at")
+
+
+def make_etag(user, version):
+    # Different query strings (range, show_treatments) are different representations
+    variant = zlib.crc32(request.query_string)
+    return f"{user.id}-{version}-{variant:x}"
+
+
+def not_modified(etag, updated_at):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and updated_at:
+        return updated_at <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def conditional_on_user_data(view):
+    """Serves ETag/Last-Modified for a view and answers matching revalidations with 304."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version, updated_at = data_version(current_user)
+        etag = make_etag(current_user, version)
+        if not_modified(etag, updated_at):
+            response = make_response("", 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag, weak=True)
+        if updated_at:
+            response.last_modified = updated_at
+        # The browser may keep a copy but must revalidate it before every use
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
@@ -5,8 +5,73 @@ import os
 
 SECRET_KEY = os.environ.get('SECRET_KEY')
 MONGODB_HOST = os.environ.get('MONGODB_HOST')
+# Serverless instances and forked workers each hold their own pool, so keep
+# pools small and let idle connections close instead of pinning server slots
+MONGODB_SETTINGS = {
+    'maxPoolSize': int(os.environ.get('MONGODB_MAX_POOL_SIZE', 10)),
+    'minPoolSize': int(os.environ.get('MONGODB_MIN_POOL_SIZE', 0)),
+    'maxIdleTimeMS': int(os.environ.get('MONGODB_MAX_IDLE_TIME_MS', 60000)),
+    'serverSelectionTimeoutMS': int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+    'connectTimeoutMS': int(os.environ.get('MONGODB_CONNECT_TIMEOUT_MS', 5000)),
+    # Don't open sockets before a pre-forking server forks its workers
+    'connect': False,
+}
+if MONGODB_HOST:
+    MONGODB_SETTINGS['host'] = MONGODB_HOST
+# Ping MongoDB in create_app so the first request doesn't pay for server selection
+MONGODB_WARMUP = os.environ.get('MONGODB_WARMUP', 'false').lower() == 'true'
 
 GOOGLE_FORM_LINK = os.environ.get('GOOGLE_FORM_LINK')
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
 
+LAMBDA_API_URL_FIND = os.environ.get('LAMBDA_API_URL_FIND')
+LAMBDA_API_URL_REVIEW = os.environ.get('LAMBDA_API_URL_REVIEW')
+# Deadline for a Lambda call once it has a slot
+LAMBDA_TIMEOUT = float(os.environ.get('LAMBDA_TIMEOUT', 10))
+# How long a call may wait for a free slot; 0 fails at once with a 503
+LAMBDA_QUEUE_TIMEOUT = float(os.environ.get('LAMBDA_QUEUE_TIMEOUT', 0))
+LAMBDA_POOL_SIZE = int(os.environ.get('LAMBDA_POOL_SIZE', 10))
+# Calls in flight per upstream and process, shared by the WSGI and ASGI paths
+LAMBDA_FIND_CONCURRENCY = int(os.environ.get('LAMBDA_FIND_CONCURRENCY', 8))
+LAMBDA_REVIEW_CONCURRENCY = int(os.environ.get('LAMBDA_REVIEW_CONCURRENCY', 4))
+# Threads that run the Flask app under the ASGI entry point (flask_app/asgi.py)
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 10))
+# Place searches cached by normalized address
+PLACES_CACHE_TTL = int(os.environ.get('PLACES_CACHE_TTL', 300))
+PLACES_CACHE_SIZE = int(os.environ.get('PLACES_CACHE_SIZE', 512))
+# Places from Lambda results are kept in MongoDB; /places/nearby asks the
+# Lambda again once the stored ones in an area are older than this
+PLACES_FRESH_TTL = int(os.environ.get('PLACES_FRESH_TTL', 7 * 24 * 3600))
+# Reviews are delivered by a background thread; turn it off on serverless
+# hosts and run `flask flush-reviews` on a schedule instead
+REVIEW_OUTBOX_WORKER = os.environ.get('REVIEW_OUTBOX_WORKER', 'true').lower() == 'true'
+REVIEW_OUTBOX_INTERVAL = float(os.environ.get('REVIEW_OUTBOX_INTERVAL', 5))
 
+# Per-process cache of logged-in user stubs; 0 seconds disables it
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 0))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+
+# Request/query metrics served at /metrics; requests slower than this are logged
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+
+# JSON responses and request bodies use orjson when it is installed
+JSON_USE_ORJSON = os.environ.get('JSON_USE_ORJSON', 'true').lower() == 'true'
+
+# Large JSON lists (e.g. /logs/data) are streamed from the Mongo cursor in
+# batches of LOGS_BATCH_SIZE instead of being built in memory first
+STREAM_JSON = os.environ.get('STREAM_JSON', 'true').lower() == 'true'
+LOGS_BATCH_SIZE = int(os.environ.get('LOGS_BATCH_SIZE', 1000))
+# Log layout: "documents" (one per log) or "buckets" (one per user and month,
+# see logs/storage.py); move data with `flask migrate-log-storage` first
+LOG_STORAGE = os.environ.get('LOG_STORAGE', 'documents')
+
+# Anonymous page and fragment cache: "memory" (per process), "file" (shared by
+# the host's workers, under PAGE_CACHE_DIR or /dev/shm) or "none"
+PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 60))
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 256))
+PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR')
+# Compiled templates are kept on disk (JINJA_BYTECODE_CACHE_DIR or a temp dir)
+JINJA_BYTECODE_CACHE = os.environ.get('JINJA_BYTECODE_CACHE', 'true').lower() == 'true'
+JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
@@ -122,4 +122,20 @@ INSIGHT_STATUSES = [
     "IMPROVED",
     "WORSENED",
     "NO_CHANGE"
-]
\ No newline at end of file
+]
+
+
+REVIEW_STATUSES = [
+    "PENDING",   # waiting to be sent to the review Lambda
+    "SENDING",   # claimed by an outbox worker
+    "SENT",
+    "FAILED",    # gave up after the maximum number of attempts
+]
+
+
+# Period logs that start within this many days of the previous one ending are
+# treated as the same bleed (e.g. one log per day of a period)
+SAME_PERIOD_GAP_DAYS = 3
+# Ignore gaps that are clearly missing data or double entries
+MIN_CYCLE_DAYS = 10
+MAX_CYCLE_DAYS = 180
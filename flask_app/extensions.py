@@ -1,7 +1,19 @@
 from flask_mongoengine import MongoEngine
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
+from .cache import TTLCache
+from .client import LambdaClient
+from .serialization import JSONProvider
+from .assets import Assets
+from .pages import PageCache
 
 db = MongoEngine()
 login_manager = LoginManager()
 bcrypt = Bcrypt()
+# Projected User stubs for the Flask-Login loader, keyed by username.
+# Disabled until create_app() applies USER_CACHE_TTL.
+user_cache = TTLCache(ttl=0)
+lambda_client = LambdaClient()
+json_provider = JSONProvider()
+assets = Assets()
+page_cache = PageCache()
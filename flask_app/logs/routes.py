@@ -1,9 +1,15 @@
 # logs.py routes
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, current_app, render_template, request
 from flask_login import login_required, current_user
 from ..models import Log
 from datetime import datetime
 from ..forms import CalendarCreateForm
+from ..conditional import bump_data_version, conditional_on_user_data
+from ..serialization import jsonify, request_json
+from ..streaming import stream_json_array
+from .stats import cycle_stats, monthly_counts
+from .storage import LOG_FIELDS, log_store
+from ..treatments.calendar import forget_log, treatment_from_log
 
 logs = Blueprint("logs", __name__)
 
@@ -13,58 +19,123 @@ def logs_page():
     form = CalendarCreateForm()
     return render_template("logs.html", form=form)
 
+def parse_range_date(value):
+    """Parses a calendar range bound, dropping any UTC offset FullCalendar attaches."""
+    if not value:
+        return None
+    # fromisoformat() on older Pythons does not accept a trailing "Z"
+    if value.endswith("Z"):
+        value = value[:-1]
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+def logs_in_range(user, start=None, end=None, fields=LOG_FIELDS, match=None):
+    """Raw rows of the user's logs overlapping [start, end), from the (user, start_date, end_date)
+    index or, with bucket storage, from the (user, month) one."""
+    return log_store().find(
+        user, start, end, fields=fields, match=match,
+        batch_size=current_app.config.get("LOGS_BATCH_SIZE", 1000),
+    )
+
+
+def record_period_change(user, old=None, new=None):
+    """Patches the cached cycle history; numpy stays off the cold-start path until a period changes."""
+    from ..prediction.engine import record_period_change
+    record_period_change(user, old=old, new=new)
+
+
+def period_range(log):
+    """The (start, end) of a Period log as tracked by the prediction cache, else None."""
+    return (log.start_date, log.end_date) if log.type == "Period" else None
+
+
+def log_event(log, show_treatments):
+    """The calendar event for a raw Log document."""
+    log_type = log.get("type")
+    description = log.get("description")
+    treatment_name = log.get("treatment_name")
+    # Determine the title based on the toggle state
+    if show_treatments:
+        # 1. TOGGLE ON: Show detailed titles (including treatment name and description)
+        if log_type != "Treatment":
+            # For non-treatment logs, show Type + Description (as title)
+            title = log_type + ": " + description if description else log_type
+        else:
+            # For treatment logs, prioritize Treatment Name + Description
+            title = treatment_name + ": " + description if description else treatment_name
+
+    else:
+        # 2. TOGGLE OFF: Show concise titles (prioritizing the log type)
+        if log_type != "Treatment":
+            # For non-treatment logs, prioritize the Type (e.g., "Period")
+            title = log_type
+        else:
+            # For treatment logs, show "Treatment" (Type) + Treatment Name
+            title = log_type + ": " + treatment_name
+
+    return {
+        "id": log["_id"],
+        "title": title,
+        "start": log["start_date"],
+        "end": log["end_date"],
+        "allDay": True,
+        "extendedProps": {
+            "type": log_type,
+            "description": description,
+            "treatment_name": treatment_name
+        }
+    }
+
+
 @logs.route("/logs/data")
 @login_required
+@conditional_on_user_data
 def logs_data():
-    user_logs = Log.objects(user=current_user)
-    events = []
-    
+    # The calendar sends the visible range, so only fetch logs overlapping it
+    try:
+        start = parse_range_date(request.args.get('start'))
+        end = parse_range_date(request.args.get('end'))
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid start or end date"}), 400
+
+    user_logs = logs_in_range(
+        current_user, start, end,
+        fields=('type', 'description', 'treatment_name', 'start_date', 'end_date'),
+    )
+
     # Check if the request wants treatment names or log types
     # show_treatments is TRUE when the toggle is ON (showing detail)
     show_treatments = request.args.get('show_treatments', 'false').lower() == 'true'
-    
-    for log in user_logs:
-        # Determine the title based on the toggle state
-        if show_treatments:
-            # 1. TOGGLE ON: Show detailed titles (including treatment name and description)
-            if log.type != "Treatment":
-                # For non-treatment logs, show Type + Description (as title)
-                title = log.type + ": " + log.description if log.description else log.type
-            else:
-                # For treatment logs, prioritize Treatment Name + Description
-                title = log.treatment_name + ": " + log.description if log.description else log.treatment_name
-        
-        else:
-            # 2. TOGGLE OFF: Show concise titles (prioritizing the log type)
-            if log.type != "Treatment":
-                # For non-treatment logs, prioritize the Type (e.g., "Period")
-                title = log.type
-            else:
-                # For treatment logs, show "Treatment" (Type) + Treatment Name
-                title = log.type + ": " + log.treatment_name
-                
-        
-        events.append({
-            "id": str(log.id),
-            "title": title,
-            "start": log.start_date.isoformat(),
-            "end": log.end_date.isoformat(),
-            "allDay": True,
-            "extendedProps": {
-                "type": log.type,
-                "description": log.description,
-                "treatment_name": log.treatment_name
-            }
-        })
-    return jsonify(events)
 
+    events = (log_event(log, show_treatments) for log in user_logs)
+    if current_app.config.get("STREAM_JSON", True):
+        # Serialized batch by batch as the cursor is read; never the whole list at once
+        return stream_json_array(events)
+    return jsonify(list(events))
+
+
+
+@logs.route("/logs/stats")
+@login_required
+@conditional_on_user_data
+def logs_stats():
+    """Cycle length, period duration and monthly log counts, aggregated in Mongo."""
+    try:
+        start = parse_range_date(request.args.get('start'))
+        end = parse_range_date(request.args.get('end'))
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid start or end date"}), 400
+
+    stats = cycle_stats(current_user, start, end)
+    stats["monthly_counts"] = monthly_counts(current_user, start, end)
+    return jsonify(stats)
 
 
 @logs.route("/logs", methods=["POST"])
 @login_required
 def create_log():
     try:
-        data = request.get_json()
+        data = request_json()
         print("Incoming data:", data)
 
         # Parse dates
@@ -78,9 +149,12 @@ def create_log():
                 start_date=start_date,
                 end_date=end_date
             )
-        log.save()
-        current_user.logs.append(log)
-        current_user.save()
+        log_store().save(log)
+        if log.type == "Treatment":
+            treatment_from_log(current_user, log)
+        bump_data_version(current_user)
+        if log.type == "Period":
+            record_period_change(current_user, new=period_range(log))
         return jsonify({"success": True, "id": str(log.id)})
     except Exception as e:
         import traceback
@@ -91,10 +165,12 @@ def create_log():
 @login_required
 def update_log(log_id):
     try:
-        data = request.get_json()
-        log = Log.objects(id=log_id, user=current_user).first()
+        data = request_json()
+        log = log_store().get(current_user, log_id)
         if not log:
             return jsonify({"success": False, "error": "Log not found"}), 404
+        old_period = period_range(log)
+        was_treatment = log.type == "Treatment"
         
         # Parse dates if provided
         if data.get("start_date"):
@@ -110,7 +186,13 @@ def update_log(log_id):
         if "treatment_name" in data:
             log.treatment_name = data.get("treatment_name")
         
-        log.save()
+        log_store().save(log)
+        if was_treatment or log.type == "Treatment":
+            treatment_from_log(current_user, log)
+        bump_data_version(current_user)
+        new_period = period_range(log)
+        if old_period != new_period:
+            record_period_change(current_user, old=old_period, new=new_period)
         return jsonify({"success": True})
     except Exception as e:
         import traceback
@@ -121,12 +203,15 @@ def update_log(log_id):
 @login_required
 def delete_log(log_id):
     try:
-        log = Log.objects(id=log_id, user=current_user).first()
+        log = log_store().get(current_user, log_id)
         if not log:
             return jsonify({"success": False, "error": "Log not found"}), 404
-        log.delete()
-        # Remove from user's logs list
-        current_user.update(pull__logs=log)
+        log_store().delete(log)
+        if log.type == "Treatment":
+            forget_log(current_user, log)
+        bump_data_version(current_user)
+        if log.type == "Period":
+            record_period_change(current_user, old=period_range(log))
         return jsonify({"success": True})
     except Exception as e:
         import traceback
@@ -0,0 +1,154 @@
+# Cycle and log statistics computed by MongoDB aggregation pipelines.
+#
+# Everything is reduced server-side; Flask only receives the summary
+# documents, never the Log documents themselves. The cycle pipeline needs
+# $setWindowFields (MongoDB 5.0+). With bucket storage the pipelines run on
+# the unpacked entries of the buckets covering the range (see storage.py).
+from ..constants import SAME_PERIOD_GAP_DAYS, MIN_CYCLE_DAYS, MAX_CYCLE_DAYS
+from .storage import log_store
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+# Period duration histogram edges in days; the last bucket is open-ended
+DURATION_BUCKETS = [0, 3, 5, 7, 10]
+
+
+def _days(later, earlier):
+    return {"$divide": [{"$subtract": [later, earlier]}, MS_PER_DAY]}
+
+
+def _median(values):
+    """Median of an already sorted array field."""
+    n = {"$size": values}
+    lower = {"$arrayElemAt": [values, {"$toInt": {"$floor": {"$divide": [{"$subtract": [n, 1]}, 2]}}}]}
+    upper = {"$arrayElemAt": [values, {"$toInt": {"$floor": {"$divide": [n, 2]}}}]}
+    return {"$divide": [{"$add": [lower, upper]}, 2]}
+
+
+def _summary(field):
+    """Stages reducing `field` to count, average, median and variance."""
+    return [
+        {"$sort": {field: 1}},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "average": {"$avg": f"${field}"},
+            "std": {"$stdDevSamp": f"${field}"},
+            "values": {"$push": f"${field}"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "count": 1,
+            "average": 1,
+            "median": _median("$values"),
+            "variance": {"$pow": ["$std", 2]},
+        }},
+    ]
+
+
+def _range_match(start=None, end=None):
+    match = {}
+    if end:
+        match["start_date"] = {"$lt": end}
+    if start:
+        match["end_date"] = {"$gte": start}
+    return match
+
+
+def cycle_pipeline(start=None, end=None):
+    """Merges Period logs into periods, then summarizes cycle lengths and durations.
+
+    Mirrors prediction.engine.CycleHistory: logs starting within
+    SAME_PERIOD_GAP_DAYS of the previous end belong to the same period.
+    """
+    return [
+        {"$match": {"type": "Period", **_range_match(start, end)}},
+        {"$setWindowFields": {
+            "sortBy": {"start_date": 1},
+            "output": {
+                "previous_end": {"$max": "$end_date", "window": {"documents": ["unbounded", -1]}},
+                "latest_end": {"$max": "$end_date", "window": {"documents": ["unbounded", "unbounded"]}},
+            },
+        }},
+        # Keep only the first log of each period
+        {"$match": {"$expr": {"$or": [
+            {"$eq": [{"$ifNull": ["$previous_end", None]}, None]},
+            {"$gt": [{"$subtract": ["$start_date", "$previous_end"]}, SAME_PERIOD_GAP_DAYS * MS_PER_DAY]},
+        ]}}},
+        {"$setWindowFields": {
+            "sortBy": {"start_date": 1},
+            "output": {
+                "previous_start": {"$shift": {"output": "$start_date", "by": -1}},
+                # Everything before the next period's start ended with this period
+                "next_previous_end": {"$shift": {"output": "$previous_end", "by": 1}},
+            },
+        }},
+        {"$project": {
+            "_id": 0,
+            "cycle_length": {"$cond": [
+                {"$eq": [{"$ifNull": ["$previous_start", None]}, None]},
+                None,
+                _days("$start_date", "$previous_start"),
+            ]},
+            "duration": _days({"$ifNull": ["$next_previous_end", "$latest_end"]}, "$start_date"),
+        }},
+        {"$facet": {
+            "cycle_length": [
+                {"$match": {"cycle_length": {"$gte": MIN_CYCLE_DAYS, "$lte": MAX_CYCLE_DAYS}}},
+                *_summary("cycle_length"),
+            ],
+            "period_duration": _summary("duration"),
+            "duration_histogram": [
+                {"$bucket": {
+                    "groupBy": "$duration",
+                    "boundaries": DURATION_BUCKETS,
+                    "default": f"{DURATION_BUCKETS[-1]}+",
+                    "output": {"count": {"$sum": 1}},
+                }},
+            ],
+        }},
+    ]
+
+
+def monthly_counts_pipeline(start=None, end=None):
+    """Log counts per month by type, plus logs tied to a symptom (Problem)."""
+    return [
+        {"$match": _range_match(start, end)},
+        {"$group": {
+            "_id": {
+                "month": {"$dateToString": {"format": "%Y-%m", "date": "$start_date"}},
+                "type": "$type",
+            },
+            "count": {"$sum": 1},
+            "symptoms": {"$sum": {"$cond": [{"$ifNull": ["$problem", False]}, 1, 0]}},
+        }},
+        {"$group": {
+            "_id": "$_id.month",
+            "by_type": {"$push": {"k": "$_id.type", "v": "$count"}},
+            "symptoms": {"$sum": "$symptoms"},
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {
+            "_id": 0,
+            "month": "$_id",
+            "by_type": {"$arrayToObject": "$by_type"},
+            "symptoms": 1,
+        }},
+    ]
+
+
+def _empty_summary():
+    return {"count": 0, "average": None, "median": None, "variance": None}
+
+
+def cycle_stats(user, start=None, end=None):
+    result = next(log_store().aggregate(user, cycle_pipeline(start, end), start, end), {})
+    histogram = {str(row["_id"]): row["count"] for row in result.get("duration_histogram", [])}
+    return {
+        "cycle_length": (result.get("cycle_length") or [_empty_summary()])[0],
+        "period_duration": (result.get("period_duration") or [_empty_summary()])[0],
+        "period_duration_histogram": histogram,
+    }
+
+
+def monthly_counts(user, start=None, end=None):
+    return list(log_store().aggregate(user, monthly_counts_pipeline(start, end), start, end))
@@ -0,0 +1,292 @@
+# Where calendar logs live: one Log document per entry ("documents", the
+# default) or a month of a user's entries packed into one LogBucket
+# ("buckets"), chosen by LOG_STORAGE.
+#
+# A multi-year daily tracker has thousands of Log documents and as many keys
+# in the (user, start_date, end_date) index. A bucket holds every entry
+# starting in one month as compact LogEntry subdocuments, so a calendar
+# month is read from one or two documents and the (user, month) index has
+# twelve keys a year. Entries are edited in place with positional updates.
+#
+# Everything that reads or writes logs goes through log_store(). Reads return
+# raw rows with Log's field names in either layout. `flask migrate-log-storage`
+# moves data between the layouts.
+from datetime import datetime
+
+from bson import ObjectId
+from flask import current_app, has_app_context
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+from ..models import Log, LogBucket
+from ..prefetch import ref_id
+
+# Log fields, and their keys inside a bucket entry
+ENTRY_KEYS = {
+    "_id": "_id",
+    "type": "t",
+    "description": "d",
+    "treatment_name": "n",
+    "start_date": "s",
+    "end_date": "e",
+    "problem": "p",
+}
+LOG_FIELDS = tuple(name for name in ENTRY_KEYS if name != "_id")
+MIGRATE_BATCH_SIZE = 1000
+
+
+def _pk(user):
+    return getattr(user, "pk", user)
+
+
+def month_of(day):
+    return datetime(day.year, day.month, 1)
+
+
+def log_row(log):
+    """A Log's raw field values, without dereferencing its references."""
+    row = {field: log._data.get(field) for field in LOG_FIELDS}
+    row["_id"] = log.pk
+    row["problem"] = ref_id(log, "problem")
+    return row
+
+
+def entry(row):
+    """The compact bucket entry for a raw Log row."""
+    return {key: row[field] for field, key in ENTRY_KEYS.items() if row.get(field) is not None}
+
+
+def range_match(start=None, end=None):
+    """Raw filter for logs overlapping [start, end)."""
+    match = {}
+    if end:
+        match["start_date"] = {"$lt": end}
+    if start:
+        match["end_date"] = {"$gte": start}
+    return match
+
+
+class DocumentStore:
+    """One Log document per entry."""
+
+    name = "documents"
+
+    def find(self, user, start=None, end=None, fields=LOG_FIELDS, match=None, batch_size=None):
+        """Raw rows (with _id and `fields`) of the user's logs overlapping [start, end).
+
+        `user` None means every user. `match` is an extra raw filter on Log fields.
+        """
+        query = {} if user is None else {"user": _pk(user)}
+        query.update(range_match(start, end))
+        query.update(match or {})
+        cursor = Log._get_collection().find(query, {field: 1 for field in fields})
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        return cursor
+
+    def aggregate(self, user, pipeline, start=None, end=None):
+        """Runs `pipeline` over the user's logs; start/end only narrow what is read."""
+        return Log._get_collection().aggregate([{"$match": {"user": _pk(user)}}, *pipeline])
+
+    def logs(self, user, fields=LOG_FIELDS, match=None):
+        """Log documents for read-only views."""
+        return [Log._from_son(row) for row in self.find(user, fields=fields, match=match)]
+
+    def get(self, user, log_id):
+        return Log.objects(id=log_id, user=user).first()
+
+    def save(self, log):
+        log.save()
+
+    def delete(self, log):
+        log.delete()
+
+
+class BucketStore(DocumentStore):
+    """A month of each user's entries per LogBucket."""
+
+    name = "buckets"
+
+    @staticmethod
+    def bucket_match(user, start=None, end=None):
+        """Buckets that can hold logs overlapping [start, end): each entry starts
+        within its bucket's month and ends by its bucket's last_end."""
+        query = {} if user is None else {"user": _pk(user)}
+        if end:
+            query["month"] = {"$lt": end}
+        if start:
+            query["last_end"] = {"$gte": start}
+        return query
+
+    def _entries(self, user, start, end, fields=None, match=None):
+        """Pipeline unpacking matching buckets into rows shaped like Log documents."""
+        unpack = {"user": "$user", **{field: f"$entries.{key}" for field, key in ENTRY_KEYS.items()}}
+        pipeline = [
+            {"$match": self.bucket_match(user, start, end)},
+            {"$sort": {"month": 1}},
+            {"$unwind": "$entries"},
+            {"$project": unpack},
+            {"$match": {**range_match(start, end), **(match or {})}},
+        ]
+        if fields is not None:
+            # The filters above may use fields the caller doesn't want back
+            pipeline.append({"$project": {field: 1 for field in fields}})
+        return pipeline
+
+    def find(self, user, start=None, end=None, fields=LOG_FIELDS, match=None, batch_size=None):
+        kwargs = {"batchSize": batch_size} if batch_size else {}
+        return LogBucket._get_collection().aggregate(self._entries(user, start, end, fields, match), **kwargs)
+
+    def aggregate(self, user, pipeline, start=None, end=None):
+        return LogBucket._get_collection().aggregate([*self._entries(user, start, end), *pipeline])
+
+    def get(self, user, log_id):
+        log_id = ObjectId(log_id)
+        bucket = LogBucket._get_collection().find_one(
+            {"user": _pk(user), "entries._id": log_id},
+            {"user": 1, "entries": {"$elemMatch": {"_id": log_id}}},
+        )
+        if not bucket:
+            return None
+        row = {field: bucket["entries"][0].get(key) for field, key in ENTRY_KEYS.items()}
+        return Log._from_son({**row, "user": bucket["user"]})
+
+    def _push(self, user, new):
+        update = {
+            "$push": {"entries": new},
+            "$inc": {"count": 1},
+            "$max": {"last_end": new["e"]},
+        }
+        where = {"user": user, "month": month_of(new["s"])}
+        try:
+            LogBucket._get_collection().update_one(where, update, upsert=True)
+        except DuplicateKeyError:
+            # Lost a race to create the month's bucket; it exists now
+            LogBucket._get_collection().update_one(where, update)
+
+    def _pull(self, user, log_id, keep_month=None):
+        """Removes the entry from every bucket of the user except `keep_month`'s."""
+        collection = LogBucket._get_collection()
+        where = {"user": user, "entries._id": log_id}
+        if keep_month is not None:
+            where["month"] = {"$ne": keep_month}
+        pulled = collection.update_many(
+            where, {"$pull": {"entries": {"_id": log_id}}, "$inc": {"count": -1}}
+        ).modified_count
+        if pulled:
+            collection.delete_many({"user": user, "count": {"$lte": 0}})
+        return pulled
+
+    def save(self, log):
+        log.validate()
+        user = ref_id(log, "user")
+        if log.pk is None:
+            log.id = ObjectId()
+            self._push(user, entry(log_row(log)))
+            return
+        new = entry(log_row(log))
+        month = month_of(log.start_date)
+        # Positional update while the entry stays in its month's bucket
+        moved = LogBucket._get_collection().update_one(
+            {"user": user, "month": month, "entries._id": log.pk},
+            {"$set": {"entries.$": new}, "$max": {"last_end": new["e"]}},
+        ).matched_count == 0
+        if moved:
+            # Added to the new month before leaving the old one, so a failure
+            # in between leaves a duplicate rather than losing the entry
+            self._push(user, new)
+        # Also clears a copy such an interrupted move left behind
+        self._pull(user, log.pk, keep_month=month)
+
+    def delete(self, log):
+        self._pull(ref_id(log, "user"), log.pk)
+
+
+STORES = {store.name: store for store in (DocumentStore(), BucketStore())}
+
+
+def log_store(name=None):
+    """The store for `name`, or for the app's LOG_STORAGE setting."""
+    if name is None:
+        name = current_app.config.get("LOG_STORAGE", "documents") if has_app_context() else "documents"
+    try:
+        return STORES[name]
+    except KeyError:
+        raise ValueError(f"Unknown LOG_STORAGE {name!r}; use one of {', '.join(STORES)}") from None
+
+
+def _flush(collection, updates):
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def migrate_to_buckets(delete_source=False):
+    """Packs every Log document into LogBuckets; returns (logs, buckets) written.
+
+    Each month's bucket is rewritten from the Log documents, so running this
+    again is safe. Run it before switching LOG_STORAGE to "buckets": entries
+    added to a bucket since are overwritten.
+    """
+    logs = Log._get_collection()
+    buckets = LogBucket._get_collection()
+    updates, moved, written = [], [], [0, 0]
+    bucket = None
+
+    def close(bucket):
+        updates.append(ReplaceOne({"user": bucket["user"], "month": bucket["month"]}, bucket, upsert=True))
+        if len(updates) >= MIGRATE_BATCH_SIZE:
+            flush()
+
+    def flush():
+        written[1] += _flush(buckets, updates)
+        if delete_source and moved:
+            logs.delete_many({"_id": {"$in": moved}})
+        written[0] += len(moved)
+        updates.clear()
+        moved.clear()
+
+    # Served in order by the (user, start_date, end_date) index; one bucket in memory at a time
+    for row in logs.find({}, {"user": 1, **{field: 1 for field in LOG_FIELDS}}).sort([("user", 1), ("start_date", 1)]):
+        packed = entry(row)
+        month = month_of(row["start_date"])
+        if bucket is None or (bucket["user"], bucket["month"]) != (row["user"], month):
+            if bucket is not None:
+                close(bucket)
+            bucket = {"user": row["user"], "month": month, "last_end": packed["e"], "count": 0, "entries": []}
+        bucket["entries"].append(packed)
+        bucket["count"] += 1
+        bucket["last_end"] = max(bucket["last_end"], packed["e"])
+        moved.append(row["_id"])
+    if bucket is not None:
+        close(bucket)
+    flush()
+    return tuple(written)
+
+
+def migrate_to_documents(delete_source=False):
+    """Unpacks every LogBucket into Log documents; returns (logs, buckets) read.
+
+    Entries keep their _id, so running this again only rewrites the same documents.
+    """
+    logs = Log._get_collection()
+    buckets = LogBucket._get_collection()
+    updates, done, read = [], [], [0, 0]
+
+    def flush():
+        read[0] += _flush(logs, updates)
+        if delete_source and done:
+            buckets.delete_many({"_id": {"$in": done}})
+        read[1] += len(done)
+        updates.clear()
+        done.clear()
+
+    for bucket in buckets.find({}):
+        for packed in bucket.get("entries", []):
+            row = {field: packed[key] for field, key in ENTRY_KEYS.items() if key in packed}
+            updates.append(ReplaceOne({"_id": row["_id"]}, {**row, "user": bucket["user"]}, upsert=True))
+        done.append(bucket["_id"])
+        if len(updates) >= MIGRATE_BATCH_SIZE:
+            flush()
+    flush()
+    return tuple(read)
@@ -0,0 +1,156 @@
+# Per-request latency and MongoDB command instrumentation, exposed in
+# Prometheus text format at /metrics.
+import threading
+import time
+
+from flask import Blueprint, Response, current_app, g, has_app_context, request
+from pymongo import monitoring
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """A labelled Prometheus histogram (cumulative buckets, sum and count)."""
+
+    def __init__(self, name, help, buckets, label="endpoint"):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.setdefault(label_value, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def series(self, label_value):
+        with self._lock:
+            counts, total, count = self._series.get(label_value, [[0] * len(self.buckets), 0.0, 0])
+            return list(counts), total, count
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, (counts, total, count) in sorted(self._series.items()):
+                label = f'{self.label}="{label_value}"'
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{label}}} {total}")
+                lines.append(f"{self.name}_count{{{label}}} {count}")
+        return "\n".join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+request_duration = Histogram(
+    "pcos_request_duration_seconds", "Time spent handling a request.", REQUEST_BUCKETS)
+db_time = Histogram(
+    "pcos_request_db_seconds", "Total MongoDB command time per request.", DB_TIME_BUCKETS)
+db_commands = Histogram(
+    "pcos_request_db_commands", "MongoDB commands issued per request.", QUERY_COUNT_BUCKETS)
+HISTOGRAMS = (request_duration, db_time, db_commands)
+
+
+class RequestCommandListener(monitoring.CommandListener):
+    """Attributes MongoDB commands to the request running on the same thread.
+
+    pymongo runs commands synchronously on the calling thread, so the
+    current app context's `g` belongs to the request that issued them.
+    """
+
+    def started(self, event):
+        if has_app_context() and "db_stats" in g:
+            collection = event.command.get(event.command_name)
+            target = collection if isinstance(collection, str) else event.database_name
+            g.db_stats["pending"][event.request_id] = f"{event.command_name} {target}"
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        if not (has_app_context() and "db_stats" in g):
+            return
+        stats = g.db_stats
+        seconds = event.duration_micros / 1e6
+        command = stats["pending"].pop(event.request_id, event.command_name)
+        stats["count"] += 1
+        stats["seconds"] += seconds
+        if seconds > stats["slowest"][1]:
+            stats["slowest"] = (command, seconds)
+
+
+listener = RequestCommandListener()
+_listener_registered = False
+
+
+def register_listener():
+    """Registers the listener for every MongoClient created afterwards (once per process)."""
+    global _listener_registered
+    if not _listener_registered:
+        monitoring.register(listener)
+        _listener_registered = True
+
+
+def start_request():
+    g.request_started = time.perf_counter()
+    g.db_stats = {"count": 0, "seconds": 0.0, "slowest": (None, 0.0), "pending": {}}
+
+
+def finish_request(response):
+    if "request_started" in g:
+        record(request.method, request.endpoint or "unknown")
+    return response
+
+
+def record(method, endpoint):
+    """Observes the request start_request() timed in the current app context.
+
+    Flask calls it through finish_request; asgi.py calls it for the routes it
+    serves without Flask's request hooks.
+    """
+    elapsed = time.perf_counter() - g.request_started
+    stats = g.db_stats
+    request_duration.observe(endpoint, elapsed)
+    db_time.observe(endpoint, stats["seconds"])
+    db_commands.observe(endpoint, stats["count"])
+
+    threshold = current_app.config.get("SLOW_REQUEST_MS", 500)
+    if threshold and elapsed * 1000 >= threshold:
+        command, seconds = stats["slowest"]
+        current_app.logger.warning(
+            "Slow request %s %s took %.1f ms with %d queries (%.1f ms in Mongo); slowest: %s %.1f ms",
+            method, endpoint, elapsed * 1000, stats["count"], stats["seconds"] * 1000,
+            command or "-", seconds * 1000,
+        )
+
+
+def init_app(app):
+    """Hooks request timing and query counting into every blueprint of `app`."""
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+    register_listener()
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.register_blueprint(metrics)
+
+
+metrics = Blueprint("metrics", __name__)
+
+@metrics.route("/metrics")
+def metrics_page():
+    body = "\n\n".join(h.expose() for h in HISTOGRAMS) + "\n"
+    return Response(body, mimetype="text/plain; version=0.0.4")
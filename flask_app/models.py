@@ -1,22 +1,60 @@
 from flask_login import UserMixin
+from bson import ObjectId
 from datetime import datetime
+from pymongo import UpdateMany, UpdateOne
 from . import db, login_manager
-from flask_app.constants import INSIGHT_STATUSES
+from .extensions import user_cache
+from .prefetch import ref_id
+from flask_app.constants import INSIGHT_STATUSES, REVIEW_STATUSES
+
+# All that current_user needs; the password hash and anything else stays in Mongo
+USER_IDENTITY_FIELDS = ('id', 'username', 'email')
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.objects(username=user_id).first()
+    son = user_cache.get(user_id)
+    if son is None:
+        son = User.objects(username=user_id).only(*USER_IDENTITY_FIELDS).as_pymongo().first()
+        if son is None:
+            return None
+        user_cache.set(user_id, son)
+    # current_user is a projected stub; load the full document before saving it
+    return User._from_son(son)
+
+def renamed_from(document):
+    """The stored name of a saved document whose `name` is being changed, else None."""
+    if document.pk is None or 'name' not in document._get_changed_fields():
+        return None
+    row = type(document)._get_collection().find_one({"_id": document.pk}, {"name": 1})
+    if row is None or row.get("name") == document.name:
+        return None
+    return row.get("name")
 
 class User(db.Document, UserMixin):
     username = db.StringField(unique=True, required=True, min_length=4, max_length=20)
     email = db.EmailField(unique=True, required=True)
     password = db.StringField(required=True)
-    logs = db.ListField(db.ReferenceField('Log'))
-    problems = db.ListField(db.ReferenceField('Problem'))
-    insights = db.ListField(db.ReferenceField('Insight'))
+    # Bumped on every log/problem write; drives ETags (see conditional.py)
+    data_version = db.IntField(default=0)
+    data_updated_at = db.DateTimeField()
+
+    # A user's logs, problems and insights are looked up through their indexed
+    # `user` back-reference instead of arrays on this document, which grew with
+    # every write. strict=False keeps users that still carry the old arrays
+    # loadable until `flask migrate-user-refs` has been run.
+    meta = {'strict': False}
     
     def get_id(self):
         return self.username
+
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        user_cache.pop(self.username)
+        return result
+
+    def delete(self, *args, **kwargs):
+        user_cache.pop(self.username)
+        return super().delete(*args, **kwargs)
     
     def __repr__(self):
         return f"<User {self.username}>"
@@ -26,9 +64,27 @@ class Problem(db.Document):
     name = db.StringField(required=True)      # e.g., "Acne", "Hair Loss"
     details = db.StringField() 
     user = db.ReferenceField(('User'), required=True)
+
+    # Fields a Problem is encoded with in JSON responses (see serialization.py)
+    json_fields = ('name', 'details')
+
+    # One problem per name per user; also serves lookups by user alone
+    meta = {
+        'indexes': [
+            {'fields': ('user', 'name'), 'unique': True},
+            'name',     # the community page's insights for a symptom
+        ]
+    }
+
+    def save(self, *args, **kwargs):
+        previous = renamed_from(self)
+        result = super().save(*args, **kwargs)
+        if previous is not None:
+            TreatmentOutcome.rename("problem", self.pk, previous, self.name)
+        return result
     
     def __repr__(self):
-        return f"<Problem {self.name} of {self.user.username}>"
+        return f"<Problem {self.name} of user {ref_id(self, 'user')}>"
 
 class Log(db.Document):
     user = db.ReferenceField(User, required=True)
@@ -38,47 +94,196 @@ class Log(db.Document):
     end_date = db.DateTimeField(required=True)
     treatment_name = db.StringField()
     problem = db.ReferenceField(('Problem'), required=False)
+
+    # Backs the calendar's visible-range query (see logs.routes.logs_data)
+    meta = {
+        'indexes': [
+            ('user', 'start_date', 'end_date'),
+        ]
+    }
     
     def __repr__(self):
-        return f"<{self.__class__.__name__} {self.id} by {self.user.username}>"
-    
+        return f"<{self.__class__.__name__} {self.id} by user {ref_id(self, 'user')}>"
+
+
+class LogEntry(db.EmbeddedDocument):
+    # A Log packed into a LogBucket; short keys, since they repeat in every entry
+    id = db.ObjectIdField(db_field='_id', required=True, default=ObjectId)
+    type = db.StringField(db_field='t', required=True, default='Period')
+    description = db.StringField(db_field='d')
+    treatment_name = db.StringField(db_field='n')
+    start_date = db.DateTimeField(db_field='s', required=True)
+    end_date = db.DateTimeField(db_field='e', required=True)
+    problem = db.ObjectIdField(db_field='p')
+
+
+class LogBucket(db.Document):
+    # A user's logs starting in one calendar month, used instead of Log
+    # documents when LOG_STORAGE is "buckets" (see logs/storage.py)
+    user = db.ReferenceField(User, required=True)
+    month = db.DateTimeField(required=True)         # first day of the month
+    last_end = db.DateTimeField()                   # latest entry end_date; never lowered
+    count = db.IntField(default=0)
+    entries = db.EmbeddedDocumentListField(LogEntry)
+
+    # One key per user and month; range reads scan only the months they cover
+    meta = {
+        'indexes': [
+            {'fields': ('user', 'month'), 'unique': True},
+        ]
+    }
+
+    def __repr__(self):
+        return f"<LogBucket {self.month:%Y-%m} of user {ref_id(self, 'user')}>"
+
+
 class Treatment(db.Document):
     name = db.StringField(required=True)
     start_date = db.DateTimeField(required=True)
     end_date = db.DateTimeField(required=True)
     details = db.StringField()
     user = db.ReferenceField(User, required=True)
-    
+    problem = db.ReferenceField(('Problem'), required=False)   # symptom being treated
+
+    # Backs the timeline's overlap queries (see treatments.routes)
+    meta = {
+        'indexes': [
+            ('user', 'start_date', 'end_date'),
+        ]
+    }
+
+    def save(self, *args, **kwargs):
+        previous = renamed_from(self)
+        result = super().save(*args, **kwargs)
+        if previous is not None:
+            TreatmentOutcome.rename("treatment", self.pk, previous, self.name)
+        return result
+
     def __repr__(self):
-        return f"<Treatment {self.name} for {self.user.name}>"
-
-
-# class Place(db.Document):
-#     name = db.StringField(required=True)
-#     address = db.StringField(required=True)
-#     link = db.StringField()
-#     latitude = db.FloatField()
-#     longitude = db.FloatField()
-#     description = db.StringField()
-#     posted_by = db.ReferenceField(User, required=True)
-#     average_rating = db.FloatField(default=0.0)
-#     reviews = db.ListField(db.ReferenceField('Review'))
-    
-#     def get_id(self):
-#         return self.name
-        
-#     def __repr__(self):
-#         return f"<{self.name}>"
-    
+        return f"<Treatment {self.name} for user {ref_id(self, 'user')}>"
+
+
+class Place(db.Document):
+    # Local copy of the places the find_places Lambda returned, so nearby
+    # searches can be answered from MongoDB (see places/store.py)
+    place_id = db.StringField(required=True, unique=True)   # Google place id
+    name = db.StringField(required=True)
+    address = db.StringField()
+    location = db.PointField(required=True)     # GeoJSON, [lng, lat]
+    google_rating = db.FloatField()
+    google_user_ratings_total = db.IntField()
+    fetched_at = db.DateTimeField(required=True)
+    # Aggregates over this site's non-FAILED reviews, kept current with $inc by
+    # Review.save()/delete() and the outbox, and rebuilt by
+    # `flask rebuild-place-ratings`. A review can arrive before its place was
+    # ever searched, so these may exist on a document without the fields above.
+    review_count = db.IntField(default=0)
+    rating_sum = db.IntField(default=0)
+    rating_histogram = db.DictField()   # "1".."5" -> number of reviews
+
+    meta = {
+        'indexes': [
+            '(location',    # 2dsphere, for $near
+        ]
+    }
+
+    @classmethod
+    def record_rating(cls, place_id, rating, delta):
+        if not place_id or rating is None:
+            return
+        cls._get_collection().update_one(
+            {"place_id": place_id},
+            {"$inc": {"review_count": delta, "rating_sum": delta * rating, f"rating_histogram.{rating}": delta}},
+            upsert=True,
+        )
+
+    @classmethod
+    def rebuild_ratings(cls):
+        """Recomputes every place's rating aggregates from Review; returns how many places have reviews."""
+        rows = Review.objects(status__ne="FAILED").aggregate([
+            {"$group": {"_id": {"place_id": "$place_id", "rating": "$rating"}, "count": {"$sum": 1}}},
+            {"$group": {
+                "_id": "$_id.place_id",
+                "ratings": {"$push": {"rating": "$_id.rating", "count": "$count"}},
+            }},
+        ])
+        updates, reviewed = [], []
+        for row in rows:
+            reviewed.append(row["_id"])
+            histogram = {str(r["rating"]): r["count"] for r in row["ratings"]}
+            updates.append(UpdateOne({"place_id": row["_id"]}, {"$set": {
+                "review_count": sum(histogram.values()),
+                "rating_sum": sum(r["rating"] * r["count"] for r in row["ratings"]),
+                "rating_histogram": histogram,
+            }}, upsert=True))
+        # Places whose reviews are all gone
+        updates.append(UpdateMany({"place_id": {"$nin": reviewed}, "review_count": {"$ne": 0}}, {"$set": {
+            "review_count": 0, "rating_sum": 0, "rating_histogram": {},
+        }}))
+        cls._get_collection().bulk_write(updates, ordered=False)
+        return len(reviewed)
+
+    def __repr__(self):
+        return f"<Place {self.name}>"
+
+
 class Review(db.Document):
-    place = db.ReferenceField(('Place'), required=True)
+    place = db.ReferenceField(('Place'), required=False)
+    place_id = db.StringField(required=True)    # Google place id sent by the map page
     user = db.ReferenceField(('User'), required=True)
     rating = db.IntField(min_value=1, max_value=5, required=True)
     comment = db.StringField()
     created_at = db.DateTimeField(required=True)
+
+    # Outbox state: reviews are accepted locally and delivered by reviews.outbox
+    status = db.StringField(choices=REVIEW_STATUSES, default="PENDING")
+    idempotency_key = db.StringField(required=True)    # unique per user
+    attempts = db.IntField(default=0)
+    next_attempt_at = db.DateTimeField()
+    claim = db.StringField()
+    claimed_at = db.DateTimeField()
+    sent_at = db.DateTimeField()
+    last_error = db.StringField()
+
+    meta = {
+        'indexes': [
+            ('status', 'next_attempt_at'),
+            ('place_id', '-created_at'),
+            # Keys come from clients, so one user's key never matches another's review
+            {'fields': ('user', 'idempotency_key'), 'unique': True},
+        ]
+    }
     
+    # Fields that decide which Place rating aggregate a review lands in
+    RATING_FIELDS = ('place_id', 'rating', 'status')
+
+    @property
+    def counted(self):
+        return self.status != "FAILED"
+
+    def save(self, *args, **kwargs):
+        previous = None
+        created = self.pk is None
+        if not created and set(self.RATING_FIELDS) & set(self._get_changed_fields()):
+            previous = Review._get_collection().find_one({"_id": self.pk}, list(self.RATING_FIELDS))
+        result = super().save(*args, **kwargs)
+        if created and self.counted:
+            Place.record_rating(self.place_id, self.rating, 1)
+        elif previous:
+            if previous.get("status") != "FAILED":
+                Place.record_rating(previous["place_id"], previous["rating"], -1)
+            if self.counted:
+                Place.record_rating(self.place_id, self.rating, 1)
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        if self.counted:
+            Place.record_rating(self.place_id, self.rating, -1)
+        return result
+
     def __repr__(self):
-        return f"<Review {self.id} for {self.place.name} by {self.user.username}>"
+        return f"<Review {self.id} for {self.place_id} by user {ref_id(self, 'user')}>"
 
 class Insight(db.Document):
     status = db.StringField(choices=INSIGHT_STATUSES, default="NO_CHANGE")
@@ -86,7 +291,139 @@ class Insight(db.Document):
     problem = db.ReferenceField(('Problem'), required=True)
     treatment = db.ReferenceField('Treatment', required=True)
     user = db.ReferenceField(('User'), required=True)
+
+    meta = {
+        'indexes': ['user', ('problem', 'status')]
+    }
+
+    # Fields that decide which TreatmentOutcome counter an insight lands in
+    OUTCOME_FIELDS = ('status', 'problem', 'treatment')
+
+    def save(self, *args, **kwargs):
+        previous = None
+        created = self.pk is None
+        if not created and set(self.OUTCOME_FIELDS) & set(self._get_changed_fields()):
+            previous = Insight._get_collection().find_one({"_id": self.pk}, list(self.OUTCOME_FIELDS))
+        result = super().save(*args, **kwargs)
+        if created:
+            TreatmentOutcome.record(self.status, self.problem, self.treatment, 1)
+        elif previous:
+            TreatmentOutcome.record(previous.get("status"), previous["problem"], previous["treatment"], -1)
+            TreatmentOutcome.record(self.status, self.problem, self.treatment, 1)
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        TreatmentOutcome.record(self.status, self.problem, self.treatment, -1)
+        return result
     
     def __repr__(self):
-        return f"<Insight {self.content} by {self.user.username}>"
+        return f"<Insight {self.content} by user {ref_id(self, 'user')}>"
+
+
+class TreatmentOutcome(db.Document):
+    """Community-wide Insight status counts for one (problem, treatment) pair.
+
+    A materialized view over Insight: kept current with $inc by Insight.save()
+    and Insight.delete(), moved by Problem.save() and Treatment.save() when
+    a name changes, and rebuilt from scratch by
+    `flask rebuild-treatment-outcomes`. Bulk QuerySet updates/deletes of
+    Insight bypass the counters and need a rebuild.
+    """
+    problem_name = db.StringField(required=True)
+    treatment_name = db.StringField(required=True)
+    counts = db.DictField()     # INSIGHT_STATUSES value -> number of insights
+    total = db.IntField(default=0)
+
+    meta = {
+        'indexes': [
+            {'fields': ('problem_name', 'treatment_name'), 'unique': True},
+            '-total',
+        ]
+    }
+
+    @staticmethod
+    def _name(document_cls, value):
+        # `value` is either a dereferenced document or a raw ObjectId
+        if isinstance(value, document_cls):
+            return value.name
+        row = document_cls._get_collection().find_one({"_id": getattr(value, "pk", value)}, {"name": 1})
+        return row["name"] if row else None
+
+    @classmethod
+    def record(cls, status, problem, treatment, delta):
+        problem_name = cls._name(Problem, problem)
+        treatment_name = cls._name(Treatment, treatment)
+        if not problem_name or not treatment_name:
+            return
+        cls._get_collection().update_one(
+            {"problem_name": problem_name, "treatment_name": treatment_name},
+            {"$inc": {f"counts.{status or 'NO_CHANGE'}": delta, "total": delta}},
+            upsert=True,
+        )
+
+    @classmethod
+    def rename(cls, field, pk, old_name, new_name):
+        """Moves the counts of the insights on problem or treatment `pk` from `old_name` to `new_name`."""
+        other, other_cls = ("treatment", Treatment) if field == "problem" else ("problem", Problem)
+        rows = list(Insight._get_collection().find({field: pk}, {"status": 1, other: 1}))
+        names = {
+            row["_id"]: row["name"]
+            for row in other_cls._get_collection().find(
+                {"_id": {"$in": list({row[other] for row in rows})}}, {"name": 1}
+            )
+        }
+        moved = {}
+        for row in rows:
+            if row[other] in names:
+                key = (names[row[other]], row.get("status") or "NO_CHANGE")
+                moved[key] = moved.get(key, 0) + 1
+
+        def pair(name, other_name):
+            return {f"{field}_name": name, f"{other}_name": other_name}
+
+        updates = []
+        for (other_name, status), count in moved.items():
+            updates.append(UpdateOne(pair(old_name, other_name),
+                                     {"$inc": {f"counts.{status}": -count, "total": -count}}))
+            updates.append(UpdateOne(pair(new_name, other_name),
+                                     {"$inc": {f"counts.{status}": count, "total": count}}, upsert=True))
+        if updates:
+            cls._get_collection().bulk_write(updates, ordered=False)
+
+    @classmethod
+    def rebuild(cls):
+        """Recomputes every pair from Insight in one server-side pipeline."""
+        Insight.objects.aggregate([
+            {"$lookup": {"from": Problem._get_collection_name(), "localField": "problem",
+                         "foreignField": "_id", "as": "problem_doc"}},
+            {"$lookup": {"from": Treatment._get_collection_name(), "localField": "treatment",
+                         "foreignField": "_id", "as": "treatment_doc"}},
+            {"$unwind": "$problem_doc"},
+            {"$unwind": "$treatment_doc"},
+            {"$group": {
+                "_id": {"problem_name": "$problem_doc.name", "treatment_name": "$treatment_doc.name",
+                        "status": {"$ifNull": ["$status", "NO_CHANGE"]}},
+                "count": {"$sum": 1},
+            }},
+            {"$group": {
+                "_id": {"problem_name": "$_id.problem_name", "treatment_name": "$_id.treatment_name"},
+                "counts": {"$push": {"k": "$_id.status", "v": "$count"}},
+                "total": {"$sum": "$count"},
+            }},
+            {"$project": {
+                "_id": 0,
+                "problem_name": "$_id.problem_name",
+                "treatment_name": "$_id.treatment_name",
+                "counts": {"$arrayToObject": "$counts"},
+                "total": 1,
+            }},
+            # Replaces the collection in one step, keeping its indexes
+            {"$out": cls._get_collection_name()},
+        ])
+        return cls.objects.count()
+
+    def share(self, status):
+        """Percentage of insights for this pair with the given status."""
+        return round(100 * self.counts.get(status, 0) / self.total) if self.total else 0
 
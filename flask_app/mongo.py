@@ -0,0 +1,51 @@
+# MongoClient lifecycle for pre-forking servers and serverless hosts.
+#
+# The client itself is created by flask-mongoengine from MONGODB_SETTINGS with
+# connect=False, so no sockets are opened until the first query. It lives on
+# the module-level app in run.py, which warm serverless invocations reuse.
+import os
+
+import mongoengine
+from mongoengine import Document, connection
+from mongoengine.base.common import _get_documents_by_db
+
+_fork_hook_registered = False
+
+
+def reset_after_fork():
+    """Drops clients inherited from the parent process.
+
+    MongoClient is not fork-safe: its pool and monitor threads belong to the
+    parent. The connection settings are kept, so the next query in the child
+    opens a fresh client. Like mongoengine.disconnect(), each Document's
+    cached collection is detached too; it holds the parent's client.
+    """
+    for alias in list(connection._dbs):
+        for doc_cls in _get_documents_by_db(alias, connection.DEFAULT_CONNECTION_NAME):
+            if issubclass(doc_cls, Document):  # Skip EmbeddedDocument
+                doc_cls._disconnect()
+    connection._connections.clear()
+    connection._dbs.clear()
+
+
+def register_fork_hook():
+    """Resets inherited clients in every child forked afterwards (once per process)."""
+    global _fork_hook_registered
+    if not _fork_hook_registered and hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=reset_after_fork)
+        _fork_hook_registered = True
+
+
+def warm_up(app):
+    """Selects a server and opens the first pooled connection before any request needs it."""
+    try:
+        mongoengine.get_db().command("ping")
+    except Exception as e:
+        # A cold start shouldn't fail outright; the first request will retry
+        app.logger.warning("MongoDB warm-up ping failed: %s", e)
+
+
+def init_app(app):
+    register_fork_hook()
+    if app.config.get("MONGODB_WARMUP", False):
+        warm_up(app)
@@ -0,0 +1,205 @@
+# Server-side caching of pages and template fragments for anonymous visitors.
+#
+# The home, community, places and 404 pages render the same HTML for every
+# visitor who isn't logged in, so @cache_page keeps the finished response and
+# replays it. Logged-in requests (session user or remember-me cookie) always
+# render. Storage is pluggable: "memory" is a per-process LRU; "file" keeps
+# entries in a directory (by default under /dev/shm when it exists) that every
+# worker on the host shares. Inside templates, {% call cached_fragment(...) %}
+# does the same for the shared header/head/footer markup of pages that can't
+# be cached whole.
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import time
+from functools import wraps
+
+from flask import current_app, request, session
+from flask_login import current_user
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+from .cache import TTLCache
+
+CACHED_STATUSES = (200, 404)
+
+
+class UnsafeCacheDirectory(Exception):
+    """The page cache directory could be written by someone else."""
+
+
+class FileBackend:
+    """TTLCache-compatible get/set/clear of (body, status, headers) page entries, one file each.
+
+    Entries are a JSON header line followed by the body, so reading one never
+    runs code. The directory must belong to this user with mode 0700, and at
+    most `maxsize` entries are kept.
+    """
+
+    def __init__(self, directory, ttl=60, maxsize=256):
+        self.directory = directory
+        self.ttl = ttl
+        self.maxsize = maxsize
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # makedirs leaves an existing directory as it is; a shared tmpfs path
+        # may have been created by another user first
+        st = os.lstat(directory)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o700:
+            raise UnsafeCacheDirectory(f"{directory} must be a directory owned by uid {os.getuid()} with mode 0700")
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.maxsize > 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".page")
+
+    def get(self, key, default=None):
+        try:
+            with open(self._path(key), "rb") as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return default
+        # Wall-clock time, since monotonic clocks differ between processes
+        if header["expires"] < time.time():
+            return default
+        return body, header["status"], [tuple(h) for h in header["headers"]]
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        body, status, headers = value
+        header = {"expires": time.time() + self.ttl, "status": status, "headers": headers}
+        # Written aside and renamed, so readers never see a partial entry
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            f.write(body)
+        os.replace(temp, self._path(key))
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".page"):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.stat(path).st_mtime, path))
+                except FileNotFoundError:
+                    pass
+        return entries
+
+    def _evict(self):
+        """Drops expired entries, then the oldest ones, once there are more than maxsize."""
+        entries = self._entries()
+        if len(entries) <= self.maxsize:
+            return
+        entries.sort()
+        cutoff = time.time() - self.ttl
+        expired = [path for mtime, path in entries if mtime < cutoff]
+        excess = len(entries) - self.maxsize - len(expired)
+        live = [path for mtime, path in entries if mtime >= cutoff]
+        for path in expired + live[:max(excess, 0)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith((".page", ".tmp")):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+
+def default_directory():
+    # tmpfs where available: shared by the host's workers without disk I/O
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(root, f"pcos-pages-{os.getuid()}")
+
+
+class PageCache:
+    """Anonymous page and fragment caches, plus the Jinja bytecode cache."""
+
+    def __init__(self):
+        self.pages = TTLCache(ttl=0)
+        self.fragments = TTLCache(ttl=0)
+
+    def init_app(self, app):
+        ttl = app.config.get("PAGE_CACHE_TTL", 60)
+        size = app.config.get("PAGE_CACHE_SIZE", 256)
+        backend = app.config.get("PAGE_CACHE_BACKEND", "memory")
+        if backend == "file":
+            try:
+                self.pages = FileBackend(app.config.get("PAGE_CACHE_DIR") or default_directory(), ttl=ttl, maxsize=size)
+            except UnsafeCacheDirectory as e:
+                app.logger.warning("Page cache falls back to memory: %s", e)
+                backend = "memory"
+        if backend != "file":
+            self.pages = TTLCache(maxsize=size if backend == "memory" else 0, ttl=ttl)
+        # Fragments are small and few, so each process keeps its own
+        self.fragments = TTLCache(maxsize=size, ttl=ttl)
+
+        if app.config.get("JINJA_BYTECODE_CACHE", True):
+            # Compiled templates survive restarts, which serverless cold starts hit often
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config.get("JINJA_BYTECODE_CACHE_DIR"))
+        app.add_template_global(self.fragment, "cached_fragment")
+        app.extensions["page_cache"] = self
+
+    def clear(self):
+        self.pages.clear()
+        self.fragments.clear()
+
+    def fragment(self, name, anonymous_only=False, caller=None):
+        """Renders the {% call %} body once and reuses it; `anonymous_only` renders it fresh for logged-in users."""
+        if anonymous_only and current_user.is_authenticated:
+            return caller()
+        html = self.fragments.get(name)
+        if html is None:
+            html = str(caller())
+            self.fragments.set(name, html)
+        return Markup(html)
+
+
+def anonymous():
+    """Whether the request can't belong to a logged-in user, without loading one."""
+    if "_user_id" in session:
+        return False
+    return current_app.config.get("REMEMBER_COOKIE_NAME", "remember_token") not in request.cookies
+
+
+def cache_page(key=None):
+    """Caches a view's response for anonymous GETs, keyed by `key` or else the path and query string."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions["page_cache"].pages
+            if request.method not in ("GET", "HEAD") or not anonymous():
+                return view(*args, **kwargs)
+
+            cache_key = f"page:{key or request.full_path}"
+            entry = cache.get(cache_key)
+            if entry is not None:
+                body, status, headers = entry
+                response = current_app.response_class(body, status=status, headers=headers)
+                response.headers["X-Page-Cache"] = "HIT"
+                return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            # Views that touched the session (e.g. a CSRF token) are per-visitor
+            if (
+                cache.enabled
+                and response.status_code in CACHED_STATUSES
+                and not response.is_streamed
+                and not session.modified
+            ):
+                cache.set(cache_key, (response.get_data(), response.status_code, list(response.headers)))
+                response.headers["X-Page-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
@@ -1,21 +1,34 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, current_app, render_template, request
 from flask_login import login_required, current_user
-import requests
 import os
 from ..forms import ReviewForm
-import boto3
-import json
-from decimal import Decimal
 from ..models import Review
+from ..client import LambdaBusy, LambdaError
+from ..serialization import jsonify
+from ..extensions import lambda_client
+from ..reviews import outbox
+from ..pages import cache_page
+from . import store
 
 GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY")
-LAMBDA_API_URL_FIND = os.environ.get('LAMBDA_API_URL_FIND')
-LAMBDA_API_URL_REVIEW = os.environ.get('LAMBDA_API_URL_REVIEW')
 
 places = Blueprint('places', __name__)
 
 
+@places.record_once
+def store_search_results(state):
+    lambda_client.on_search = store.remember
+
+
+def upstream_error(e):
+    """(payload, status, headers) for a failed Lambda call; 503 when its concurrency limit stayed full."""
+    if isinstance(e, LambdaBusy):
+        return {"error": f"Too many searches in progress: {str(e)}"}, 503, {"Retry-After": "1"}
+    return {"error": f"Failed to call Lambda: {str(e)}"}, 500, {}
+
+
 @places.route('/places')
+@cache_page()
 def places_home():
     return render_template('places_test.html', api_key=GOOGLE_API_KEY)
 
@@ -28,19 +41,40 @@ def search_place():
         return jsonify({"error": "Missing address"}), 400
 
     try:
-        # Call Lambda via API Gateway
-        resp = requests.post(
-            f"{LAMBDA_API_URL_FIND}find_places", 
-            json={"reference": address},
-            timeout=10
-        )
-        resp.raise_for_status()  # raise exception for HTTP errors
+        # Call Lambda via API Gateway, unless the address was searched recently
+        # or the same search is already in flight
+        return jsonify(store.with_ratings(lambda_client.find_places(address)))
+
+    except LambdaError as e:
+        payload, status, headers = upstream_error(e)
+        return jsonify(payload), status, headers
 
-        # Return the Lambda response directly
-        return jsonify(resp.json())
 
-    except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"Failed to call Lambda: {str(e)}"}), 500
+@places.route('/places/nearby')
+def nearby_places():
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+        radius = float(request.args.get('radius', store.DEFAULT_RADIUS_M))
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat and lng are required numbers"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not 0 < radius <= store.MAX_RADIUS_M:
+        return jsonify({"error": f"lat/lng out of range or radius not in (0, {store.MAX_RADIUS_M}] metres"}), 400
+
+    found = store.nearby(lat, lng, radius)
+    if store.is_fresh(found, current_app.config.get("PLACES_FRESH_TTL", 7 * 24 * 3600)):
+        return jsonify({"results": [store.place_json(p) for p in found], "source": "local"})
+
+    try:
+        # Upstream results are stored through lambda_client.on_search
+        result = lambda_client.find_places(f"{lat},{lng}")
+    except LambdaError as e:
+        if not found:
+            payload, status, headers = upstream_error(e)
+            return jsonify(payload), status, headers
+        # Stale places beat no places
+        return jsonify({"results": [store.place_json(p) for p in found], "source": "stale"})
+    return jsonify(dict(store.with_ratings(result), source="lambda"))
 
 
 @places.route('/places/review', methods=['POST'])
@@ -62,24 +96,24 @@ def review_place():
     except ValueError:
         return jsonify({"error": "Invalid rating value"}), 400
 
-    # Prepare review data
-    review_data = {
-        "username": current_user.username,
-        "place_id": place_id,
-        "rating": rating,
-        "comment": comment
-    }
-
-    try:
-        # Call Lambda via API Gateway to submit review
-        resp = requests.post(
-            f"{LAMBDA_API_URL_REVIEW}submit_review", 
-            json=review_data,
-            timeout=10
-        )
-        resp.raise_for_status()  # raise exception for HTTP errors
-
-        return jsonify({"message": "Review submitted successfully!"}), 200
-
-    except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"Failed to submit review: {str(e)}"}), 500
+    # Accept the review locally; the outbox worker delivers it to the Lambda
+    review, created = outbox.enqueue(
+        current_user,
+        place_id,
+        rating,
+        comment,
+        idempotency_key=request.headers.get("Idempotency-Key"),
+    )
+    if created:
+        outbox.worker.notify()
+
+    return jsonify({
+        "message": "Review submitted successfully!",
+        "id": review.id,
+        "status": review.status,
+    }), 202
+
+
+@places.route('/places/search/stats')
+def search_stats():
+    return jsonify(lambda_client.stats())
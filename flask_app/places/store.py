@@ -0,0 +1,117 @@
+# Local geospatial store of places seen in find_places Lambda results.
+#
+# Every upstream search result is upserted into Place by Google place id.
+# /places/nearby then answers from a $near query on the 2dsphere index, and
+# only calls the Lambda again when the area has no places or the ones it has
+# are older than PLACES_FRESH_TTL.
+from datetime import datetime, timedelta
+
+from flask import current_app
+from pymongo import UpdateOne
+
+from ..models import Place
+
+MAX_RADIUS_M = 50000
+DEFAULT_RADIUS_M = 2000
+
+
+def location_of(entry):
+    """(lng, lat) of a Lambda result entry, or None when it has no coordinates."""
+    location = (entry.get("geometry") or {}).get("location") or {}
+    try:
+        return float(location["lng"]), float(location["lat"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def remember(result, now=None):
+    """Upserts every place in a find_places result; returns how many were written.
+
+    Storing is best-effort: a failure is logged and the search still succeeds.
+    """
+    now = now or datetime.utcnow()
+    updates = []
+    for entry in (result or {}).get("results") or []:
+        point = location_of(entry)
+        if not entry.get("place_id") or point is None:
+            continue
+        updates.append(UpdateOne({"place_id": entry["place_id"]}, {"$set": {
+            "name": entry.get("name") or "",
+            "address": entry.get("formatted_address"),
+            "location": {"type": "Point", "coordinates": list(point)},
+            "google_rating": entry.get("google_rating"),
+            "google_user_ratings_total": entry.get("google_user_ratings_total"),
+            "fetched_at": now,
+        }}, upsert=True))
+    if not updates:
+        return 0
+    try:
+        Place._get_collection().bulk_write(updates, ordered=False)
+    except Exception as e:
+        current_app.logger.warning("Could not store %d place(s): %s", len(updates), e)
+        return 0
+    return len(updates)
+
+
+def nearby(lat, lng, radius, limit=20):
+    """Places within `radius` metres of (lat, lng), nearest first."""
+    return list(
+        Place.objects(location__near=[lng, lat], location__max_distance=radius)
+        .limit(limit)
+        .as_pymongo()
+    )
+
+
+def is_fresh(places, max_age, now=None):
+    """Whether there are places and none was fetched more than `max_age` seconds ago."""
+    if not places:
+        return False
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=max_age)
+    return min(place["fetched_at"] for place in places) >= cutoff
+
+
+def ratings_json(place):
+    """The rating fields the map page shows, from a place's stored aggregates."""
+    count = place.get("review_count") or 0
+    histogram = place.get("rating_histogram") or {}
+    return {
+        "user_rating": round(place["rating_sum"] / count, 1) if count else None,
+        "user_ratings_total": count,
+        "rating_histogram": [histogram.get(str(stars), 0) for stars in range(1, 6)],
+    }
+
+
+def place_json(place):
+    """A stored place in the shape of a find_places result entry, as the map page reads it."""
+    lng, lat = place["location"]["coordinates"]
+    return {
+        "place_id": place["place_id"],
+        "name": place["name"],
+        "formatted_address": place.get("address"),
+        "geometry": {"location": {"lat": lat, "lng": lng}},
+        "google_rating": place.get("google_rating"),
+        "google_user_ratings_total": place.get("google_user_ratings_total"),
+        **ratings_json(place),
+    }
+
+
+def with_ratings(result):
+    """A copy of a find_places result with this site's rating aggregates on each place.
+
+    One query for the whole result; places nobody reviewed here keep the
+    Lambda's values. The (cached, shared) result itself is not modified.
+    """
+    entries = (result or {}).get("results") or []
+    ids = [entry["place_id"] for entry in entries if entry.get("place_id")]
+    if not ids:
+        return result
+    stored = {
+        place["place_id"]: place
+        for place in Place.objects(place_id__in=ids, review_count__gt=0)
+        .only("place_id", "review_count", "rating_sum", "rating_histogram")
+        .as_pymongo()
+    }
+    return dict(result, results=[
+        dict(entry, **ratings_json(stored[entry.get("place_id")])) if entry.get("place_id") in stored else entry
+        for entry in entries
+    ])
@@ -0,0 +1,159 @@
+# Cycle prediction from a user's "Period" logs
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from ..cache import TTLCache
+from ..constants import SAME_PERIOD_GAP_DAYS, MIN_CYCLE_DAYS, MAX_CYCLE_DAYS
+from ..logs.storage import log_store
+
+# Only the most recent cycles describe the user's current pattern
+RECENT_CYCLES = 12
+# Days from ovulation to the next period; fairly constant even in PCOS
+LUTEAL_PHASE_DAYS = 14
+# Floor on the spread so two identical cycles don't yield a zero-width interval
+MIN_STD_DAYS = 2.0
+Z_95 = 1.96
+
+# Histories are kept per process and patched in place by the log routes; the
+# TTL bounds how stale another worker's copy can get
+histories = TTLCache(maxsize=2048, ttl=600)
+_lock = threading.Lock()
+
+
+def _day(value):
+    return np.datetime64(value.date() if isinstance(value, datetime) else value, "D")
+
+
+class CycleHistory:
+    """Sorted period log ranges for one user plus the prediction derived from them."""
+
+    def __init__(self, starts, ends):
+        order = np.argsort(starts, kind="stable")
+        self.starts = np.asarray(starts, dtype="datetime64[D]")[order]
+        self.ends = np.asarray(ends, dtype="datetime64[D]")[order]
+        self._summary = None
+
+    @classmethod
+    def load(cls, user):
+        rows = log_store().find(user, fields=("start_date", "end_date"), match={"type": "Period"})
+        starts, ends = [], []
+        for row in rows:
+            starts.append(_day(row["start_date"]))
+            ends.append(_day(row.get("end_date") or row["start_date"]))
+        return cls(starts, ends)
+
+    def add(self, start, end):
+        i = np.searchsorted(self.starts, _day(start))
+        self.starts = np.insert(self.starts, i, _day(start))
+        self.ends = np.insert(self.ends, i, _day(end))
+        self._summary = None
+
+    def remove(self, start, end):
+        matches = np.flatnonzero((self.starts == _day(start)) & (self.ends == _day(end)))
+        if matches.size:
+            self.starts = np.delete(self.starts, matches[0])
+            self.ends = np.delete(self.ends, matches[0])
+            self._summary = None
+
+    def periods(self):
+        """Merges overlapping or adjacent log ranges into (start, end) arrays of periods."""
+        if not self.starts.size:
+            return self.starts, self.ends
+        running_end = np.maximum.accumulate(self.ends)
+        gap = (self.starts[1:] - running_end[:-1]).astype(int)
+        is_new = np.concatenate(([True], gap > SAME_PERIOD_GAP_DAYS))
+        first = np.flatnonzero(is_new)
+        return self.starts[first], np.maximum.reduceat(self.ends, first)
+
+    def summary(self):
+        """Cycle statistics, computed once per change to the history."""
+        if self._summary is None:
+            period_starts, period_ends = self.periods()
+            cycles = np.diff(period_starts).astype(int)
+            cycles = cycles[(cycles >= MIN_CYCLE_DAYS) & (cycles <= MAX_CYCLE_DAYS)][-RECENT_CYCLES:]
+            durations = (period_ends - period_starts).astype(int)[-RECENT_CYCLES:]
+            self._summary = {
+                "last_period_start": period_starts[-1] if period_starts.size else None,
+                "cycles": cycles,
+                "mean": float(cycles.mean()) if cycles.size else None,
+                "std": float(cycles.std(ddof=1)) if cycles.size > 1 else 0.0,
+                "period_length": float(durations.mean()) if durations.size else None,
+            }
+        return self._summary
+
+    def predict(self, today=None):
+        """Next period and fertile window with 95% prediction intervals, or None."""
+        stats = self.summary()
+        if stats["mean"] is None:
+            return None
+
+        today = _day(today or datetime.now())
+        mean = stats["mean"]
+        n = stats["cycles"].size
+        # Prediction interval for one more cycle, not the interval of the mean
+        spread = Z_95 * max(stats["std"], MIN_STD_DAYS) * np.sqrt(1 + 1 / n)
+
+        next_start = stats["last_period_start"] + np.timedelta64(round(mean), "D")
+        # If the user hasn't logged recent periods, roll forward to the upcoming cycle
+        if next_start < today:
+            missed = int(np.ceil((today - next_start).astype(int) / mean))
+            next_start += np.timedelta64(round(missed * mean), "D")
+
+        margin = np.timedelta64(round(spread), "D")
+        ovulation = next_start - np.timedelta64(LUTEAL_PHASE_DAYS, "D")
+        fertile_start = ovulation - np.timedelta64(5, "D")
+        fertile_end = ovulation + np.timedelta64(1, "D")
+
+        return {
+            "cycles_tracked": n,
+            "average_cycle_length": round(mean, 1),
+            "cycle_length_std": round(stats["std"], 1),
+            "average_period_length": round(stats["period_length"], 1),
+            "confidence": 0.95,
+            # numpy datetime64[D] values print as ISO dates
+            "next_period": {
+                "date": str(next_start),
+                "earliest": str(next_start - margin),
+                "latest": str(next_start + margin),
+            },
+            "fertile_window": {
+                "start": str(fertile_start),
+                "end": str(fertile_end),
+                "earliest": str(fertile_start - margin),
+                "latest": str(fertile_end + margin),
+            },
+        }
+
+
+def history_for(user):
+    key = str(user.id)
+    history = histories.get(key)
+    if history is None:
+        # Loaded outside the lock so one user's query doesn't block the others
+        history = CycleHistory.load(user)
+        histories.set(key, history)
+    return history
+
+
+def predict_for(user, today=None):
+    history = history_for(user)
+    with _lock:
+        return history.predict(today)
+
+
+def record_period_change(user, old=None, new=None):
+    """Patches a cached history after a Period log is created, moved or deleted.
+
+    `old` and `new` are (start_date, end_date) pairs; either may be None. Users
+    without a cached history are simply loaded fresh on their next request.
+    """
+    with _lock:
+        history = histories.get(str(user.id))
+        if history is None:
+            return
+        if old is not None:
+            history.remove(*old)
+        if new is not None:
+            history.add(*new)
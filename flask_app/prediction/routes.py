@@ -0,0 +1,20 @@
+from flask import Blueprint
+from flask_login import login_required, current_user
+from ..serialization import jsonify
+
+prediction = Blueprint("prediction", __name__)
+
+@prediction.route("/prediction")
+@login_required
+def prediction_data():
+    # numpy is only imported once someone asks for a prediction
+    from .engine import predict_for
+
+    result = predict_for(current_user)
+    if result is None:
+        return jsonify({
+            "success": True,
+            "prediction": None,
+            "message": "Log at least two periods to get a prediction."
+        })
+    return jsonify({"success": True, "prediction": result})
@@ -0,0 +1,40 @@
+# Batched dereferencing for list views.
+#
+# Touching a ReferenceField on each document of a list costs one query per
+# document. prefetch() resolves a field for the whole list with one $in
+# query per referenced collection, like Django's select_related.
+from bson import DBRef
+
+
+def ref_id(document, field):
+    """The id stored in a reference field, without dereferencing it."""
+    value = document._data.get(field)
+    if isinstance(value, DBRef):
+        return value.id
+    return getattr(value, "pk", value)
+
+
+def prefetch(documents, *fields, only=None):
+    """Dereferences `fields` on every document in one query per field.
+
+    Returns the documents as a list. `only` optionally limits the fields
+    loaded for the referenced documents.
+    """
+    documents = list(documents)
+    if not documents:
+        return documents
+    for field in fields:
+        referenced_cls = documents[0]._fields[field].document_type
+        ids = {ref_id(doc, field) for doc in documents} - {None}
+        if not ids:
+            continue
+        queryset = referenced_cls.objects(pk__in=ids)
+        if only:
+            queryset = queryset.only(*only)
+        by_id = {ref.pk: ref for ref in queryset}
+        for doc in documents:
+            target = by_id.get(ref_id(doc, field))
+            if target is not None:
+                # Store the loaded document so attribute access won't query again
+                doc._data[field] = target
+    return documents
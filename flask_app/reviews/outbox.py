@@ -0,0 +1,181 @@
+# Write-behind delivery of reviews to the review Lambda.
+#
+# review_place stores each review as a PENDING Review document and returns
+# right away; a background worker (or `flask flush-reviews` on platforms
+# without long-lived processes) sends them upstream in batches.
+import os
+import random
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from mongoengine.errors import NotUniqueError
+from pymongo import UpdateOne
+
+from ..extensions import lambda_client
+from ..models import Place, Review
+from ..prefetch import prefetch
+
+BATCH_SIZE = 25
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 600
+# A SENDING claim older than this belongs to a worker that died mid-batch
+CLAIM_LEASE = timedelta(minutes=5)
+IDLE_INTERVAL_SECONDS = 5
+
+
+def backoff(attempts):
+    """Exponential backoff with full jitter, capped at BACKOFF_MAX_SECONDS."""
+    ceiling = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempts)
+    return timedelta(seconds=random.uniform(ceiling / 2, ceiling))
+
+
+def enqueue(user, place_id, rating, comment, idempotency_key=None):
+    """Stores a review for delivery, or returns the existing one for a repeated key."""
+    key = idempotency_key or uuid.uuid4().hex
+    now = datetime.utcnow()
+    review = Review(
+        place_id=place_id,
+        user=user,
+        rating=rating,
+        comment=comment,
+        created_at=now,
+        next_attempt_at=now,
+        idempotency_key=key,
+    )
+    try:
+        # The unique (user, idempotency_key) index decides between concurrent retries
+        review.save(force_insert=True)
+    except NotUniqueError:
+        return Review.objects(user=user, idempotency_key=key).first(), False
+    return review, True
+
+
+def claim_batch(limit=BATCH_SIZE, now=None):
+    """Atomically claims up to `limit` due reviews for this worker."""
+    now = now or datetime.utcnow()
+    due = {"$or": [
+        {"status": "PENDING", "next_attempt_at": {"$lte": now}},
+        {"status": "SENDING", "claimed_at": {"$lt": now - CLAIM_LEASE}},
+    ]}
+    collection = Review._get_collection()
+    ids = [doc["_id"] for doc in collection.find(due, {"_id": 1}).sort("next_attempt_at", 1).limit(limit)]
+    if not ids:
+        return []
+    # Another worker may have claimed some of these since the find; only keep ours
+    token = uuid.uuid4().hex
+    collection.update_many(
+        {"_id": {"$in": ids}, **due},
+        {"$set": {"status": "SENDING", "claim": token, "claimed_at": now}},
+    )
+    return prefetch(Review.objects(claim=token), 'user', only=('username',))
+
+
+def deliver(review):
+    lambda_client.submit_review({
+        "username": review.user.username,
+        "place_id": review.place_id,
+        "rating": review.rating,
+        "comment": review.comment,
+        "idempotency_key": review.idempotency_key,
+    }, idempotency_key=review.idempotency_key)
+
+
+def flush_batch(limit=BATCH_SIZE):
+    """Sends one batch and records the outcomes in one bulk write, plus one write per review given up on.
+
+    Returns the number of reviews that were claimed.
+    """
+    batch = claim_batch(limit)
+    if not batch:
+        return 0
+    now = datetime.utcnow()
+    collection = Review._get_collection()
+    updates = []
+    for review in batch:
+        try:
+            deliver(review)
+            change = {"status": "SENT", "sent_at": now, "last_error": None}
+        except Exception as e:
+            attempts = review.attempts + 1
+            change = {
+                "status": "FAILED" if attempts >= MAX_ATTEMPTS else "PENDING",
+                "attempts": attempts,
+                "next_attempt_at": now + backoff(attempts),
+                "last_error": str(e)[:500],
+            }
+        where = {"_id": review.id, "claim": review.claim}
+        update = {"$set": change, "$unset": {"claim": "", "claimed_at": ""}}
+        if change["status"] != "FAILED":
+            updates.append(UpdateOne(where, update))
+        # Giving up is rare; written on its own so the rating is only
+        # decremented by the worker that still held the claim
+        elif collection.update_one(where, update).modified_count:
+            # A review that was never delivered stops counting toward its place's rating
+            Place.record_rating(review.place_id, review.rating, -1)
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+    return len(batch)
+
+
+def flush_all(limit=BATCH_SIZE):
+    """Flushes batches until nothing is due. Returns the number of reviews processed."""
+    total = 0
+    while True:
+        processed = flush_batch(limit)
+        if not processed:
+            return total
+        total += processed
+
+
+class OutboxWorker:
+    """Background thread that drains the outbox, woken early by new reviews."""
+
+    def __init__(self, interval=IDLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.enabled = True
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get("REVIEW_OUTBOX_WORKER", True)
+        self.interval = app.config.get("REVIEW_OUTBOX_INTERVAL", IDLE_INTERVAL_SECONDS)
+        # Started by the first request each process serves, so reviews left
+        # pending by a restart are delivered without waiting for a new one;
+        # CLI commands and the pre-fork parent never start it
+        app.before_request(self.start)
+
+    def start(self):
+        if self.enabled:
+            self._ensure_started()
+
+    def notify(self):
+        if not self.enabled:
+            return
+        self._ensure_started()
+        self._wake.set()
+
+    def _ensure_started(self):
+        # Threads don't survive a fork, so each worker process starts its own
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="review-outbox", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                flush_all()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
+
+worker = OutboxWorker()
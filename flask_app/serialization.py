@@ -0,0 +1,123 @@
+# App-wide JSON encoding and decoding.
+#
+# Flask 2.0 has no pluggable JSON provider (that arrived in 2.2), so routes
+# import jsonify/request_json from here instead of from flask. orjson is used
+# when installed, with the stdlib json module as a fallback; both encode
+# datetime, ObjectId, Decimal and MongoEngine documents natively.
+import json
+from datetime import date
+from decimal import Decimal
+
+from bson import DBRef, ObjectId
+from flask import current_app, request
+from flask.json import JSONEncoder as FlaskJSONEncoder
+from mongoengine import Document
+from werkzeug.exceptions import BadRequest
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def document_json(document):
+    """A document's `json_fields` (or every field) with `id` first; references become ids."""
+    fields = getattr(document, "json_fields", None) or [f for f in document._fields if f != "id"]
+    data = {"id": document.pk}
+    for field in fields:
+        value = document._data.get(field)
+        if isinstance(value, DBRef):
+            value = value.id
+        elif isinstance(value, Document):
+            value = value.pk
+        data[field] = value
+    return data
+
+
+def default(obj):
+    """Encodes the non-JSON types the app returns."""
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        # Strings keep the exact value, as Flask's own encoder does
+        return str(obj)
+    if isinstance(obj, Document):
+        return document_json(obj)
+    if isinstance(obj, DBRef):
+        return str(obj.id)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """Stdlib encoder for flask.json users (tojson in templates, flask.jsonify)."""
+
+    def default(self, o):
+        try:
+            return default(o)
+        except TypeError:
+            return super().default(o)
+
+
+class JSONProvider:
+    """orjson-backed dumps/loads/response for the app, falling back to the stdlib."""
+
+    def __init__(self, app=None, use_orjson=True):
+        self.use_orjson = use_orjson and orjson is not None
+        self.sort_keys = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sort_keys = app.config.get("JSON_SORT_KEYS", True)
+        self.use_orjson = self.use_orjson and app.config.get("JSON_USE_ORJSON", True)
+        app.json_encoder = JSONEncoder
+        app.extensions["json_provider"] = self
+
+    def dumps_bytes(self, obj):
+        if self.use_orjson:
+            option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if self.sort_keys else 0)
+            return orjson.dumps(obj, default=default, option=option)
+        return json.dumps(
+            obj, default=default, sort_keys=self.sort_keys, separators=(",", ":"), ensure_ascii=False
+        ).encode()
+
+    def dumps(self, obj):
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, data):
+        if self.use_orjson:
+            return orjson.loads(data)
+        return json.loads(data)
+
+    def response(self, *args, **kwargs):
+        """Like flask.jsonify: one positional argument, several (a list) or keyword arguments."""
+        if args and kwargs:
+            raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+        data = args[0] if len(args) == 1 else (args or kwargs)
+        return current_app.response_class(
+            self.dumps_bytes(data) + b"\n", mimetype=current_app.config.get("JSONIFY_MIMETYPE", "application/json")
+        )
+
+
+def provider():
+    return current_app.extensions["json_provider"]
+
+
+def jsonify(*args, **kwargs):
+    return provider().response(*args, **kwargs)
+
+
+def request_json():
+    """The request body decoded by the app's provider, or None when it is empty.
+
+    Malformed JSON raises BadRequest, as request.get_json() does.
+    """
+    data = request.get_data(cache=True)
+    if not data:
+        return None
+    try:
+        return provider().loads(data)
+    except ValueError as e:
+        raise BadRequest(f"Failed to decode JSON object: {e}")
@@ -26,60 +26,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // Get both create log buttons
     var createLogBtnSidebar = document.getElementById('createLogBtnSidebar');
 
-    // Treatment options from your Python data
-    const TREATMENTS = {
-        "Metformin": {
-            "description": "Used to improve insulin resistance, which can help regulate menstrual cycles and ovulation."
-        },
-        "Clomiphene (Clomid)": {
-            "description": "An oral medication used to stimulate the pituitary gland to release hormones necessary to trigger ovulation."
-        },
-        "Letrozole (Femara)": {
-            "description": "An aromatase inhibitor used off-label to stimulate ovulation, often with fewer side effects than Clomiphene."
-        },
-        "Birth Control Pills": {
-            "description": "Combination pills used to regulate menstrual cycles, reduce androgen levels (acne, hair growth), and protect the uterine lining."
-        },
-        "Spironolactone": {
-            "description": "A diuretic that also blocks the effects of androgens, used primarily to treat hirsutism (excessive hair growth) and acne."
-        },
-        "Eflornithine cream (Vaniqa)": {
-            "description": "A prescription cream applied directly to the skin to slow down the growth of unwanted facial hair."
-        },
-        "Gonadotropins": {
-            "description": "Injectable hormones (FSH and LH) used when oral fertility medications fail to directly stimulate the ovaries to produce eggs."
-        },
-        "Progestin therapy": {
-            "description": "Progestin is taken periodically to induce a withdrawal bleed, protecting the uterus lining from the risk of endometrial hyperplasia."
-        },
-        "GLP-1 Receptor Agonists (e.g., Semaglutide)": {
-            "description": "Injectable drugs used for weight management and blood sugar control, which can improve PCOS metabolic outcomes."
-        },
-        "Diet modification": {
-            "description": "Focusing on low glycemic index (GI) foods, balanced carbohydrates, and healthy fats to manage blood sugar and insulin levels."
-        },
-        "Regular exercise": {
-            "description": "Physical activity that improves insulin sensitivity, supports weight management, and boosts mood."
-        },
-        "Weight management": {
-            "description": "Achieving and maintaining a healthy weight, which can significantly improve all PCOS symptoms, including hormonal balance and fertility."
-        },
-        "Myo-inositol": {
-            "description": "A B-vitamin-like substance that acts as an insulin sensitizer, helping to improve egg quality and menstrual regularity."
-        },
-        "D-chiro-inositol": {
-            "description": "Often combined with Myo-inositol, this supplement is part of the insulin signaling pathway and helps improve glucose metabolism."
-        },
-        "Vitamin D supplementation": {
-            "description": "Used to correct common deficiencies in PCOS patients; may improve insulin sensitivity and support ovarian function."
-        },
-        "Omega-3 fatty acids": {
-            "description": "Essential fats that help reduce inflammation and may improve lipid profiles and insulin resistance."
-        },
-        "Ovarian drilling": {
-            "description": "A laparoscopic surgery where small holes are made in the ovaries to reduce androgen production and sometimes trigger ovulation."
-        }
-    };
+    // Treatment options from constants.py, loaded by constants.js
+    const TREATMENTS = window.PCOS_CONSTANTS.TREATMENTS;
 
 
     var calendar = new FullCalendar.Calendar(calendarEl, {
@@ -92,8 +40,13 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Modified events function to handle toggle state
         events: function(fetchInfo, successCallback, failureCallback) {
-            // Pass the current toggle state to the server
-            fetch('/logs/data?show_treatments=' + showTreatmentNames)
+            // Pass the current toggle state and the visible range to the server
+            var params = new URLSearchParams({
+                show_treatments: showTreatmentNames,
+                start: fetchInfo.startStr,
+                end: fetchInfo.endStr
+            });
+            fetch('/logs/data?' + params.toString())
                 .then(response => response.json())
                 .then(data => successCallback(data))
                 .catch(error => failureCallback(error));
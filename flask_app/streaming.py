@@ -0,0 +1,34 @@
+# Streamed JSON array responses.
+#
+# jsonify() needs the whole list in memory and then its serialized copy. For
+# large results, stream_json_array() serializes items as the cursor yields them
+# and sends them out in chunks, so memory is bounded by one chunk.
+from flask import Response, stream_with_context
+
+from .serialization import provider
+
+CHUNK_ITEMS = 500
+
+
+def iter_json_array(items, chunk_items=CHUNK_ITEMS):
+    """Yields a JSON array of `items` as text chunks of up to `chunk_items` elements."""
+    # Same encoder as jsonify(), so clients see identical bytes
+    dumps = provider().dumps
+    buffer = []
+    separator = "["
+    for item in items:
+        buffer.append(separator)
+        buffer.append(dumps(item))
+        separator = ","
+        if len(buffer) >= 2 * chunk_items:
+            yield "".join(buffer)
+            buffer = []
+    if separator == "[":
+        buffer.append("[")
+    buffer.append("]\n")
+    yield "".join(buffer)
+
+
+def stream_json_array(items, chunk_items=CHUNK_ITEMS):
+    """A 200 response streaming `items` as a JSON array."""
+    return Response(stream_with_context(iter_json_array(items, chunk_items)), mimetype="application/json")
@@ -1,5 +1,20 @@
+import os
+import threading
+from contextlib import contextmanager
 import pytest
+import mongoengine
+import mongomock
+from mongomock.collection import Collection
+
+# config.py reads these at import time, so they must exist before the app is built
+os.environ.setdefault("MONGODB_HOST", "mongodb://localhost:27017/pcos_test")
+os.environ.setdefault("SECRET_KEY", "testing")
+# Tests drive the review outbox by hand; no thread polls it behind their back
+os.environ.setdefault("REVIEW_OUTBOX_WORKER", "false")
+
 from flask_app.run import app
+from flask_app.models import User
+from flask_app.extensions import page_cache
 # from unittest.mock import patch
 
 @pytest.fixture
@@ -7,3 +22,88 @@ def client():
     app.config['TESTING'] = True
     with app.test_client() as client:
         yield client
+
+
+@pytest.fixture
+def mock_db():
+    '''Swaps the default connection for an in-memory mongomock database.'''
+    mongoengine.disconnect()
+    conn = mongoengine.connect("pcos_test", mongo_client_class=mongomock.MongoClient)
+    # Cached pages were rendered from the previous test's data
+    page_cache.clear()
+    yield conn
+    conn.drop_database("pcos_test")
+    mongoengine.disconnect()
+
+
+@pytest.fixture
+def real_db():
+    '''A throwaway database on the real mongod at MONGODB_TEST_URI; skips when it is unset.'''
+    uri = os.environ.get("MONGODB_TEST_URI")
+    if not uri:
+        pytest.skip("MONGODB_TEST_URI is not set")
+    mongoengine.disconnect()
+    conn = mongoengine.connect(host=uri, serverSelectionTimeoutMS=2000)
+    db_name = mongoengine.get_db().name
+    conn.drop_database(db_name)
+    yield conn
+    conn.drop_database(db_name)
+    mongoengine.disconnect()
+
+
+@pytest.fixture
+def user(mock_db):
+    return User(username="tester", email="tester@example.com", password="hashed").save()
+
+
+@pytest.fixture
+def auth_client(client, user):
+    '''A test client whose session is already logged in as `user`.'''
+    app.config['WTF_CSRF_ENABLED'] = False
+    with client.session_transaction() as session:
+        session["_user_id"] = user.get_id()
+        session["_fresh"] = True
+    yield client
+
+
+# Collection methods that each cost one round-trip on a real server
+COUNTED_METHODS = [
+    "find", "find_one", "aggregate", "distinct", "count_documents",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "find_one_and_update", "bulk_write",
+]
+
+
+@pytest.fixture
+def max_queries(monkeypatch):
+    '''Fails the test when the wrapped block issues more than `limit` queries.
+
+        with max_queries(3):
+            client.get('/profile')
+    '''
+    state = threading.local()
+    issued = []
+
+    def counting(method):
+        def wrapper(self, *args, **kwargs):
+            # mongomock implements some methods on top of others; count the outermost call
+            if getattr(state, "depth", 0):
+                return method(self, *args, **kwargs)
+            issued.append(f"{method.__name__} {self.name}")
+            state.depth = 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                state.depth = 0
+        return wrapper
+
+    for name in COUNTED_METHODS:
+        monkeypatch.setattr(Collection, name, counting(getattr(Collection, name)))
+
+    @contextmanager
+    def guard(limit):
+        issued.clear()
+        yield issued
+        assert len(issued) <= limit, f"{len(issued)} queries (limit {limit}): {issued}"
+
+    return guard
@@ -0,0 +1,134 @@
+'''Tests for the ASGI entry point and the async Lambda client'''
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("a2wsgi")
+
+from benchmarks.stub_lambda import StubLambdaServer
+from flask_app import asgi, metrics
+from flask_app.async_client import AsyncLambdaClient
+from flask_app.extensions import lambda_client
+
+
+@pytest.fixture
+def stub():
+    with StubLambdaServer() as server:
+        yield server
+
+
+@pytest.fixture
+def async_lambda(mock_db, stub, monkeypatch):
+    monkeypatch.setattr(lambda_client, "find_url", stub.url)
+    limits = lambda_client.limits
+    lambda_client.set_limits(dict(limits, find=1))
+    monkeypatch.setattr(lambda_client, "timeout", 2)
+    lambda_client.reset_stats()
+    # httpx pools belong to one event loop; each test runs its own
+    client = AsyncLambdaClient(lambda_client)
+    monkeypatch.setattr(asgi, "async_lambda", client)
+    yield client
+    lambda_client.set_limits(limits)
+
+
+def run(*requests):
+    '''Sends (method, path, json) requests to the ASGI app concurrently.'''
+    async def main():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            try:
+                return await asyncio.gather(*(
+                    client.request(method, path, json=body) for method, path, body in requests
+                ))
+            finally:
+                await asgi.async_lambda.aclose()
+    return asyncio.run(main())
+
+
+def test_search_is_served_natively(async_lambda, stub):
+    (response,) = run(("POST", "/places/search", {"address": "Clinic Rd"}))
+
+    assert response.status_code == 200
+    assert response.json()["places"] == [{"name": "Clinic Rd"}]
+    # Cached for the sync path too
+    lambda_client.find_places("clinic rd")
+    assert stub.calls == 1
+
+
+def test_a_failing_store_hook_does_not_fail_the_search(async_lambda, stub, monkeypatch):
+    def broken(result):
+        raise TypeError("unexpected result shape")
+    monkeypatch.setattr(lambda_client, "on_search", broken)
+
+    (response,) = run(("POST", "/places/search", {"address": "Clinic Rd"}))
+    assert response.status_code == 200
+    assert response.json()["places"] == [{"name": "Clinic Rd"}]
+
+
+def test_native_searches_are_recorded_in_metrics(async_lambda, stub):
+    before = metrics.request_duration.series("places.search_place")[2]
+    run(("POST", "/places/search", {"address": "Clinic Rd"}))
+    assert metrics.request_duration.series("places.search_place")[2] == before + 1
+    assert metrics.db_commands.series("places.search_place")[2] == before + 1
+
+
+def test_concurrent_identical_searches_share_one_call(async_lambda, stub):
+    stub.delay = 0.2
+    responses = run(*[("POST", "/places/search", {"address": "Clinic Rd"})] * 3)
+    assert [r.status_code for r in responses] == [200, 200, 200]
+    assert stub.calls == 1
+    assert lambda_client.coalesced == 2
+
+
+def test_searches_queue_for_a_slot_within_the_queue_timeout(async_lambda, stub, monkeypatch):
+    monkeypatch.setattr(lambda_client, "queue_timeout", 1)
+    stub.delay = 0.2
+    responses = run(("POST", "/places/search", {"address": "one"}), ("POST", "/places/search", {"address": "two"}))
+    assert [r.status_code for r in responses] == [200, 200]
+
+
+def test_searches_may_take_the_whole_lambda_timeout(async_lambda, stub, monkeypatch):
+    # Slower than httpx's own 5 s default timeout
+    monkeypatch.setattr(lambda_client, "timeout", 8)
+    stub.delay = 5.5
+    (response,) = run(("POST", "/places/search", {"address": "Clinic Rd"}))
+    assert response.status_code == 200
+    assert response.json()["places"] == [{"name": "Clinic Rd"}]
+
+
+def test_full_limit_fails_fast(async_lambda, stub, monkeypatch):
+    monkeypatch.setattr(lambda_client, "timeout", 0.1)
+    stub.delay = 0.5
+    slow, busy = run(("POST", "/places/search", {"address": "one"}), ("POST", "/places/search", {"address": "two"}))
+
+    assert busy.status_code == 503 and busy.headers["Retry-After"] == "1"
+    assert slow.status_code == 500  # past its own deadline
+    assert lambda_client.rejected == 1
+
+
+def test_sync_and_async_searches_share_one_limit(async_lambda, stub):
+    lambda_client._slots["find"].acquire()   # a search in flight on a WSGI thread
+    try:
+        (busy,) = run(("POST", "/places/search", {"address": "one"}))
+    finally:
+        lambda_client._slots["find"].release()
+    assert busy.status_code == 503 and stub.calls == 0
+
+
+def test_malformed_upstream_body_is_a_json_error(async_lambda, stub):
+    stub.body = b"<html>Bad gateway</html>"
+    (response,) = run(("POST", "/places/search", {"address": "Clinic Rd"}))
+    assert response.status_code == 500
+    assert response.json()["error"].startswith("Failed to call Lambda")
+
+
+def test_invalid_search_body(async_lambda):
+    (response,) = run(("POST", "/places/search", {"address": " "}))
+    assert response.status_code == 400
+
+
+def test_other_routes_run_through_flask(async_lambda):
+    nearby, page = run(("GET", "/places/nearby?lat=x", None), ("GET", "/places", None))
+    assert nearby.status_code == 400
+    assert page.status_code == 200 and "text/html" in page.headers["Content-Type"]
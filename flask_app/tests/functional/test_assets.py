@@ -0,0 +1,83 @@
+'''Tests for fingerprinted static assets and the generated constants module'''
+import gzip
+import json
+import shutil
+
+import pytest
+
+from flask_app import constants
+from flask_app.assets import FINGERPRINTED, IMMUTABLE, build, hashed_name, render_constants_js
+from flask_app.extensions import assets
+from flask_app.run import app
+
+
+def asset_url(filename):
+    with app.test_request_context():
+        return assets.url(filename)
+
+
+@pytest.fixture
+def built_static(tmp_path, monkeypatch):
+    '''A copy of static/ with the build output, served in place of the real one.'''
+    for filename in FINGERPRINTED:
+        shutil.copy(f"{app.static_folder}/{filename}", tmp_path / filename)
+    build(str(tmp_path))
+    monkeypatch.setattr(assets, "static_dir", str(tmp_path))
+    return tmp_path
+
+
+def test_constants_js_is_up_to_date():
+    with open(f"{app.static_folder}/constants.js", encoding="utf-8") as f:
+        assert f.read() == render_constants_js(), "run `flask build-assets`"
+
+
+def test_constants_js_carries_constants_py():
+    script = render_constants_js()
+    values = json.loads(script[script.index("(") + 1:script.rindex(")")])
+    assert values == {"SYMPTOMS": constants.SYMPTOMS, "TREATMENTS": constants.TREATMENTS}
+
+
+def test_urls_are_content_hashed():
+    url = asset_url("logs.js")
+    with open(f"{app.static_folder}/logs.js", "rb") as f:
+        assert url == "/assets/" + hashed_name("logs.js", f.read())
+    assert asset_url("input.css") == "/static/input.css"
+
+
+def test_templates_use_hashed_urls(client):
+    body = client.get("/login").get_data(as_text=True)
+    assert asset_url("output.css") in body
+    assert "static/output.css" not in body
+
+
+def test_asset_is_immutable(client):
+    response = client.get(asset_url("logs.js"))
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == IMMUTABLE
+    assert response.mimetype in ("application/javascript", "text/javascript")
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert "Content-Encoding" not in response.headers
+
+
+def test_unknown_hash_is_not_found(client):
+    assert client.get("/assets/logs.000000000000.js").status_code == 404
+
+
+def test_precompressed_variant_is_served(client, built_static):
+    url = asset_url("output.css")
+    response = client.get(url, headers={"Accept-Encoding": "gzip, deflate"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Cache-Control"] == IMMUTABLE
+    assert response.mimetype == "text/css"
+    with open(built_static / "output.css", "rb") as f:
+        assert gzip.decompress(response.get_data()) == f.read()
+
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+
+
+def test_build_is_reproducible(built_static):
+    name = hashed_name("logs.js", (built_static / "logs.js").read_bytes())
+    first = (built_static / "dist" / (name + ".gz")).read_bytes()
+    build(str(built_static))
+    assert (built_static / "dist" / (name + ".gz")).read_bytes() == first
@@ -0,0 +1,92 @@
+'''Functional tests for the community treatment-outcome view'''
+from datetime import datetime
+import pytest
+from flask_app.run import app
+from flask_app.models import Insight, Problem, Treatment, TreatmentOutcome
+
+
+@pytest.fixture
+def pair(user):
+    problem = Problem(name="Acne", user=user).save()
+    treatment = Treatment(name="Spironolactone", user=user,
+                          start_date=datetime(2024, 1, 1), end_date=datetime(2024, 6, 1)).save()
+    return problem, treatment
+
+
+def add_insight(user, pair, status, content="note"):
+    problem, treatment = pair
+    return Insight(status=status, content=content, problem=problem, treatment=treatment, user=user).save()
+
+
+def outcome():
+    return TreatmentOutcome.objects(problem_name="Acne", treatment_name="Spironolactone").first()
+
+
+def test_insight_writes_keep_counters_current(user, pair):
+    first = add_insight(user, pair, "IMPROVED")
+    add_insight(user, pair, "IMPROVED")
+    add_insight(user, pair, "WORSENED")
+    assert outcome().counts == {"IMPROVED": 2, "WORSENED": 1}
+    assert outcome().total == 3
+
+    first = Insight.objects(id=first.id).first()
+    first.status = "NO_CHANGE"
+    first.save()
+    assert outcome().counts == {"IMPROVED": 1, "WORSENED": 1, "NO_CHANGE": 1}
+
+    first.delete()
+    assert outcome().counts["NO_CHANGE"] == 0
+    assert outcome().total == 2
+
+
+def test_saving_unrelated_fields_does_not_touch_counters(user, pair):
+    insight = add_insight(user, pair, "IMPROVED")
+    insight.content = "edited"
+    insight.save()
+    assert outcome().total == 1
+
+
+def test_rebuild_repairs_drifted_counters(user, pair):
+    add_insight(user, pair, "IMPROVED")
+    add_insight(user, pair, "WORSENED")
+    TreatmentOutcome.objects.update(set__total=99, set__counts={"IMPROVED": 42})
+
+    result = app.test_cli_runner().invoke(args=["rebuild-treatment-outcomes"])
+    assert "Rebuilt 1 problem/treatment pair(s)" in result.output
+    assert outcome().counts == {"IMPROVED": 1, "WORSENED": 1}
+    assert outcome().total == 2
+
+
+def test_community_page_reads_outcomes(client, user, pair):
+    add_insight(user, pair, "IMPROVED")
+    html = client.get('/community?problem=Acne').data.decode()
+    assert "Treatments for Acne" in html
+    assert "Spironolactone" in html
+    assert "100% Improved" in html
+    assert "Coming Soon" not in html
+
+
+def test_community_page_quotes_insights(client, user, pair):
+    add_insight(user, pair, "IMPROVED", content="Fewer breakouts")
+    add_insight(user, pair, "NO_CHANGE", content="Nothing changed")
+    html = client.get('/community?problem=Acne').data.decode()
+    assert "Qualitative Insights" in html and "Add Your Experience" in html
+    assert '"Fewer breakouts"' in html and "Nothing changed" not in html
+    assert "Insights Reported: 2" in html
+
+
+def test_renames_move_the_counters(auth_client, user, pair):
+    problem, treatment = pair
+    add_insight(user, pair, "IMPROVED")
+    add_insight(user, pair, "WORSENED")
+
+    assert auth_client.put(f'/treatments/{treatment.id}', json={"name": "Spiro"}).get_json()["success"]
+    assert outcome().total == 0
+    moved = TreatmentOutcome.objects.get(problem_name="Acne", treatment_name="Spiro")
+    assert (moved.counts, moved.total) == ({"IMPROVED": 1, "WORSENED": 1}, 2)
+
+    problem.name = "Adult acne"
+    problem.save()
+    moved = TreatmentOutcome.objects.get(problem_name="Adult acne", treatment_name="Spiro")
+    assert moved.total == 2
+    assert TreatmentOutcome.objects.get(problem_name="Acne", treatment_name="Spiro").total == 0
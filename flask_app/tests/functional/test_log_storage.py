@@ -0,0 +1,176 @@
+'''Tests for the bucketed Log layout and the migration between layouts'''
+from datetime import datetime
+
+import pytest
+
+from flask_app.run import app
+from flask_app.logs import storage
+from flask_app.logs.stats import cycle_stats, monthly_counts
+from flask_app.models import Log, LogBucket, Problem, User
+
+
+@pytest.fixture
+def buckets(monkeypatch):
+    monkeypatch.setitem(app.config, "LOG_STORAGE", "buckets")
+
+
+def post_log(client, start, end, **fields):
+    response = client.post('/logs', json={"start_date": start, "end_date": end, **fields})
+    assert response.get_json()["success"]
+    return response.get_json()["id"]
+
+
+def seed_documents(user):
+    acne = Problem(user=user, name="Acne").save()
+    return [
+        Log(user=user, start_date=datetime(2024, 2, 27), end_date=datetime(2024, 3, 2)).save(),
+        Log(user=user, type="Treatment", treatment_name="Metformin", description="500mg",
+            start_date=datetime(2024, 3, 10), end_date=datetime(2024, 3, 11)).save(),
+        Log(user=user, type="Event", problem=acne,
+            start_date=datetime(2024, 3, 20), end_date=datetime(2024, 3, 21)).save(),
+        Log(user=user, start_date=datetime(2024, 5, 1), end_date=datetime(2024, 5, 3)).save(),
+    ]
+
+
+def test_writes_pack_logs_into_monthly_buckets(auth_client, user, buckets):
+    first = post_log(auth_client, "2024-03-01T00:00", "2024-03-05T00:00")
+    post_log(auth_client, "2024-03-20T00:00", "2024-03-21T00:00", type="Event", description="cramps")
+    post_log(auth_client, "2024-04-02T00:00", "2024-04-03T00:00")
+
+    assert Log.objects.count() == 0
+    march = LogBucket._get_collection().find_one({"month": datetime(2024, 3, 1)})
+    assert march["count"] == 2
+    assert [e["_id"] for e in march["entries"]][0] == storage.ObjectId(first)
+    assert march["entries"][1] == {
+        "_id": march["entries"][1]["_id"], "t": "Event", "d": "cramps", "n": "",
+        "s": datetime(2024, 3, 20), "e": datetime(2024, 3, 21),
+    }
+    assert LogBucket.objects.count() == 2
+
+
+def test_logs_data_reads_only_overlapping_buckets(auth_client, user, buckets):
+    spanning = post_log(auth_client, "2024-02-27T00:00", "2024-03-02T00:00")
+    inside = post_log(auth_client, "2024-03-10T00:00", "2024-03-14T00:00")
+    post_log(auth_client, "2024-01-05T00:00", "2024-01-09T00:00")
+    post_log(auth_client, "2024-05-01T00:00", "2024-05-03T00:00")
+
+    query = storage.BucketStore.bucket_match(user, datetime(2024, 3, 1), datetime(2024, 4, 1))
+    assert LogBucket.objects(__raw__=query).count() == 2   # February and March
+
+    response = auth_client.get('/logs/data?start=2024-03-01&end=2024-04-01&show_treatments=true')
+    assert {event["id"] for event in response.get_json()} == {spanning, inside}
+    assert len(auth_client.get('/logs/data').get_json()) == 4
+
+
+def test_updates_edit_entries_in_place_or_move_them(auth_client, user, buckets):
+    log_id = post_log(auth_client, "2024-03-01T00:00", "2024-03-05T00:00")
+
+    auth_client.put(f'/logs/{log_id}', json={"description": "heavy"})
+    (entry,) = LogBucket.objects.get(month=datetime(2024, 3, 1)).entries
+    assert entry.description == "heavy" and str(entry.id) == log_id
+
+    auth_client.put(f'/logs/{log_id}', json={"start_date": "2024-04-01T00:00", "end_date": "2024-04-04T00:00"})
+    (bucket,) = LogBucket.objects
+    assert bucket.month == datetime(2024, 4, 1) and bucket.count == 1
+    assert bucket.entries[0].description == "heavy"
+
+    assert auth_client.delete(f'/logs/{log_id}').get_json()["success"]
+    assert LogBucket.objects.count() == 0
+    assert auth_client.delete(f'/logs/{log_id}').status_code == 404
+
+
+def test_a_move_interrupted_before_the_pull_keeps_the_entry(auth_client, user, buckets, monkeypatch):
+    log_id = post_log(auth_client, "2024-03-01T00:00", "2024-03-05T00:00")
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("connection lost")
+    monkeypatch.setattr(storage.BucketStore, "_pull", fail)
+    response = auth_client.put(f'/logs/{log_id}', json={"start_date": "2024-04-01T00:00", "end_date": "2024-04-04T00:00"})
+    assert response.status_code == 500
+    monkeypatch.undo()
+    monkeypatch.setitem(app.config, "LOG_STORAGE", "buckets")
+
+    ids = [e.id for bucket in LogBucket.objects for e in bucket.entries]
+    assert [str(i) for i in ids] == [log_id, log_id]
+    # The next edit of the log leaves a single copy
+    auth_client.put(f'/logs/{log_id}', json={"description": "heavy"})
+    (bucket,) = LogBucket.objects
+    assert [(str(e.id), e.description) for e in bucket.entries] == [(log_id, "heavy")]
+
+
+def test_other_users_entries_are_not_found(auth_client, user, buckets):
+    other = storage.BucketStore()
+    log = Log(user=storage.ObjectId(), start_date=datetime(2024, 3, 1), end_date=datetime(2024, 3, 2))
+    other.save(log)
+    assert auth_client.put(f'/logs/{log.id}', json={"description": "x"}).status_code == 404
+
+
+def rows(store, user):
+    found = store.find(user, fields=("user", *storage.LOG_FIELDS))
+    return sorted(({k: v for k, v in row.items() if v is not None} for row in found), key=lambda r: r["_id"])
+
+
+def test_migration_round_trip(user):
+    seed_documents(user)
+    expected = rows(storage.log_store("documents"), user)
+
+    assert storage.migrate_to_buckets(delete_source=True) == (4, 3)
+    assert Log.objects.count() == 0
+    assert rows(storage.log_store("buckets"), user) == expected
+
+    assert storage.migrate_to_documents(delete_source=True) == (4, 3)
+    assert LogBucket.objects.count() == 0
+    assert rows(storage.log_store("documents"), user) == expected
+
+
+def test_migration_can_be_rerun(user):
+    seed_documents(user)
+    storage.migrate_to_buckets()
+    storage.migrate_to_buckets()
+    assert LogBucket.objects.count() == 3
+    assert sum(bucket.count for bucket in LogBucket.objects) == Log.objects.count() == 4
+
+
+def test_profile_and_stats_read_buckets(auth_client, user, monkeypatch):
+    seed_documents(user)
+    monkeypatch.setitem(app.config, "LOG_STORAGE", "documents")
+    with app.app_context():
+        expected = monthly_counts(user, datetime(2024, 3, 1), datetime(2024, 4, 1))
+        storage.migrate_to_buckets(delete_source=True)
+        monkeypatch.setitem(app.config, "LOG_STORAGE", "buckets")
+        assert monthly_counts(user, datetime(2024, 3, 1), datetime(2024, 4, 1)) == expected
+    assert [row["month"] for row in expected] == ["2024-02", "2024-03"]
+
+    treatments = auth_client.get('/profile/data').get_json()["treatments"]
+    assert [t["treatment_name"] for t in treatments] == ["Metformin"]
+
+
+def test_cycle_stats_match_across_layouts(real_db, monkeypatch):
+    user = User(username="layouts", email="layouts@example.com", password="x").save()
+    day = datetime(2023, 1, 2)
+    for i in range(12):
+        Log(user=user, start_date=day, end_date=day.replace(day=day.day + 4)).save()
+        day = datetime(day.year + (day.month == 12), day.month % 12 + 1, 2 + i % 5)
+
+    monkeypatch.setitem(app.config, "LOG_STORAGE", "documents")
+    with app.app_context():
+        expected = cycle_stats(user)
+        storage.migrate_to_buckets(delete_source=True)
+        monkeypatch.setitem(app.config, "LOG_STORAGE", "buckets")
+        assert cycle_stats(user) == expected
+    assert expected["cycle_length"]["count"] == 11
+
+
+def test_unknown_layout_is_rejected():
+    with pytest.raises(ValueError):
+        storage.log_store("rows")
+
+
+def test_migrate_command(user):
+    seed_documents(user)
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["migrate-log-storage", "buckets", "--delete-source"])
+    assert "Packed 4 log(s) into 3 bucket(s)." in result.output
+    result = runner.invoke(args=["migrate-log-storage", "documents"])
+    assert "Unpacked 4 log(s) from 3 bucket(s)." in result.output
+    assert Log.objects.count() == 4 and LogBucket.objects.count() == 3
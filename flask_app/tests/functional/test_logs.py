@@ -1 +1,92 @@
-'''Functional tests for logs ( ノ・・)ノ'''
\ No newline at end of file
+'''Functional tests for logs ( ノ・・)ノ'''
+from datetime import datetime
+from flask_app.models import Log
+
+
+def make_log(user, start, end, type="Period", **kwargs):
+    return Log(user=user, type=type, start_date=start, end_date=end, **kwargs).save()
+
+
+def test_logs_data_returns_only_logs_in_window(auth_client, user):
+    inside = make_log(user, datetime(2024, 3, 10), datetime(2024, 3, 14))
+    spanning = make_log(user, datetime(2024, 2, 27), datetime(2024, 3, 2))
+    make_log(user, datetime(2024, 1, 5), datetime(2024, 1, 9))
+    make_log(user, datetime(2024, 5, 1), datetime(2024, 5, 3))
+
+    response = auth_client.get(
+        '/logs/data?start=2024-02-25T00:00:00-05:00&end=2024-04-07T00:00:00-05:00'
+    )
+    assert response.status_code == 200
+    ids = {event["id"] for event in response.get_json()}
+    assert ids == {str(inside.id), str(spanning.id)}
+
+
+def test_logs_data_without_range_returns_everything(auth_client, user):
+    make_log(user, datetime(2024, 1, 5), datetime(2024, 1, 9))
+    make_log(user, datetime(2024, 5, 1), datetime(2024, 5, 3))
+
+    response = auth_client.get('/logs/data')
+    assert len(response.get_json()) == 2
+
+
+def test_logs_data_rejects_bad_range(auth_client):
+    response = auth_client.get('/logs/data?start=yesterday')
+    assert response.status_code == 400
+
+
+def test_log_declares_calendar_index():
+    assert ('user', 'start_date', 'end_date') in Log._meta['indexes']
+
+
+def test_logs_data_revalidates_with_etag(auth_client, user, mocker):
+    make_log(user, datetime(2024, 3, 10), datetime(2024, 3, 14))
+    first = auth_client.get('/logs/data?show_treatments=false')
+    etag = first.headers["ETag"]
+    assert "no-cache" in first.headers["Cache-Control"]
+
+    objects = mocker.patch("flask_app.logs.routes.Log.objects")
+    cached = auth_client.get('/logs/data?show_treatments=false', headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert not objects.called
+    mocker.stopall()
+
+    # Another representation of the same data has its own tag
+    other = auth_client.get('/logs/data?show_treatments=true', headers={"If-None-Match": etag})
+    assert other.status_code == 200
+
+
+def test_log_writes_change_the_etag(auth_client):
+    etag = auth_client.get('/logs/data').headers["ETag"]
+    auth_client.post('/logs', json={"start_date": "2024-03-01T00:00", "end_date": "2024-03-02T00:00"})
+
+    response = auth_client.get('/logs/data', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.headers["Last-Modified"]
+
+
+def test_streamed_logs_data_matches_buffered_output(auth_client, user):
+    for day in range(1, 8):
+        make_log(user, datetime(2024, 1, day), datetime(2024, 1, day + 1), description=f"day {day}")
+    make_log(user, datetime(2024, 2, 1), datetime(2024, 2, 2), type="Treatment", treatment_name="Metformin")
+
+    streamed = auth_client.get('/logs/data?show_treatments=true')
+    # A streamed body has no length up front
+    assert 'Content-Length' not in streamed.headers
+    auth_client.application.config["STREAM_JSON"] = False
+    try:
+        buffered = auth_client.get('/logs/data?show_treatments=true')
+    finally:
+        auth_client.application.config["STREAM_JSON"] = True
+    assert 'Content-Length' in buffered.headers
+    assert streamed.data == buffered.data
+    assert streamed.headers["ETag"] == buffered.headers["ETag"]
+
+
+def test_stream_json_array_chunks(client):
+    from flask_app.streaming import iter_json_array
+    with client.application.app_context():
+        assert "".join(iter_json_array([])) == "[]\n"
+        chunks = list(iter_json_array(({"n": i} for i in range(5)), chunk_items=2))
+    assert len(chunks) == 3
+    assert "".join(chunks) == '[{"n":0},{"n":1},{"n":2},{"n":3},{"n":4}]\n'
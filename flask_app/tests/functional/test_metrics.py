@@ -0,0 +1,50 @@
+'''Functional tests for request metrics'''
+import logging
+from types import SimpleNamespace
+
+from flask import Response
+from flask_app.run import app
+from flask_app import metrics
+
+
+def command_events(request_id, name, collection, micros):
+    started = SimpleNamespace(request_id=request_id, command_name=name,
+                              command={name: collection}, database_name="pcos")
+    finished = SimpleNamespace(request_id=request_id, command_name=name, duration_micros=micros)
+    return started, finished
+
+
+def test_metrics_endpoint_exposes_histograms_per_endpoint(client):
+    client.get('/')
+    body = client.get('/metrics').data.decode()
+
+    assert "# TYPE pcos_request_duration_seconds histogram" in body
+    assert 'pcos_request_duration_seconds_count{endpoint="users.home"}' in body
+    assert 'pcos_request_db_commands_bucket{endpoint="users.home",le="+Inf"}' in body
+
+
+def test_commands_are_attributed_to_the_request(caplog):
+    app.config["SLOW_REQUEST_MS"] = 0.0001
+    try:
+        with app.test_request_context('/logs/data'), caplog.at_level(logging.WARNING):
+            metrics.start_request()
+            for started, finished in [command_events(1, "find", "log", 2000),
+                                      command_events(2, "find", "user", 15000)]:
+                metrics.listener.started(started)
+                metrics.listener.succeeded(finished)
+            assert metrics.g.db_stats["count"] == 2
+            metrics.finish_request(Response())
+    finally:
+        app.config["SLOW_REQUEST_MS"] = 500
+
+    assert "2 queries" in caplog.text
+    assert "slowest: find user 15.0 ms" in caplog.text
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("h", "help", (1, 5, 10))
+    for value in (0.5, 3, 7, 20):
+        histogram.observe("x", value)
+    counts, total, count = histogram.series("x")
+    assert counts == [1, 2, 3]
+    assert (total, count) == (30.5, 4)
@@ -0,0 +1,87 @@
+'''Tests for MongoClient pooling and fork handling'''
+import os
+import threading
+
+import mongoengine
+from pymongo import monitoring
+
+from flask_app.models import User
+from flask_app.mongo import reset_after_fork
+from flask_app.run import app
+
+
+class ConnectionCounter(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.created = 0
+        self._lock = threading.Lock()
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_check_out_failed(self, event): pass
+    def connection_checked_out(self, event): pass
+    def connection_checked_in(self, event): pass
+
+
+def connect_with_app_settings(alias, **overrides):
+    settings = dict(app.config["MONGODB_SETTINGS"], **overrides)
+    host = settings.pop("host", os.environ["MONGODB_HOST"])
+    return mongoengine.connect(alias=alias, host=host, **settings)
+
+
+def test_pool_settings_reach_the_client():
+    # connect=False: nothing is opened, so this needs no server
+    client = connect_with_app_settings("settings-check", maxPoolSize=7, maxIdleTimeMS=1500)
+    try:
+        assert client.options.pool_options.max_pool_size == 7
+        assert client.options.pool_options.max_idle_time_seconds == 1.5
+        assert client.options.server_selection_timeout == app.config["MONGODB_SETTINGS"]["serverSelectionTimeoutMS"] / 1000
+        assert not client.nodes
+    finally:
+        mongoengine.disconnect("settings-check")
+
+
+def test_reset_after_fork_reconnects_with_the_same_settings(user):
+    inherited = mongoengine.get_connection()
+    assert User._get_collection().database.client is inherited
+    reset_after_fork()
+    fresh = mongoengine.get_connection()
+    assert fresh is not inherited
+    # Documents query through the new client, not one cached from before
+    assert User._get_collection().database.client is fresh
+
+
+def test_reset_after_fork_keeps_the_data_reachable(real_db):
+    User(username="forked", email="forked@example.com", password="x").save()
+    reset_after_fork()
+    assert User.objects(username="forked").count() == 1
+
+
+def test_concurrent_load_opens_at_most_max_pool_size_connections(real_db):
+    counter = ConnectionCounter()
+    mongoengine.disconnect()
+    connect_with_app_settings(
+        mongoengine.DEFAULT_CONNECTION_NAME,
+        host=os.environ["MONGODB_TEST_URI"], maxPoolSize=4, event_listeners=[counter],
+    )
+    User(username="pooled", email="pooled@example.com", password="x").save()
+
+    def requests():
+        for _ in range(25):
+            User.objects(username="pooled").first()
+
+    threads = [threading.Thread(target=requests) for _ in range(32)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert 1 <= counter.created <= 4
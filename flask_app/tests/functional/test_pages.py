@@ -0,0 +1,105 @@
+'''Tests for the anonymous page cache, fragment cache and Jinja bytecode cache'''
+import os
+import pickle
+from unittest.mock import patch
+
+import pytest
+from jinja2 import FileSystemBytecodeCache
+
+from flask_app.extensions import page_cache
+from flask_app.pages import FileBackend, UnsafeCacheDirectory
+from flask_app.run import app
+
+
+def test_anonymous_page_is_replayed(client, mock_db):
+    first = client.get('/places')
+    assert first.headers["X-Page-Cache"] == "MISS"
+    with patch("flask_app.places.routes.render_template") as render:
+        second = client.get('/places')
+    render.assert_not_called()
+    assert second.headers["X-Page-Cache"] == "HIT"
+    assert second.data == first.data
+
+
+def test_query_strings_are_cached_separately(client, mock_db):
+    client.get('/community?problem=Acne')
+    assert client.get('/community?problem=Acne').headers["X-Page-Cache"] == "HIT"
+    assert client.get('/community?problem=Hair').headers["X-Page-Cache"] == "MISS"
+
+
+def test_not_found_pages_share_one_entry(client, mock_db):
+    assert client.get('/missing-one').status_code == 404
+    response = client.get('/missing-two')
+    assert response.status_code == 404
+    assert response.headers["X-Page-Cache"] == "HIT"
+
+
+def test_logged_in_users_bypass_the_cache(client, auth_client):
+    anonymous = app.test_client().get('/places')
+    assert "Login" in anonymous.data.decode()
+
+    response = auth_client.get('/places')
+    assert "X-Page-Cache" not in response.headers
+    html = response.data.decode()
+    # The anonymous header fragment must not leak into logged-in pages
+    assert "Logout" in html
+    assert 'href="/login"' not in html
+
+
+def test_remember_cookie_bypasses_the_cache(client, mock_db):
+    client.get('/places')
+    client.set_cookie("localhost", "remember_token", "someone")
+    assert "X-Page-Cache" not in client.get('/places').headers
+
+
+def test_fragments_render_once(client, mock_db):
+    client.get('/places')
+    assert set(page_cache.fragments._entries) == {"header", "base-head", "base-footer"}
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    directory = tmp_path / "pages"
+    directory.mkdir(mode=0o700)
+    return str(directory)
+
+
+def test_file_backend_is_shared_between_workers(cache_dir):
+    writer, reader = FileBackend(cache_dir, ttl=60), FileBackend(cache_dir, ttl=60)
+    writer.set("page:/", (b"<html>", 200, [("Content-Type", "text/html")]))
+    assert reader.get("page:/") == (b"<html>", 200, [("Content-Type", "text/html")])
+
+
+def test_file_backend_refuses_a_shared_directory(tmp_path):
+    os.chmod(tmp_path, 0o777)
+    with pytest.raises(UnsafeCacheDirectory):
+        FileBackend(str(tmp_path))
+
+
+def test_file_backend_ignores_planted_entries(cache_dir):
+    backend = FileBackend(cache_dir, ttl=60)
+    with open(backend._path("page:/"), "wb") as f:
+        f.write(pickle.dumps((10**12, (b"x", 200, []))))
+    assert backend.get("page:/") is None
+
+
+def test_file_backend_is_bounded(cache_dir):
+    backend = FileBackend(cache_dir, ttl=60, maxsize=3)
+    for i in range(10):
+        backend.set(f"page:/places?x={i}", (b"<html>", 200, []))
+    assert len(os.listdir(cache_dir)) == 3
+
+
+def test_file_backend_entries_expire(cache_dir):
+    writer, reader = FileBackend(cache_dir, ttl=60), FileBackend(cache_dir, ttl=60)
+    writer.set("page:/", (b"<html>", 200, []))
+    assert reader.get("page:/") == (b"<html>", 200, [])
+
+    with patch("flask_app.pages.time.time", return_value=10**12):
+        assert reader.get("page:/") is None
+    reader.clear()
+    assert writer.get("page:/") is None
+
+
+def test_templates_use_bytecode_cache():
+    assert isinstance(app.jinja_env.bytecode_cache, FileSystemBytecodeCache)
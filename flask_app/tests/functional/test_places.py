@@ -0,0 +1,419 @@
+'''Functional tests for the places Lambda proxy'''
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from datetime import datetime, timedelta
+
+import pytest
+from flask_app.client import LambdaBusy, LambdaClient
+from flask_app.extensions import lambda_client
+from flask_app.models import Place, Review, User
+from flask_app.places import store
+from flask_app.reviews import outbox
+from flask_app.run import app
+
+
+class StubLambda(BaseHTTPRequestHandler):
+    '''Answers find_places with a single fake result after `delay` seconds.'''
+    calls = []
+    headers_seen = []
+    delay = 0.0
+    status = 200
+    payload = None
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).calls.append((self.path, body))
+        type(self).headers_seen.append(dict(self.headers))
+        time.sleep(type(self).delay)
+        payload = type(self).payload or {"places": [{"name": body.get("reference")}]}
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload).encode()
+        self.send_response(type(self).status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    StubLambda.calls, StubLambda.headers_seen = [], []
+    StubLambda.delay, StubLambda.status, StubLambda.payload = 0.0, 200, None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLambda)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def shared_stub(stub_url, monkeypatch):
+    '''Points the app's shared lambda_client at the stub, with an empty cache, for one test.'''
+    monkeypatch.setattr(lambda_client, "find_url", stub_url)
+    lambda_client.reset_stats()
+    yield stub_url
+    lambda_client.reset_stats()
+
+
+@pytest.fixture
+def stub_client(stub_url):
+    return LambdaClient(find_url=stub_url, review_url=stub_url, timeout=5)
+
+
+def test_repeat_searches_are_served_from_cache(stub_client):
+    stub_client.find_places("123 Main St")
+    result = stub_client.find_places("  123   MAIN st ")
+
+    assert result == {"places": [{"name": "123 Main St"}]}
+    assert len(StubLambda.calls) == 1
+    assert stub_client.stats()["hits"] == 1
+    assert stub_client.stats()["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used(stub_url):
+    client = LambdaClient(find_url=stub_url, cache_size=2)
+    for address in ["a", "b", "a", "c", "a", "b"]:
+        client.find_places(address)
+    # "b" was evicted by "c", "a" stayed hot
+    assert [body["reference"] for _, body in StubLambda.calls] == ["a", "b", "c", "b"]
+
+
+def test_cache_entries_expire(stub_url):
+    client = LambdaClient(find_url=stub_url, cache_ttl=0.05)
+    client.find_places("clinic")
+    time.sleep(0.1)
+    client.find_places("clinic")
+    assert len(StubLambda.calls) == 2
+
+
+def test_concurrent_identical_searches_share_one_call(stub_client):
+    StubLambda.delay = 0.2
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(stub_client.find_places("clinic")))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(StubLambda.calls) == 1
+    assert len(results) == 8
+    assert stub_client.stats()["coalesced"] == 7
+
+
+def test_upstream_errors_are_not_cached(stub_client):
+    StubLambda.status = 502
+    with pytest.raises(Exception):
+        stub_client.find_places("clinic")
+    StubLambda.status = 200
+    assert stub_client.find_places("clinic")["places"]
+    assert len(StubLambda.calls) == 2
+
+
+def test_malformed_upstream_body_is_a_lambda_error(client, shared_stub):
+    StubLambda.payload = b"<html>Bad gateway</html>"
+
+    response = client.post('/places/search', json={"address": "Clinic Rd"})
+    assert response.status_code == 500
+    assert response.get_json()["error"].startswith("Failed to call Lambda")
+    assert lambda_client.stats()["cached_searches"] == 0
+
+
+def test_full_concurrency_limit_fails_fast(stub_url):
+    # The call deadline doesn't apply to the wait for a slot
+    client = LambdaClient(find_url=stub_url, timeout=10, limits={"find": 1})
+    client._slots["find"].acquire()   # one slow search in flight
+    started = time.monotonic()
+    with pytest.raises(LambdaBusy):
+        client.find_places("clinic")
+    assert time.monotonic() - started < 0.5
+    assert client.stats()["rejected"] == 1 and StubLambda.calls == []
+
+    client._slots["find"].release()
+    assert client.find_places("clinic")["places"]
+
+
+def test_queue_timeout_waits_for_a_slot(stub_url):
+    client = LambdaClient(find_url=stub_url, limits={"find": 1}, queue_timeout=2)
+    client._slots["find"].acquire()
+    threading.Timer(0.1, client._slots["find"].release).start()
+    assert client.find_places("clinic")["places"]
+    assert client.stats()["rejected"] == 0
+
+
+def test_busy_search_is_a_503(client, monkeypatch):
+    def busy(address):
+        raise LambdaBusy("8 find calls already in flight")
+    monkeypatch.setattr(lambda_client, "find_places", busy)
+
+    response = client.post('/places/search', json={"address": "Clinic Rd"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_search_route_uses_the_shared_client(client, shared_stub):
+
+    assert client.post('/places/search', json={"address": "Clinic Rd"}).status_code == 200
+    client.post('/places/search', json={"address": "clinic rd"})
+
+    stats = client.get('/places/search/stats').get_json()
+    assert stats["hits"] == 1 and stats["upstream_calls"] == 1
+    assert client.post('/places/search', json={"address": " "}).status_code == 400
+
+
+def lambda_place(place_id, lat, lng):
+    return {"place_id": place_id, "name": f"Clinic {place_id}", "formatted_address": "1 Main St",
+            "geometry": {"location": {"lat": lat, "lng": lng}}, "google_rating": 4.5}
+
+
+SEARCH_RESULT = {"results": [lambda_place("A", 38.9000, -77.0000), lambda_place("B", 38.9040, -77.0000)]}
+
+
+@pytest.fixture
+def places_stub(mock_db, shared_stub):
+    StubLambda.payload = SEARCH_RESULT
+    return StubLambda
+
+
+@pytest.fixture
+def local_nearby(monkeypatch):
+    # mongomock has no $near; every stored place counts as nearby
+    monkeypatch.setattr(store, "nearby", lambda lat, lng, radius: list(Place.objects.order_by("place_id").as_pymongo()))
+
+
+def test_search_results_are_stored(client, places_stub):
+    client.post('/places/search', json={"address": "Clinic Rd"})
+    fetched = Place.objects.get(place_id="A").fetched_at
+    client.post('/places/search', json={"address": "clinic rd"})
+
+    assert Place.objects.count() == 2
+    place = Place.objects.get(place_id="A")
+    assert place.location["coordinates"] == [-77.0, 38.9]
+    # The cached repeat search doesn't write again
+    assert place.fetched_at == fetched
+
+
+def test_a_failing_store_hook_does_not_fail_the_search(client, places_stub, monkeypatch):
+    def broken(result):
+        raise TypeError("unexpected result shape")
+    monkeypatch.setattr(lambda_client, "on_search", broken)
+
+    for _ in range(2):
+        response = client.post('/places/search', json={"address": "Clinic Rd"})
+        assert response.status_code == 200
+        assert [p["place_id"] for p in response.get_json()["results"]] == ["A", "B"]
+    assert len(places_stub.calls) == 1
+
+
+def test_remember_is_best_effort(mock_db, monkeypatch):
+    def broken(*args, **kwargs):
+        raise TypeError("unexpected result shape")
+    monkeypatch.setattr(Place, "_get_collection", broken)
+    with app.app_context():
+        assert store.remember(SEARCH_RESULT) == 0
+
+
+def test_nearby_serves_fresh_places_locally(client, places_stub, local_nearby):
+    store.remember(SEARCH_RESULT)
+    response = client.get('/places/nearby?lat=38.9&lng=-77&radius=1000')
+
+    body = response.get_json()
+    assert body["source"] == "local"
+    assert body["results"] == [store.place_json(p) for p in Place.objects.order_by("place_id").as_pymongo()]
+    assert body["results"][0]["geometry"]["location"] == {"lat": 38.9, "lng": -77.0}
+    assert places_stub.calls == []
+
+
+def test_nearby_refreshes_stale_places(client, places_stub, local_nearby):
+    store.remember(SEARCH_RESULT, now=datetime.utcnow() - timedelta(days=30))
+    body = client.get('/places/nearby?lat=38.9&lng=-77').get_json()
+
+    assert body["source"] == "lambda"
+    assert places_stub.calls[0][1] == {"reference": "38.9,-77.0"}
+    assert Place.objects.get(place_id="A").fetched_at > datetime.utcnow() - timedelta(minutes=1)
+
+
+def test_nearby_falls_back_to_stale_places(client, places_stub, local_nearby):
+    store.remember(SEARCH_RESULT, now=datetime.utcnow() - timedelta(days=30))
+    places_stub.status = 500
+    body = client.get('/places/nearby?lat=38.9&lng=-77').get_json()
+    assert body["source"] == "stale" and len(body["results"]) == 2
+
+
+@pytest.mark.parametrize("query", ["lat=38.9", "lat=x&lng=1", "lat=91&lng=0", "lat=0&lng=0&radius=0",
+                                   "lat=0&lng=0&radius=100000"])
+def test_nearby_validates_coordinates(client, query):
+    assert client.get(f'/places/nearby?{query}').status_code == 400
+
+
+def test_nearby_query_uses_the_2dsphere_index(real_db):
+    Place.ensure_indexes()
+    store.remember({"results": [lambda_place("near", 38.9030, -77.0), lambda_place("far", 38.95, -77.0)]})
+
+    # About 330 m and 5.5 km from the centre
+    assert [p["place_id"] for p in store.nearby(38.9, -77.0, 1000)] == ["near"]
+    assert [p["place_id"] for p in store.nearby(38.9, -77.0, 10000)] == ["near", "far"]
+
+
+@pytest.fixture
+def review_outbox(stub_url, monkeypatch):
+    # Tests drive the outbox by hand instead of through the worker thread
+    monkeypatch.setattr(outbox.worker, "enabled", False)
+    monkeypatch.setattr(lambda_client, "review_url", stub_url)
+    return outbox
+
+
+def post_review(client, key=None, **overrides):
+    body = {"place_id": "ChIJ123", "rating": 4, "comment": "Kind staff"}
+    body.update(overrides)
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post('/places/review', json=body, headers=headers)
+
+
+def test_review_is_accepted_without_calling_upstream(auth_client, review_outbox):
+    StubLambda.delay = 0.5
+    response = post_review(auth_client)
+
+    assert response.status_code == 202
+    assert response.get_json()["status"] == "PENDING"
+    assert StubLambda.calls == []
+    assert Review.objects(status="PENDING").count() == 1
+
+
+def test_repeated_idempotency_key_stores_one_review(auth_client, review_outbox):
+    first = post_review(auth_client, key="abc")
+    second = post_review(auth_client, key="abc")
+    assert first.get_json()["id"] == second.get_json()["id"]
+    assert Review.objects.count() == 1
+
+
+def test_idempotency_keys_are_scoped_to_the_user(auth_client, user, review_outbox):
+    other = User(username="other", email="other@example.com", password="hashed").save()
+    theirs, _ = outbox.enqueue(other, "ChIJ123", 2, "Long wait", idempotency_key="abc")
+
+    first = post_review(auth_client, key="abc")
+    assert first.status_code == 202 and first.get_json()["id"] != str(theirs.id)
+    # A retry racing the first post loses the insert and gets the stored review back
+    again, created = outbox.enqueue(user, "ChIJ123", 4, "Kind staff", idempotency_key="abc")
+    assert not created and str(again.id) == first.get_json()["id"]
+    assert Review.objects.count() == 2
+
+
+def test_flush_sends_batch_with_idempotency_keys(auth_client, review_outbox):
+    for i in range(3):
+        post_review(auth_client, key=f"key-{i}")
+
+    assert review_outbox.flush_all(limit=2) == 3
+    assert Review.objects(status="SENT").count() == 3
+    assert sorted(h["Idempotency-Key"] for h in StubLambda.headers_seen) == ["key-0", "key-1", "key-2"]
+    assert StubLambda.calls[0][1]["username"] == "tester"
+
+
+def test_failed_delivery_backs_off_then_gives_up(auth_client, review_outbox):
+    StubLambda.status = 500
+    post_review(auth_client)
+
+    assert review_outbox.flush_batch() == 1
+    review = Review.objects.first()
+    assert review.status == "PENDING" and review.attempts == 1
+    assert review.next_attempt_at > datetime.utcnow()
+    # Not due yet, so nothing is retried
+    assert review_outbox.flush_batch() == 0
+
+    Review.objects.update(set__attempts=review_outbox.MAX_ATTEMPTS - 1, set__next_attempt_at=datetime.utcnow())
+    review_outbox.flush_batch()
+    assert Review.objects.first().status == "FAILED"
+    # A review that was never delivered stops counting toward the place's rating
+    assert Place.objects.get(place_id="ChIJ123").review_count == 0
+
+
+def test_giving_up_on_a_stolen_claim_leaves_the_rating_alone(auth_client, review_outbox, monkeypatch):
+    post_review(auth_client)
+    Review.objects.update(set__attempts=review_outbox.MAX_ATTEMPTS - 1)
+
+    def slow_failure(review):
+        # The lease ran out mid-call and another worker claimed the review
+        Review.objects(id=review.id).update(set__claim="other-worker")
+        raise RuntimeError("upstream down")
+    monkeypatch.setattr(review_outbox, "deliver", slow_failure)
+
+    review_outbox.flush_batch()
+    assert Review.objects.first().claim == "other-worker"
+    assert Place.objects.get(place_id="ChIJ123").review_count == 1
+
+
+def test_stale_claims_are_picked_up_again(auth_client, review_outbox):
+    post_review(auth_client)
+    Review.objects.update(set__status="SENDING", set__claim="dead-worker",
+                          set__claimed_at=datetime.utcnow() - timedelta(hours=1))
+
+    assert review_outbox.flush_batch() == 1
+    assert Review.objects.first().status == "SENT"
+
+
+def ratings(place_id="ChIJ123"):
+    place = Place.objects.get(place_id=place_id)
+    return place.review_count, place.rating_sum, place.rating_histogram
+
+
+def test_worker_starts_with_the_first_request(client, mock_db, monkeypatch):
+    started = []
+    monkeypatch.setattr(outbox.worker, "_ensure_started", lambda: started.append(True))
+    client.get('/places/search/stats')
+    assert started == []    # disabled, as in these tests
+
+    monkeypatch.setattr(outbox.worker, "enabled", True)
+    client.get('/places/search/stats')
+    assert started == [True]
+
+
+def test_review_writes_keep_rating_aggregates_current(user):
+    first, _ = outbox.enqueue(user, "ChIJ123", 5, "Great")
+    outbox.enqueue(user, "ChIJ123", 3, "Fine")
+    assert ratings() == (2, 8, {"5": 1, "3": 1})
+
+    first.rating = 4
+    first.save()
+    assert ratings() == (2, 7, {"5": 0, "4": 1, "3": 1})
+
+    first.comment = "edited"
+    first.save()
+    assert ratings()[0] == 2
+
+    first.delete()
+    assert ratings() == (1, 3, {"5": 0, "4": 0, "3": 1})
+
+
+def test_rebuild_repairs_drifted_ratings(user):
+    outbox.enqueue(user, "ChIJ123", 5, "Great")
+    outbox.enqueue(user, "ChIJ123", 2, "Slow")
+    Review(place_id="ChIJ123", user=user, rating=1, comment="x", created_at=datetime.utcnow(),
+           status="FAILED", idempotency_key="failed").save()
+    Place.objects(place_id="ChIJ123").update(set__review_count=40, set__rating_sum=3)
+    Place(place_id="gone", name="Gone", location=[0, 0], fetched_at=datetime.utcnow(),
+          review_count=2, rating_sum=6, rating_histogram={"3": 2}).save()
+
+    result = app.test_cli_runner().invoke(args=["rebuild-place-ratings"])
+    assert "Rebuilt ratings for 1 place(s)" in result.output
+    assert ratings() == (2, 7, {"5": 1, "2": 1})
+    assert ratings("gone") == (0, 0, {})
+
+
+def test_search_results_carry_local_ratings(client, places_stub, max_queries):
+    user = User(username="rater", email="rater@example.com", password="x").save()
+    outbox.enqueue(user, "A", 5, "Great")
+    outbox.enqueue(user, "A", 4, "Good")
+
+    # The place upsert and one lookup for every result's ratings
+    with max_queries(2):
+        results = client.post('/places/search', json={"address": "Clinic Rd"}).get_json()["results"]
+    a, b = results
+    assert (a["user_rating"], a["user_ratings_total"], a["rating_histogram"]) == (4.5, 2, [0, 0, 0, 1, 1])
+    assert "user_rating" not in b
@@ -0,0 +1,35 @@
+'''Functional tests for cycle predictions'''
+from datetime import datetime, timedelta
+from flask_app.models import Log
+from flask_app.prediction.engine import histories
+
+
+def test_prediction_needs_two_periods(auth_client):
+    histories.clear()
+    response = auth_client.get('/prediction')
+    assert response.get_json()["prediction"] is None
+
+
+def test_prediction_is_patched_by_log_routes(auth_client, user):
+    histories.clear()
+    first = datetime(2024, 1, 1)
+    Log(user=user, type="Period", start_date=first, end_date=first + timedelta(days=5)).save()
+    Log(user=user, type="Period", start_date=first + timedelta(days=30), end_date=first + timedelta(days=35)).save()
+    assert auth_client.get('/prediction').get_json()["prediction"]["cycles_tracked"] == 1
+
+    # The cached history is updated in place rather than reloaded
+    response = auth_client.post('/logs', json={
+        "type": "Period",
+        "start_date": "2024-03-02T00:00",
+        "end_date": "2024-03-07T00:00",
+    })
+    log_id = response.get_json()["id"]
+    assert str(user.id) in histories._entries
+    assert auth_client.get('/prediction').get_json()["prediction"]["cycles_tracked"] == 2
+
+    auth_client.put(f'/logs/{log_id}', json={"type": "Event"})
+    assert auth_client.get('/prediction').get_json()["prediction"]["cycles_tracked"] == 1
+
+    auth_client.put(f'/logs/{log_id}', json={"type": "Period"})
+    auth_client.delete(f'/logs/{log_id}')
+    assert auth_client.get('/prediction').get_json()["prediction"]["cycles_tracked"] == 1
@@ -0,0 +1,39 @@
+'''N+1 guards: list views must not issue a query per item'''
+from datetime import datetime, timedelta
+from flask_app.models import Log, Problem
+from flask_app.prefetch import prefetch
+
+
+def test_profile_query_count_does_not_grow_with_items(auth_client, user, max_queries):
+    for i in range(15):
+        problem = Problem(name=f"Symptom {i}", user=user).save()
+        Log(user=user, type="Treatment", treatment_name="Metformin", problem=problem,
+            start_date=datetime(2024, 1, 1) + timedelta(days=i),
+            end_date=datetime(2024, 1, 2) + timedelta(days=i)).save()
+
+    # user loader, data version, symptoms, treatment logs
+    with max_queries(4):
+        data = auth_client.get('/profile/data').get_json()
+    assert len(data["symptoms"]) == len(data["treatments"]) == 15
+
+    # The page itself only loads the user; its lists come from /profile/data
+    with max_queries(1):
+        html = auth_client.get('/profile').data.decode()
+    assert 'fetch("/profile/data")' in html
+
+
+def test_prefetch_resolves_references_without_further_queries(user, max_queries):
+    for i in range(5):
+        Log(user=user, start_date=datetime(2024, 1, i + 1), end_date=datetime(2024, 1, i + 2)).save()
+
+    with max_queries(2) as issued:
+        logs = prefetch(Log.objects(user=user), 'user')
+        assert {log.user.username for log in logs} == {"tester"}
+    assert len(issued) == 2
+
+
+def test_repr_does_not_dereference(user, max_queries):
+    log = Log(user=user, start_date=datetime(2024, 1, 1), end_date=datetime(2024, 1, 2)).save()
+    log = Log.objects(id=log.id).first()
+    with max_queries(0):
+        assert str(user.id) in repr(log)
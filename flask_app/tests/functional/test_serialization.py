@@ -0,0 +1,53 @@
+'''Tests for the orjson-backed JSON provider and its stdlib fallback'''
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from bson import ObjectId
+from werkzeug.exceptions import BadRequest
+
+from flask_app.models import Problem
+from flask_app.run import app
+from flask_app.serialization import JSONProvider, jsonify, request_json
+
+PAYLOAD = {
+    "when": datetime(2024, 3, 1, 8, 30, 15, 250000),
+    "id": ObjectId("65e1a0b2c3d4e5f601234567"),
+    "price": Decimal("12.50"),
+    "name": "Café",
+    "nested": [{"b": 1, "a": None}],
+}
+EXPECTED = (
+    '{"id":"65e1a0b2c3d4e5f601234567","name":"Café","nested":[{"a":null,"b":1}],'
+    '"price":"12.50","when":"2024-03-01T08:30:15.250000"}'
+)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_both_backends_encode_the_same_bytes(use_orjson):
+    provider = JSONProvider(use_orjson=use_orjson)
+    assert provider.dumps(PAYLOAD) == EXPECTED
+    assert provider.loads(EXPECTED.encode())["name"] == "Café"
+
+
+def test_documents_encode_their_declared_fields(user):
+    problem = Problem(name="Acne", details="chin", user=user).save()
+    encoded = JSONProvider().dumps(problem)
+    assert encoded == f'{{"details":"chin","id":"{problem.id}","name":"Acne"}}'
+
+
+def test_jsonify_matches_flask_signature():
+    with app.test_request_context():
+        assert jsonify(a=1).get_data() == b'{"a":1}\n'
+        assert jsonify(1, 2).get_data() == b'[1,2]\n'
+        assert jsonify([]).mimetype == "application/json"
+
+
+def test_request_json_parses_and_rejects_bodies():
+    with app.test_request_context(data=b'{"start_date": "2024-01-01"}', content_type="application/json"):
+        assert request_json() == {"start_date": "2024-01-01"}
+    with app.test_request_context(data=b''):
+        assert request_json() is None
+    with app.test_request_context(data=b'{"start_date": ', content_type="application/json"):
+        with pytest.raises(BadRequest):
+            request_json()
@@ -0,0 +1,91 @@
+'''Tests for the /logs/stats aggregation pipelines
+
+$setWindowFields and $stdDevSamp need a real mongod (5.0+), so these use real_db.
+'''
+import random
+import statistics
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from flask_app.models import User, Log, Problem
+from flask_app.logs.stats import cycle_stats, monthly_counts, DURATION_BUCKETS
+from flask_app.prediction.engine import CycleHistory, MIN_CYCLE_DAYS, MAX_CYCLE_DAYS
+
+
+def seed_history(user, seed=7):
+    '''Irregular cycles, with some periods logged as one entry per day.'''
+    rng = random.Random(seed)
+    day = datetime(2022, 1, 3)
+    for _ in range(20):
+        length = rng.randint(3, 8)
+        if rng.random() < 0.5:
+            Log(user=user, type="Period", start_date=day, end_date=day + timedelta(days=length)).save()
+        else:
+            for i in range(length):
+                Log(user=user, type="Period", start_date=day + timedelta(days=i),
+                    end_date=day + timedelta(days=i + 1)).save()
+        Log(user=user, type="Treatment", treatment_name="Metformin",
+            start_date=day + timedelta(days=10), end_date=day + timedelta(days=11)).save()
+        day += timedelta(days=rng.randint(24, 60))
+
+
+def reference_summary(values):
+    values = [float(v) for v in values]
+    return {
+        "count": len(values),
+        "average": statistics.mean(values),
+        "median": statistics.median(values),
+        "variance": statistics.variance(values) if len(values) > 1 else None,
+    }
+
+
+def assert_summary_equal(actual, expected):
+    assert actual["count"] == expected["count"]
+    for key in ("average", "median", "variance"):
+        assert actual[key] == pytest.approx(expected[key])
+
+
+def test_cycle_stats_match_python_reference(real_db):
+    user = User(username="stats", email="stats@example.com", password="x").save()
+    seed_history(user)
+
+    # Pure-Python reference built from the raw logs
+    logs = list(Log.objects(user=user, type="Period"))
+    history = CycleHistory([np.datetime64(l.start_date.date()) for l in logs],
+                           [np.datetime64(l.end_date.date()) for l in logs])
+    starts, ends = history.periods()
+    cycles = [c for c in np.diff(starts).astype(int) if MIN_CYCLE_DAYS <= c <= MAX_CYCLE_DAYS]
+    durations = (ends - starts).astype(int).tolist()
+
+    stats = cycle_stats(user)
+    assert_summary_equal(stats["cycle_length"], reference_summary(cycles))
+    assert_summary_equal(stats["period_duration"], reference_summary(durations))
+
+    expected_histogram = {}
+    for d in durations:
+        lower = max(b for b in DURATION_BUCKETS if b <= d) if d < DURATION_BUCKETS[-1] else f"{DURATION_BUCKETS[-1]}+"
+        expected_histogram[str(lower)] = expected_histogram.get(str(lower), 0) + 1
+    assert stats["period_duration_histogram"] == expected_histogram
+
+
+def test_monthly_counts_match_python_reference(mock_db):
+    user = User(username="stats", email="stats@example.com", password="x").save()
+    seed_history(user)
+    acne = Problem(name="Acne", user=user).save()
+    Log(user=user, type="Event", problem=acne, start_date=datetime(2022, 1, 20), end_date=datetime(2022, 1, 21)).save()
+
+    expected = {}
+    for log in Log.objects(user=user):
+        month = expected.setdefault(log.start_date.strftime("%Y-%m"), {"by_type": {}, "symptoms": 0})
+        month["by_type"][log.type] = month["by_type"].get(log.type, 0) + 1
+        month["symptoms"] += 1 if log.problem else 0
+
+    actual = {row["month"]: {"by_type": row["by_type"], "symptoms": row["symptoms"]}
+              for row in monthly_counts(user)}
+    assert actual == expected
+    assert [row["month"] for row in monthly_counts(user)] == sorted(expected)
+
+
+def test_stats_route_rejects_bad_range(auth_client):
+    assert auth_client.get('/logs/stats?end=soon').status_code == 400
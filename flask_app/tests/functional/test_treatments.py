@@ -0,0 +1,210 @@
+'''Tests for the /treatments timeline API'''
+from datetime import datetime, timedelta
+from flask_app.models import User, Log, Problem, Treatment, Insight, TreatmentOutcome
+from flask_app.commands import migrate_treatment_logs
+
+
+def add_treatment(user, name, start, end, problem=None):
+    return Treatment(user=user, name=name, start_date=start, end_date=end, problem=problem).save()
+
+
+def test_data_returns_treatments_overlapping_window(auth_client, user):
+    add_treatment(user, "Metformin", datetime(2024, 1, 1), datetime(2024, 3, 1))
+    add_treatment(user, "Inositol", datetime(2024, 4, 1), datetime(2024, 4, 30))
+    add_treatment(user, "Spironolactone", datetime(2023, 6, 1), datetime(2023, 12, 31))
+
+    response = auth_client.get('/treatments/data?start=2024-02-15T00:00:00&end=2024-04-02T00:00:00')
+    assert [t["name"] for t in response.get_json()] == ["Metformin", "Inositol"]
+
+
+def test_data_for_a_single_date(auth_client, user):
+    add_treatment(user, "Metformin", datetime(2024, 1, 1), datetime(2024, 3, 1, 8))
+    add_treatment(user, "Inositol", datetime(2024, 3, 1, 20), datetime(2024, 3, 5))
+    add_treatment(user, "Letrozole", datetime(2024, 3, 2), datetime(2024, 3, 6))
+
+    response = auth_client.get('/treatments/data?date=2024-03-01')
+    assert {t["name"] for t in response.get_json()} == {"Metformin", "Inositol"}
+
+
+def test_invalid_range_is_rejected(auth_client, user):
+    response = auth_client.get('/treatments/data?date=March')
+    assert response.status_code == 400
+
+
+def test_overlaps_joins_period_and_symptom_logs(auth_client, user):
+    acne = Problem(name="Acne", user=user).save()
+    metformin = add_treatment(user, "Metformin", datetime(2024, 1, 1), datetime(2024, 2, 10))
+    add_treatment(user, "Inositol", datetime(2024, 2, 5), datetime(2024, 3, 31))
+    Log(user=user, type="Period", start_date=datetime(2024, 1, 3), end_date=datetime(2024, 1, 8)).save()
+    Log(user=user, type="Event", problem=acne, start_date=datetime(2024, 2, 8), end_date=datetime(2024, 2, 8)).save()
+    Log(user=user, type="Period", start_date=datetime(2024, 4, 2), end_date=datetime(2024, 4, 6)).save()
+    Log(user=user, type="Event", start_date=datetime(2024, 2, 8), end_date=datetime(2024, 2, 8)).save()
+
+    logs = auth_client.get('/treatments/overlaps?start=2024-01-01T00:00:00&end=2024-05-01T00:00:00').get_json()
+    assert [(log["type"], [t["name"] for t in log["treatments"]]) for log in logs] == [
+        ("Period", ["Metformin"]),
+        ("Event", ["Metformin", "Inositol"]),
+        ("Period", []),
+    ]
+    assert logs[0]["treatments"][0]["id"] == str(metformin.id)
+    assert logs[1]["problem_id"] == str(acne.id)
+
+
+def test_crud_bumps_data_version(auth_client, user):
+    acne = Problem(name="Acne", user=user).save()
+    response = auth_client.post('/treatments', json={
+        "name": "Metformin", "start_date": "2024-01-01T00:00:00", "problem_id": str(acne.id),
+    })
+    treatment_id = response.get_json()["id"]
+    treatment = Treatment.objects.get(id=treatment_id)
+    assert treatment.end_date == treatment.start_date
+    assert treatment.problem.id == acne.id
+    assert User.objects.get(id=user.id).data_version == 1
+
+    assert auth_client.put(f'/treatments/{treatment_id}', json={"end_date": "2024-02-01T00:00:00"}).get_json()["success"]
+    assert Treatment.objects.get(id=treatment_id).end_date == datetime(2024, 2, 1)
+
+    assert auth_client.delete(f'/treatments/{treatment_id}').get_json()["success"]
+    assert Treatment.objects.count() == 0
+    assert User.objects.get(id=user.id).data_version == 3
+
+
+def test_cannot_touch_another_users_treatment(auth_client, user):
+    other = User(username="other", email="other@example.com", password="x").save()
+    treatment = add_treatment(other, "Metformin", datetime(2024, 1, 1), datetime(2024, 2, 1))
+    assert auth_client.delete(f'/treatments/{treatment.id}').status_code == 404
+
+
+def test_migrate_treatment_logs_is_idempotent(user):
+    Log(user=user, type="Treatment", treatment_name="Metformin", description="500mg",
+        start_date=datetime(2024, 1, 1), end_date=datetime(2024, 2, 1)).save()
+    Log(user=user, type="Period", start_date=datetime(2024, 1, 3), end_date=datetime(2024, 1, 8)).save()
+
+    assert migrate_treatment_logs() == 1
+    assert migrate_treatment_logs() == 0
+    treatment = Treatment.objects.get()
+    assert (treatment.name, treatment.details) == ("Metformin", "500mg")
+
+
+def seed_acne_history(user):
+    acne = Problem(name="Acne", user=user).save()
+    # Acne every other day for 90 days, then weekly once Metformin starts
+    for i in range(0, 90, 2):
+        day = datetime(2024, 1, 1) + timedelta(days=i)
+        Log(user=user, type="Event", problem=acne, start_date=day, end_date=day).save()
+    for i in range(0, 90, 7):
+        day = datetime(2024, 3, 31) + timedelta(days=i)
+        Log(user=user, type="Event", problem=acne, start_date=day, end_date=day).save()
+    metformin = add_treatment(user, "Metformin", datetime(2024, 3, 31), datetime(2024, 9, 1))
+    return acne, metformin
+
+
+def test_effects_compare_symptoms_before_and_after(auth_client, user):
+    seed_acne_history(user)
+    [result] = auth_client.get('/treatments/effects').get_json()
+    [symptom] = result["symptoms"]
+    assert result["treatment"]["name"] == "Metformin"
+    assert symptom["status"] == "IMPROVED"
+    assert symptom["before"] > symptom["after"]
+
+
+def test_effects_are_recomputed_after_a_write(auth_client, user):
+    acne, metformin = seed_acne_history(user)
+    assert auth_client.get('/treatments/effects').get_json()[0]["symptoms"][0]["status"] == "IMPROVED"
+
+    # Daily acne after the start flips the result once a write bumps the data version
+    for i in range(90):
+        Log(user=user, type="Event", problem=acne, start_date=datetime(2024, 4, 1) + timedelta(days=i),
+            end_date=datetime(2024, 4, 1) + timedelta(days=i)).save()
+    auth_client.put(f'/treatments/{metformin.id}', json={"details": "500mg"})
+    assert auth_client.get('/treatments/effects').get_json()[0]["symptoms"][0]["status"] == "WORSENED"
+
+
+def test_insights_are_suggested_then_written_once(auth_client, user):
+    acne, metformin = seed_acne_history(user)
+
+    [suggestion] = auth_client.get(f'/treatments/{metformin.id}/insights').get_json()
+    assert suggestion["status"] == "IMPROVED"
+    assert Insight.objects.count() == 0
+
+    assert auth_client.post(f'/treatments/{metformin.id}/insights').get_json()["saved"] == 1
+    assert auth_client.post(f'/treatments/{metformin.id}/insights').get_json()["saved"] == 0
+    insight = Insight.objects.get()
+    assert (insight.status, insight.problem.id, insight.treatment.id) == ("IMPROVED", acne.id, metformin.id)
+    assert TreatmentOutcome.objects.get(problem_name="Acne", treatment_name="Metformin").total == 1
+
+
+def test_malformed_treatment_ids_are_not_found(auth_client, user):
+    for response in (
+        auth_client.get('/treatments/not-an-id/insights'),
+        auth_client.post('/treatments/not-an-id/insights'),
+        auth_client.put('/treatments/not-an-id', json={"name": "x"}),
+        auth_client.delete('/treatments/not-an-id'),
+    ):
+        assert response.status_code == 404
+        assert response.get_json() == {"success": False, "error": "Treatment not found"}
+
+
+def test_unknown_symptoms_are_rejected(auth_client, user):
+    other = User(username="other", email="other@example.com", password="x").save()
+    foreign = Problem(user=other, name="Acne").save()
+    treatment = add_treatment(user, "Metformin", datetime(2024, 1, 1), datetime(2024, 2, 1))
+    for problem_id in (str(foreign.id), "not-an-id"):
+        response = auth_client.post('/treatments', json={"start_date": "2024-01-01T00:00:00", "problem_id": problem_id})
+        assert response.status_code == 400
+        assert response.get_json() == {"success": False, "error": "Symptom not found"}
+        response = auth_client.put(f'/treatments/{treatment.id}', json={"problem_id": problem_id})
+        assert response.status_code == 400
+    assert Treatment.objects.count() == 1
+    assert Treatment.objects.get().problem is None
+
+
+def test_incomplete_treatments_are_rejected(auth_client, user):
+    response = auth_client.post('/treatments', json={"start_date": "2024-01-01T00:00:00"})
+    assert response.status_code == 400 and not response.get_json()["success"]
+    response = auth_client.post('/treatments', json={"name": "Metformin"})
+    assert response.status_code == 400
+
+    treatment = add_treatment(user, "Metformin", datetime(2024, 1, 1), datetime(2024, 2, 1))
+    assert auth_client.put(f'/treatments/{treatment.id}', json={"name": None}).status_code == 400
+    assert Treatment.objects.count() == 1
+    assert User.objects.get(id=user.id).data_version == 0
+
+
+def test_calendar_treatments_stay_in_step_with_the_timeline(auth_client, user):
+    response = auth_client.post('/logs', json={
+        "type": "Treatment", "treatment_name": "Metformin", "description": "500mg",
+        "start_date": "2024-01-01T00:00:00", "end_date": "2024-02-01T00:00:00",
+    })
+    log_id = response.get_json()["id"]
+    treatment = Treatment.objects.get(id=log_id)
+    assert (treatment.name, treatment.details, treatment.end_date) == ("Metformin", "500mg", datetime(2024, 2, 1))
+
+    auth_client.put(f'/logs/{log_id}', json={"treatment_name": "Inositol"})
+    assert Treatment.objects.get(id=log_id).name == "Inositol"
+
+    auth_client.put(f'/treatments/{log_id}', json={"end_date": "2024-03-01T00:00:00"})
+    assert Log.objects.get(id=log_id).end_date == datetime(2024, 3, 1)
+
+    auth_client.delete(f'/logs/{log_id}')
+    assert Treatment.objects.count() == 0
+
+
+def test_deleting_a_timeline_treatment_removes_its_calendar_log(auth_client, user):
+    log_id = auth_client.post('/logs', json={
+        "type": "Treatment", "treatment_name": "Metformin",
+        "start_date": "2024-01-01T00:00:00", "end_date": "2024-01-02T00:00:00",
+    }).get_json()["id"]
+    assert Treatment.objects.get(id=log_id)
+
+    assert auth_client.delete(f'/treatments/{log_id}').get_json()["success"]
+    assert Log.objects.count() == 0
+
+
+def test_retyped_calendar_logs_leave_the_timeline(auth_client, user):
+    log_id = auth_client.post('/logs', json={
+        "type": "Treatment", "treatment_name": "Metformin",
+        "start_date": "2024-01-01T00:00:00", "end_date": "2024-01-02T00:00:00",
+    }).get_json()["id"]
+    auth_client.put(f'/logs/{log_id}', json={"type": "Event"})
+    assert Treatment.objects.count() == 0
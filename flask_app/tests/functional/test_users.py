@@ -1,2 +1,143 @@
 ''' Functional tests for user logic ⌌⌈ ╹므╹ ⌉⌏'''
+from bson import ObjectId
+from flask_app.run import app
+from flask_app.extensions import user_cache
+from flask_app.models import User, Log, Problem, load_user
+from flask_app.users.routes import log_problems
 
+
+def test_create_log_does_not_rewrite_user(auth_client, user):
+    response = auth_client.post('/logs', json={
+        "type": "Period",
+        "start_date": "2024-03-01T00:00",
+        "end_date": "2024-03-05T00:00",
+    })
+    assert response.get_json()["success"]
+    raw_user = User._get_collection().find_one({"_id": user.id})
+    assert "logs" not in raw_user
+    assert Log.objects(user=user).count() == 1
+
+
+def test_profile_symptoms_are_stored_by_back_reference(auth_client, user):
+    auth_client.post('/profile', data={"problem-symptoms": ["Acne"], "problem-submit": "Save"})
+    assert Problem.objects(user=user, name="Acne").count() == 1
+    assert "problems" not in User._get_collection().find_one({"_id": user.id})
+
+
+def test_migrate_user_refs_unsets_legacy_arrays(mock_db):
+    User._get_collection().insert_one({
+        "username": "legacy",
+        "email": "legacy@example.com",
+        "password": "x",
+        "logs": [ObjectId()],
+        "problems": [],
+        "insights": [],
+    })
+    runner = app.test_cli_runner()
+    assert "1 user(s) still carry" in runner.invoke(args=["migrate-user-refs", "--dry-run"]).output
+    assert "Migrated 1 user(s)" in runner.invoke(args=["migrate-user-refs"]).output
+
+    raw_user = User._get_collection().find_one({"username": "legacy"})
+    assert not {"logs", "problems", "insights"} & set(raw_user)
+
+
+def test_dedupe_problems_keeps_the_oldest_and_repoints_references(user):
+    # Written raw: the duplicates predate the unique (user, name) index
+    db = Problem._get_db()
+    oldest, newer, other = ObjectId(), ObjectId(), ObjectId()
+    db.problem.insert_many([
+        {"_id": oldest, "user": user.id, "name": "Acne"},
+        {"_id": newer, "user": user.id, "name": "Acne"},
+        {"_id": other, "user": user.id, "name": "Hair Loss"},
+    ])
+    db.insight.insert_one({"user": user.id, "problem": newer, "treatment": ObjectId(), "content": "x"})
+    db.treatment.insert_one({"user": user.id, "problem": newer, "name": "Metformin"})
+    db.log.insert_one({"user": user.id, "problem": newer, "type": "Event"})
+    db.log_bucket.insert_one({"user": user.id, "entries": [{"_id": ObjectId(), "p": newer}, {"_id": ObjectId(), "p": newer}]})
+
+    runner = app.test_cli_runner()
+    assert "1 duplicate problem(s)" in runner.invoke(args=["dedupe-problems", "--dry-run"]).output
+    assert "Removed 1 duplicate problem(s)" in runner.invoke(args=["dedupe-problems"]).output
+
+    assert sorted(p.id for p in Problem.objects(user=user)) == sorted([oldest, other])
+    for collection in ("insight", "treatment", "log"):
+        assert db[collection].find_one()["problem"] == oldest
+    assert [e["p"] for e in db.log_bucket.find_one()["entries"]] == [oldest, oldest]
+    # The unique index could be built afterwards
+    assert Problem._get_collection().index_information()["user_1_name_1"]["unique"]
+
+
+def test_load_user_projects_identity_fields(user):
+    loaded = load_user(user.username)
+    assert loaded.id == user.id
+    assert loaded.email == user.email
+    assert loaded.password is None
+
+
+def test_load_user_cache_is_invalidated_on_save(user):
+    user_cache.configure(ttl=60)
+    user_cache.clear()
+    try:
+        load_user(user.username)
+        assert load_user(user.username).email == "tester@example.com"
+        assert user_cache.hits == 1
+
+        full_user = User.objects(id=user.id).first()
+        full_user.email = "changed@example.com"
+        full_user.save()
+        assert load_user(user.username).email == "changed@example.com"
+    finally:
+        user_cache.configure(ttl=0)
+        user_cache.clear()
+
+
+def test_log_problems_batches_and_reports_per_symptom(user):
+    Problem(name="Acne", user=user).save()
+
+    results = log_problems(user, ["Acne", "Fatigue", "Depression", "Depression"])
+
+    assert results == [
+        (False, "'Acne' has already been logged."),
+        (True, "'Fatigue' logged successfully."),
+        (True, "'Depression' logged successfully."),
+        (False, "'Depression' has already been logged."),
+    ]
+    assert sorted(Problem.objects(user=user).scalar("name")) == ["Acne", "Depression", "Fatigue"]
+
+
+def test_log_problems_treats_unique_index_conflicts_as_duplicates(user, mocker):
+    Problem.ensure_indexes()
+    Problem(name="Acne", user=user).save()
+    # Simulate a concurrent request logging "Acne" right after our lookup
+    mocker.patch("flask_app.users.routes.Problem.objects").return_value.scalar.return_value = []
+
+    results = log_problems(user, ["Acne", "Fatigue"])
+    assert results == [(False, "'Acne' has already been logged."), (True, "'Fatigue' logged successfully.")]
+
+
+def test_profile_flashes_one_message_per_symptom(auth_client, user):
+    Problem(name="Acne", user=user).save()
+    auth_client.post('/profile', data={
+        "problem-symptoms": ["Acne", "Fatigue"],
+        "problem-custom_symptom": "Dizziness",
+        "problem-submit": "Save",
+    })
+    with auth_client.session_transaction() as session:
+        flashes = session["_flashes"]
+    assert flashes == [
+        ("warning", "'Acne' has already been logged."),
+        ("success", "'Fatigue' logged successfully."),
+        ("success", "'Dizziness' logged successfully."),
+    ]
+
+
+def test_profile_data_is_revalidated_until_a_symptom_is_logged(auth_client, user):
+    first = auth_client.get('/profile/data')
+    assert first.get_json() == {"symptoms": [], "treatments": []}
+    etag = first.headers["ETag"]
+    assert auth_client.get('/profile/data', headers={"If-None-Match": etag}).status_code == 304
+
+    log_problems(user, ["Acne"])
+    changed = auth_client.get('/profile/data', headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.get_json()["symptoms"][0]["name"] == "Acne"
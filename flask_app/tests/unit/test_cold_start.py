@@ -0,0 +1,14 @@
+'''Cold-start guard: heavy dependencies stay out of the serverless import path'''
+import os
+import subprocess
+import sys
+
+from benchmarks.import_time import DEFERRED
+
+
+def test_app_import_does_not_load_deferred_dependencies():
+    # A fresh interpreter, as on a serverless cold start
+    env = dict(os.environ, MONGODB_HOST="mongodb://localhost:27017/pcos_test", SECRET_KEY="testing")
+    code = f"import sys, flask_app.run; print(sorted(m for m in {DEFERRED!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,56 @@
+'''Unit tests for the treatment before/after analysis'''
+from datetime import datetime
+from types import SimpleNamespace
+import numpy as np
+from flask_app.treatments.correlation import TreatmentAnalysis, day_bitmap, compare
+
+
+def days(*dates):
+    return np.array(dates, dtype="datetime64[D]")
+
+
+def test_day_bitmap_marks_inclusive_ranges():
+    origin = np.datetime64("2024-01-01")
+    bitmap = day_bitmap(days("2024-01-02", "2024-01-03"), days("2024-01-03", "2024-01-05"), origin, 7)
+    assert bitmap.tolist() == [False, True, True, True, True, False, False]
+
+
+def test_compare_thresholds():
+    assert compare(10, 2, 90, 90) == "IMPROVED"
+    assert compare(2, 10, 90, 90) == "WORSENED"
+    assert compare(10, 9, 90, 90) == "NO_CHANGE"
+    assert compare(10, 2, 90, 10) is None
+
+
+def test_before_after_counts_and_cycle_lengths():
+    # Periods every 40 days until the treatment starts on 2024-06-09, every 30 days after
+    starts = [np.datetime64("2024-01-01") + np.timedelta64(40 * i, "D") for i in range(5)]
+    starts += [starts[-1] + np.timedelta64(30 * i, "D") for i in range(1, 6)]
+    starts = np.array(starts, dtype="datetime64[D]")
+    periods = (starts, starts + np.timedelta64(4, "D"))
+    # Acne on 20 days of the 90 before, 5 of the 90 after
+    acne_days = [np.datetime64("2024-05-01") + np.timedelta64(i, "D") for i in range(20)]
+    acne_days += [np.datetime64("2024-08-01") + np.timedelta64(i, "D") for i in range(5)]
+    acne = np.array(acne_days, dtype="datetime64[D]")
+    treatment = SimpleNamespace(id="t1", name="Metformin",
+                                start_date=datetime(2024, 6, 9), end_date=datetime(2024, 12, 31))
+
+    [result] = TreatmentAnalysis(periods, {"p1": (acne, acne)}, {"p1": "Acne"}, [treatment]).results()
+
+    assert result["observed_days"] == {"before": 90, "after": 90}
+    assert result["cycle_length"]["before"] == 40.0
+    assert result["cycle_length"]["after"] == 30.0
+    [symptom] = result["symptoms"]
+    assert (symptom["name"], symptom["status"]) == ("Acne", "IMPROVED")
+    assert symptom["before"] == round(20 * 30 / 90, 2)
+    assert symptom["after"] == round(5 * 30 / 90, 2)
+
+
+def test_no_history_yields_no_status():
+    empty = days()
+    treatment = SimpleNamespace(id="t1", name="Metformin",
+                                start_date=datetime(2024, 7, 1), end_date=datetime(2024, 7, 2))
+    [result] = TreatmentAnalysis((empty, empty), {}, {}, [treatment]).results()
+    assert result["observed_days"] == {"before": 0, "after": 0}
+    assert result["symptoms"] == []
+    assert result["cycle_length"]["before"] is None
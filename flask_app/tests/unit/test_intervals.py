@@ -0,0 +1,36 @@
+'''Unit tests for the treatment interval tree'''
+import random
+from datetime import datetime, timedelta
+from flask_app.treatments.intervals import IntervalTree
+
+
+def random_intervals(rng, n):
+    base = datetime(2024, 1, 1)
+    intervals = []
+    for i in range(n):
+        start = base + timedelta(days=rng.randint(0, 365))
+        intervals.append((start, start + timedelta(days=rng.randint(0, 60)), i))
+    return intervals
+
+
+def test_overlapping_matches_brute_force():
+    rng = random.Random(3)
+    intervals = random_intervals(rng, 300)
+    tree = IntervalTree(intervals)
+    assert len(tree) == 300
+    for start, end, _ in random_intervals(rng, 200):
+        expected = {v for s, e, v in intervals if s <= end and e >= start}
+        assert set(tree.overlapping(start, end)) == expected
+
+
+def test_endpoints_are_inclusive():
+    day = datetime(2024, 3, 1)
+    tree = IntervalTree([(day, day + timedelta(days=2), "a"), (day + timedelta(days=3), day + timedelta(days=3), "b")])
+    assert tree.at(day) == ["a"]
+    assert tree.at(day + timedelta(days=2)) == ["a"]
+    assert tree.at(day + timedelta(days=3)) == ["b"]
+    assert tree.overlapping(day + timedelta(days=2), day + timedelta(days=3)) in (["a", "b"], ["b", "a"])
+
+
+def test_empty_tree():
+    assert IntervalTree().overlapping(datetime(2024, 1, 1), datetime(2024, 2, 1)) == []
@@ -0,0 +1,61 @@
+'''Unit tests for the cycle prediction engine'''
+from datetime import date, datetime, timedelta
+import numpy as np
+from flask_app.prediction.engine import CycleHistory
+
+
+def history_from(period_starts, length=5):
+    starts = [np.datetime64(d, "D") for d in period_starts]
+    return CycleHistory(starts, [s + np.timedelta64(length, "D") for s in starts])
+
+
+def test_regular_cycles_predict_next_period():
+    starts = [date(2024, 1, 1) + timedelta(days=30 * i) for i in range(5)]
+    prediction = history_from(starts).predict(today=date(2024, 5, 1))
+
+    assert prediction["cycles_tracked"] == 4
+    assert prediction["average_cycle_length"] == 30
+    assert prediction["next_period"]["date"] == "2024-05-30"
+    assert prediction["fertile_window"]["start"] == "2024-05-11"
+    assert prediction["next_period"]["earliest"] < "2024-05-30" < prediction["next_period"]["latest"]
+
+
+def test_irregular_cycles_widen_the_interval():
+    regular = history_from([date(2024, 1, 1) + timedelta(days=30 * i) for i in range(5)])
+    irregular = history_from([date(2024, 1, 1), date(2024, 2, 5), date(2024, 3, 1), date(2024, 4, 20), date(2024, 5, 15)])
+
+    def width(history):
+        p = history.predict(today=date(2024, 5, 16))["next_period"]
+        return np.datetime64(p["latest"]) - np.datetime64(p["earliest"])
+
+    assert width(irregular) > width(regular)
+
+
+def test_daily_period_logs_are_merged_into_one_period():
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(5)]
+    days += [date(2024, 2, 1) + timedelta(days=i) for i in range(5)]
+    history = CycleHistory([np.datetime64(d, "D") for d in days],
+                           [np.datetime64(d + timedelta(days=1), "D") for d in days])
+    starts, ends = history.periods()
+
+    assert [str(s) for s in starts] == ["2024-01-01", "2024-02-01"]
+    assert history.summary()["cycles"].tolist() == [31]
+
+
+def test_past_prediction_rolls_forward_to_today():
+    history = history_from([date(2024, 1, 1), date(2024, 1, 29)])
+    prediction = history.predict(today=date(2024, 6, 1))
+    assert prediction["next_period"]["date"] >= "2024-06-01"
+
+
+def test_single_period_has_no_prediction():
+    assert history_from([date(2024, 1, 1)]).predict() is None
+
+
+def test_add_and_remove_update_the_history_in_place():
+    history = history_from([date(2024, 1, 1), date(2024, 3, 1)])
+    history.add(datetime(2024, 1, 30), datetime(2024, 2, 4))
+    assert history.summary()["cycles"].tolist() == [29, 31]
+
+    history.remove(datetime(2024, 1, 30), datetime(2024, 2, 4))
+    assert history.summary()["cycles"].tolist() == [60]
@@ -0,0 +1,49 @@
+# Keeps calendar treatment logs and the Treatment model in step.
+#
+# The calendar stores a treatment as a Log of type "Treatment"; /treatments
+# and the before/after analysis read the Treatment model. A Treatment made
+# from a log keeps the log's _id, as `flask migrate-treatment-logs` does, so
+# a write on either side finds its twin by id. Treatments created through
+# /treatments have no calendar log and only appear on the timeline.
+from ..logs.storage import log_store
+from ..models import Treatment
+
+
+def treatment_from_log(user, log):
+    """Creates or updates the Treatment for a calendar log; removes it once the log isn't a treatment."""
+    treatment = Treatment.objects(id=log.pk, user=user).first()
+    if log.type != "Treatment":
+        if treatment is not None:
+            treatment.delete()
+        return
+    if treatment is None:
+        treatment = Treatment(id=log.pk, user=user)
+    treatment.name = log.treatment_name or "Treatment"
+    treatment.details = log.description
+    treatment.start_date = log.start_date
+    treatment.end_date = log.end_date
+    treatment.save()
+
+
+def forget_log(user, log):
+    """Removes the Treatment made from a deleted calendar log."""
+    Treatment.objects(id=log.pk, user=user).delete()
+
+
+def log_from_treatment(user, treatment):
+    """Copies a Treatment's edits onto its calendar log, when it has one."""
+    log = log_store().get(user, treatment.pk)
+    if log is None or log.type != "Treatment":
+        return
+    log.treatment_name = treatment.name
+    log.description = treatment.details
+    log.start_date = treatment.start_date
+    log.end_date = treatment.end_date
+    log_store().save(log)
+
+
+def forget_treatment(user, treatment):
+    """Removes the calendar log of a deleted Treatment, when it has one."""
+    log = log_store().get(user, treatment.pk)
+    if log is not None and log.type == "Treatment":
+        log_store().delete(log)
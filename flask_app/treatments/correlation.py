@@ -0,0 +1,241 @@
+# Before/after comparison of a user's cycle and symptoms around each treatment start.
+#
+# Period and symptom logs are rasterized into per-day bitmaps (one row per
+# symptom), so the day counts for every treatment's before and after windows
+# come from cumulative sums indexed in one go rather than per-log loops.
+import numpy as np
+from bson import ObjectId
+
+from ..cache import TTLCache
+from ..conditional import data_version
+from ..constants import MIN_CYCLE_DAYS, MAX_CYCLE_DAYS
+from ..logs.storage import log_store
+from ..models import Problem, Treatment, Insight
+from ..prefetch import ref_id
+from ..prediction.engine import CycleHistory
+
+# Days compared on each side of a treatment's start date
+WINDOW_DAYS = 90
+# Cycles are long, so they get a wider window to collect a few on each side
+CYCLE_WINDOW_DAYS = 180
+# A window with fewer logged-history days than this is not compared
+MIN_OBSERVED_DAYS = 30
+# Relative change in symptom days needed to call it improved or worse
+CHANGE_THRESHOLD = 0.25
+# Rates are reported as days per this many days
+RATE_DAYS = 30
+
+# Keyed by user and data version: any log, symptom or treatment write bumps
+# the version, so stale analyses are never served and simply age out
+analyses = TTLCache(maxsize=1024, ttl=600)
+
+
+def day_bitmap(starts, ends, origin, n_days):
+    """Bool array over n_days marking every day covered by an inclusive [start, end] range."""
+    marks = np.zeros(n_days + 1, dtype=np.int32)
+    first = np.clip((starts - origin).astype(int), 0, n_days)
+    last = np.clip((ends - origin).astype(int) + 1, 0, n_days)
+    np.add.at(marks, first, 1)
+    np.add.at(marks, last, -1)
+    return np.cumsum(marks[:-1]) > 0
+
+
+def compare(before, after, observed_before, observed_after):
+    """Status of a symptom given its day counts in each window, or None without enough history."""
+    if min(observed_before, observed_after) < MIN_OBSERVED_DAYS:
+        return None
+    rate_before = before / observed_before
+    rate_after = after / observed_after
+    if rate_before == rate_after:
+        return "NO_CHANGE"
+    if rate_after <= rate_before * (1 - CHANGE_THRESHOLD):
+        return "IMPROVED"
+    if rate_after >= rate_before * (1 + CHANGE_THRESHOLD) and after > 0:
+        return "WORSENED"
+    return "NO_CHANGE"
+
+
+def _rate(days, observed):
+    return round(float(days) * RATE_DAYS / observed, 2) if observed else None
+
+
+def _mean_cycle(cycle_starts, cycle_lengths, lo, hi):
+    chosen = cycle_lengths[(cycle_starts >= lo) & (cycle_starts < hi)]
+    return (round(float(chosen.mean()), 1) if chosen.size else None), int(chosen.size)
+
+
+class TreatmentAnalysis:
+    """Period and symptom day bitmaps for one user, compared around each treatment."""
+
+    def __init__(self, periods, symptoms, problems, treatments):
+        # periods: (starts, ends) datetime64[D] arrays; symptoms: problem id ->
+        # (starts, ends); problems: problem id -> name; treatments: Treatment list
+        self.treatments = treatments
+        self.problem_ids = list(symptoms)
+        self.problem_names = problems
+
+        all_starts = [periods[0]] + [s for s, _ in symptoms.values()]
+        all_ends = [periods[1]] + [e for _, e in symptoms.values()]
+        starts = np.concatenate(all_starts) if all_starts else np.array([], dtype="datetime64[D]")
+        ends = np.concatenate(all_ends) if all_ends else np.array([], dtype="datetime64[D]")
+        if starts.size:
+            self.origin = starts.min()
+            self.n_days = int((ends.max() - self.origin).astype(int)) + 1
+        else:
+            self.origin = np.datetime64("1970-01-01", "D")
+            self.n_days = 0
+
+        rows = [day_bitmap(*periods, self.origin, self.n_days)]
+        rows += [day_bitmap(s, e, self.origin, self.n_days) for s, e in symptoms.values()]
+        # Row 0 is period days, then one row per symptom; a leading zero column
+        # makes counts over [a, b) a single subtraction
+        bitmaps = np.vstack(rows) if self.n_days else np.zeros((len(rows), 0), dtype=bool)
+        self.counts = np.concatenate(
+            [np.zeros((len(rows), 1), dtype=np.int64), np.cumsum(bitmaps, axis=1)], axis=1
+        )
+
+        period_starts, _ = CycleHistory(*periods).periods()
+        lengths = np.diff(period_starts).astype(int)
+        valid = (lengths >= MIN_CYCLE_DAYS) & (lengths <= MAX_CYCLE_DAYS)
+        self.cycle_starts = period_starts[:-1][valid]
+        self.cycle_lengths = lengths[valid]
+
+    @classmethod
+    def load(cls, user):
+        store = log_store()
+        period_rows = list(store.find(user, fields=("start_date", "end_date"), match={"type": "Period"}))
+        periods = (
+            np.array([r["start_date"] for r in period_rows], dtype="datetime64[D]"),
+            np.array([r["end_date"] for r in period_rows], dtype="datetime64[D]"),
+        )
+
+        by_problem = {}
+        for row in store.find(user, fields=("problem", "start_date", "end_date"), match={"problem": {"$ne": None}}):
+            starts, ends = by_problem.setdefault(row["problem"], ([], []))
+            starts.append(row["start_date"])
+            ends.append(row["end_date"])
+        symptoms = {
+            pid: (np.array(s, dtype="datetime64[D]"), np.array(e, dtype="datetime64[D]"))
+            for pid, (s, e) in by_problem.items()
+        }
+        problems = {row["_id"]: row["name"] for row in Problem.objects(user=user).only("name").as_pymongo()}
+        treatments = list(Treatment.objects(user=user).only("name", "start_date", "end_date").order_by("start_date"))
+        return cls(periods, symptoms, problems, treatments)
+
+    def results(self):
+        """Before/after comparison for every treatment, oldest first."""
+        if not self.treatments:
+            return []
+        start = np.array([t.start_date for t in self.treatments], dtype="datetime64[D]")
+        # Day indices of each window, clipped to the logged history
+        at = (start - self.origin).astype(int)
+        before_lo = np.clip(at - WINDOW_DAYS, 0, self.n_days)
+        at_clipped = np.clip(at, 0, self.n_days)
+        after_hi = np.clip(at + WINDOW_DAYS, 0, self.n_days)
+        observed_before = at_clipped - before_lo
+        observed_after = after_hi - at_clipped
+
+        # Shape (1 + symptoms, treatments): days with each condition per window
+        days_before = self.counts[:, at_clipped] - self.counts[:, before_lo]
+        days_after = self.counts[:, after_hi] - self.counts[:, at_clipped]
+
+        cycle_window = np.timedelta64(CYCLE_WINDOW_DAYS, "D")
+        results = []
+        for i, treatment in enumerate(self.treatments):
+            ob, oa = int(observed_before[i]), int(observed_after[i])
+            cycle_before, n_before = _mean_cycle(self.cycle_starts, self.cycle_lengths, start[i] - cycle_window, start[i])
+            cycle_after, n_after = _mean_cycle(self.cycle_starts, self.cycle_lengths, start[i], start[i] + cycle_window)
+            symptoms = []
+            for row, pid in enumerate(self.problem_ids, start=1):
+                before, after = int(days_before[row, i]), int(days_after[row, i])
+                if not before and not after:
+                    continue
+                symptoms.append({
+                    "problem_id": str(pid),
+                    "name": self.problem_names.get(pid),
+                    "before": _rate(before, ob),
+                    "after": _rate(after, oa),
+                    "status": compare(before, after, ob, oa),
+                })
+            results.append({
+                "treatment": {
+                    "id": str(treatment.id),
+                    "name": treatment.name,
+                    "start": treatment.start_date.isoformat(),
+                    "end": treatment.end_date.isoformat(),
+                },
+                "observed_days": {"before": ob, "after": oa},
+                "cycle_length": {
+                    "before": cycle_before, "after": cycle_after,
+                    "cycles_before": n_before, "cycles_after": n_after,
+                },
+                "period_days": {"before": _rate(days_before[0, i], ob), "after": _rate(days_after[0, i], oa)},
+                "symptoms": symptoms,
+            })
+        return results
+
+
+def analysis_for(user):
+    """Cached results for the user's current data version."""
+    version, _ = data_version(user)
+    key = f"{user.id}:{version}"
+    results = analyses.get(key)
+    if results is None:
+        results = TreatmentAnalysis.load(user).results()
+        analyses.set(key, results)
+    return results
+
+
+def insight_content(treatment_name, problem_name, symptom):
+    return (
+        f"{problem_name}: {symptom['before']} days per {RATE_DAYS} before starting {treatment_name}, "
+        f"{symptom['after']} after ({symptom['status'].replace('_', ' ').lower()})."
+    )
+
+
+def suggested_insights(user, treatment_id=None):
+    """Insight fields for every treatment/symptom pair with a computed status."""
+    suggestions = []
+    for result in analysis_for(user):
+        treatment = result["treatment"]
+        if treatment_id and treatment["id"] != str(treatment_id):
+            continue
+        for symptom in result["symptoms"]:
+            if symptom["status"] is None:
+                continue
+            suggestions.append({
+                "treatment_id": treatment["id"],
+                "problem_id": symptom["problem_id"],
+                "status": symptom["status"],
+                "content": insight_content(treatment["name"], symptom["name"], symptom),
+            })
+    return suggestions
+
+
+def write_insights(user, treatment_id=None):
+    """Creates or updates the user's Insight for each suggestion; returns how many changed."""
+    suggestions = suggested_insights(user, treatment_id)
+    if not suggestions:
+        return 0
+    treatment_ids = {ObjectId(s["treatment_id"]) for s in suggestions}
+    existing = {
+        (str(ref_id(ins, "treatment")), str(ref_id(ins, "problem"))): ins
+        for ins in Insight.objects(user=user, treatment__in=list(treatment_ids))
+    }
+    changed = 0
+    for suggestion in suggestions:
+        insight = existing.get((suggestion["treatment_id"], suggestion["problem_id"]))
+        if insight is None:
+            insight = Insight(
+                user=user,
+                treatment=ObjectId(suggestion["treatment_id"]),
+                problem=ObjectId(suggestion["problem_id"]),
+            )
+        elif (insight.status, insight.content) == (suggestion["status"], suggestion["content"]):
+            continue
+        insight.status = suggestion["status"]
+        insight.content = suggestion["content"]
+        # Through save() so the community TreatmentOutcome counters follow
+        insight.save()
+        changed += 1
+    return changed
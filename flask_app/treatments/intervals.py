@@ -0,0 +1,79 @@
+# Centered interval tree for overlap joins between treatments and logs.
+#
+# Built once per request from the treatments in the requested window, then
+# queried once per log: O(log n + k) per lookup instead of scanning every
+# treatment for every log.
+
+
+class _Node:
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, center, spanning, left, right):
+        self.center = center
+        # Intervals containing `center`, sorted for early exit on either side
+        self.by_start = sorted(spanning, key=lambda iv: iv[0])
+        self.by_end = sorted(spanning, key=lambda iv: iv[1], reverse=True)
+        self.left = left
+        self.right = right
+
+
+class IntervalTree:
+    """Static tree over closed [start, end] intervals carrying a value each.
+
+    Endpoints can be anything orderable (datetimes here).
+    """
+
+    def __init__(self, intervals=()):
+        intervals = [(start, end, value) for start, end, value in intervals]
+        self._size = len(intervals)
+        self._root = self._build(intervals)
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def _build(cls, intervals):
+        if not intervals:
+            return None
+        endpoints = sorted(p for start, end, _ in intervals for p in (start, end))
+        center = endpoints[len(endpoints) // 2]
+        left, right, spanning = [], [], []
+        for iv in intervals:
+            if iv[1] < center:
+                left.append(iv)
+            elif iv[0] > center:
+                right.append(iv)
+            else:
+                spanning.append(iv)
+        return _Node(center, spanning, cls._build(left), cls._build(right))
+
+    def overlapping(self, start, end):
+        """Values of the intervals sharing at least one point with [start, end]."""
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if end < node.center:
+                # Every interval here ends at or after center, so only starts matter
+                for iv in node.by_start:
+                    if iv[0] > end:
+                        break
+                    found.append(iv[2])
+                stack.append(node.left)
+            elif start > node.center:
+                for iv in node.by_end:
+                    if iv[1] < start:
+                        break
+                    found.append(iv[2])
+                stack.append(node.right)
+            else:
+                found.extend(iv[2] for iv in node.by_start)
+                stack.append(node.left)
+                stack.append(node.right)
+        return found
+
+    def at(self, point):
+        """Values of the intervals containing `point`."""
+        return self.overlapping(point, point)
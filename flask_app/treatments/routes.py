@@ -1,54 +1,193 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, request
 from flask_login import login_required, current_user
-from ..models import treatment
-from datetime import datetime
-from ..forms import treatmentForm
+from mongoengine.errors import ValidationError
+from ..models import Treatment, Problem
+from datetime import datetime, timedelta
+from ..prefetch import ref_id
+from ..serialization import jsonify, request_json
+from ..conditional import bump_data_version, conditional_on_user_data
+from ..logs.routes import parse_range_date, logs_in_range
+from .intervals import IntervalTree
+from .calendar import forget_treatment, log_from_treatment
 
 treatments = Blueprint("treatments", __name__)
 
-@treatments.route("/treatments")
+
+def treatments_in_range(user, start=None, end=None):
+    """Returns the user's treatments active at any point in [start, end], served by the (user, start_date, end_date) index."""
+    query = {"user": user}
+    if end:
+        query["start_date__lte"] = end
+    if start:
+        query["end_date__gte"] = start
+    return Treatment.objects(**query)
+
+
+def user_treatment(treatment_id):
+    """The current user's treatment with `treatment_id`, or None when there is none or the id is malformed."""
+    try:
+        return Treatment.objects(id=treatment_id, user=current_user).first()
+    except ValidationError:
+        return None
+
+
+def day_range(value):
+    """The first and last instant of the day named by `value` (YYYY-MM-DD)."""
+    day = datetime.fromisoformat(value).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day, day + timedelta(days=1) - timedelta(microseconds=1)
+
+
+def requested_range():
+    """The window from ?date= (a whole day) or ?start=&end=; raises ValueError if malformed."""
+    if request.args.get('date'):
+        return day_range(request.args['date'])
+    return parse_range_date(request.args.get('start')), parse_range_date(request.args.get('end'))
+
+
+def treatment_json(treatment):
+    return {
+        "id": treatment.id,
+        "name": treatment.name,
+        "details": treatment.details,
+        "start": treatment.start_date,
+        "end": treatment.end_date,
+        "problem_id": ref_id(treatment, 'problem'),
+    }
+
 
 @treatments.route("/treatments/data")
 @login_required
+@conditional_on_user_data
 def treatments_data():
-    user_treatments = treatment.objects(user=current_user)
-    events = []
-    for treatment in user_treatments:
-        events.append({
-            "id": str(treatment.id),
-            "title": treatment.description or treatment.type,
-            "start": treatment.start_date.isoformat(),
-            "end": treatment.end_date.isoformat() if treatment.end_date else None,
-            "allDay": False,
-            "extendedProps": {
-                "type": treatment.type,
-                "description": treatment.description
-            }
+    """Treatments active during ?start=&end=, or on ?date=."""
+    try:
+        start, end = requested_range()
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid date range"}), 400
+    user_treatments = treatments_in_range(current_user, start, end).order_by('start_date')
+    return jsonify([treatment_json(t) for t in user_treatments])
+
+
+@treatments.route("/treatments/overlaps")
+@login_required
+@conditional_on_user_data
+def treatment_overlaps():
+    """Period and symptom logs in the window, each with the treatments active during it."""
+    try:
+        start, end = requested_range()
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid date range"}), 400
+
+    user_logs = sorted(
+        logs_in_range(
+            current_user, start, end,
+            fields=('type', 'description', 'start_date', 'end_date', 'problem'),
+            match={"$or": [{"type": "Period"}, {"problem": {"$ne": None}}]},
+        ),
+        key=lambda log: log["start_date"],
+    )
+    if not user_logs:
+        return jsonify([])
+
+    # Logs may extend past the window, so cover their full span
+    span_start = min(log["start_date"] for log in user_logs)
+    span_end = max(log["end_date"] for log in user_logs)
+    tree = IntervalTree(
+        (t.start_date, t.end_date, t)
+        for t in treatments_in_range(current_user, span_start, span_end).only('name', 'start_date', 'end_date')
+    )
+
+    results = []
+    for log in user_logs:
+        active = sorted(tree.overlapping(log["start_date"], log["end_date"]), key=lambda t: t.start_date)
+        results.append({
+            "id": log["_id"],
+            "type": log.get("type"),
+            "description": log.get("description"),
+            "start": log["start_date"],
+            "end": log["end_date"],
+            "problem_id": log.get("problem"),
+            "treatments": [{"id": t.id, "name": t.name} for t in active],
         })
-    return jsonify(events)
+    return jsonify(results)
+
+
+@treatments.route("/treatments/effects")
+@login_required
+@conditional_on_user_data
+def treatment_effects():
+    """Cycle length, period days and symptom frequency before vs. after each treatment start."""
+    # numpy is only imported once someone asks for an analysis
+    from .correlation import analysis_for
+    return jsonify(analysis_for(current_user))
+
+
+@treatments.route("/treatments/<treatment_id>/insights")
+@login_required
+def suggest_insights(treatment_id):
+    """Insights the before/after comparison supports for one treatment, without saving them."""
+    from .correlation import suggested_insights
+    if not user_treatment(treatment_id):
+        return jsonify({"success": False, "error": "Treatment not found"}), 404
+    return jsonify(suggested_insights(current_user, treatment_id))
+
+
+@treatments.route("/treatments/<treatment_id>/insights", methods=["POST"])
+@login_required
+def save_insights(treatment_id):
+    """Writes the suggested Insights for one treatment, updating ones already saved."""
+    from .correlation import write_insights
+    try:
+        if not user_treatment(treatment_id):
+            return jsonify({"success": False, "error": "Treatment not found"}), 404
+        return jsonify({"success": True, "saved": write_insights(current_user, treatment_id)})
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+def apply_fields(treatment, data):
+    """Copies the editable fields present in `data` onto `treatment`.
+
+    Raises ValueError for a malformed date or a problem_id that isn't one of the user's symptoms.
+    """
+    if data.get("start_date"):
+        treatment.start_date = datetime.fromisoformat(data.get("start_date"))
+    if data.get("end_date"):
+        treatment.end_date = datetime.fromisoformat(data.get("end_date"))
+    if "name" in data:
+        treatment.name = data.get("name")
+    if "details" in data:
+        treatment.details = data.get("details")
+    if "problem_id" in data:
+        problem_id = data.get("problem_id")
+        treatment.problem = None
+        if problem_id:
+            try:
+                treatment.problem = Problem.objects(id=problem_id, user=current_user).only('id').first()
+            except ValidationError:
+                pass
+            if treatment.problem is None:
+                raise ValueError("Symptom not found")
+
 
 @treatments.route("/treatments", methods=["POST"])
 @login_required
 def create_treatment():
     try:
-        data = request.get_json()
-        print("Incoming data:", data)
-
-        # Parse dates
-        start_date = datetime.fromisoformat(data.get("start_date"))
-        end_date = datetime.fromisoformat(data.get("end_date")) if data.get("end_date") else None
-
-        treatment = treatment(
-            user=current_user,
-            type=data.get("type", "Period"),
-            description=data.get("description", ""),
-            start_date=start_date,
-            end_date=end_date
-        )
+        data = request_json()
+        treatment = Treatment(user=current_user)
+        apply_fields(treatment, data)
+        # A single-day treatment may omit its end date
+        if treatment.end_date is None:
+            treatment.end_date = treatment.start_date
         treatment.save()
-        current_user.treatments.append(treatment)
-        current_user.save()
+        bump_data_version(current_user)
         return jsonify({"success": True, "id": str(treatment.id)})
+    except (ValueError, ValidationError) as e:
+        # Malformed dates, unknown symptoms and missing required fields
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -58,25 +197,18 @@ def create_treatment():
 @login_required
 def update_treatment(treatment_id):
     try:
-        data = request.get_json()
-        treatment = treatment.objects(id=treatment_id, user=current_user).first()
+        data = request_json()
+        treatment = user_treatment(treatment_id)
         if not treatment:
-            return jsonify({"success": False, "error": "treatment not found"}), 404
-        
-        # Parse dates if provided
-        if data.get("start_date"):
-            treatment.start_date = datetime.fromisoformat(data.get("start_date"))
-        if data.get("end_date"):
-            treatment.end_date = datetime.fromisoformat(data.get("end_date"))
-        
-        # Update other fields
-        if "type" in data:
-            treatment.type = data.get("type")
-        if "description" in data:
-            treatment.description = data.get("description")
-        
+            return jsonify({"success": False, "error": "Treatment not found"}), 404
+        apply_fields(treatment, data)
         treatment.save()
+        log_from_treatment(current_user, treatment)
+        bump_data_version(current_user)
         return jsonify({"success": True})
+    except (ValueError, ValidationError) as e:
+        # Malformed dates, unknown symptoms and missing required fields
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -86,14 +218,14 @@ def update_treatment(treatment_id):
 @login_required
 def delete_treatment(treatment_id):
     try:
-        treatment = treatment.objects(id=treatment_id, user=current_user).first()
+        treatment = user_treatment(treatment_id)
         if not treatment:
-            return jsonify({"success": False, "error": "treatment not found"}), 404
+            return jsonify({"success": False, "error": "Treatment not found"}), 404
         treatment.delete()
-        # Remove from user's treatments list
-        current_user.update(pull__treatments=treatment)
+        forget_treatment(current_user, treatment)
+        bump_data_version(current_user)
         return jsonify({"success": True})
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({"success": False, "error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)}), 500
@@ -2,24 +2,73 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from io import BytesIO
 from werkzeug.utils import secure_filename
-from ..extensions import bcrypt 
+from ..extensions import bcrypt, user_cache
 from ..forms import RegistrationForm, LoginForm, ProblemForm, TreatmentForm
 from ..models import * 
 from ..config import GOOGLE_FORM_LINK
+from ..conditional import bump_data_version, conditional_on_user_data
+from ..logs.storage import log_store
+from ..pages import cache_page
+from ..prefetch import prefetch
+from ..serialization import jsonify
 from flask_app.constants import SYMPTOMS, TREATMENTS
 import datetime
+from pymongo.errors import BulkWriteError
 
 users = Blueprint('users', __name__)
 
 ''' User Management Views '''
 
 @users.route('/')
+@cache_page()
 def home():
     return render_template('home.html', google_form_link=GOOGLE_FORM_LINK)
 
 @users.route('/community')
+@cache_page()
 def community():
-    return render_template('community.html')
+    # One small pre-aggregated document per (problem, treatment) pair
+    outcomes = TreatmentOutcome.objects(total__gt=0).order_by('-total')
+    by_problem = {}
+    for outcome in outcomes:
+        by_problem.setdefault(outcome.problem_name, []).append(outcome)
+
+    problems = sorted(by_problem)
+    selected = request.args.get('problem')
+    if selected not in by_problem:
+        selected = problems[0] if problems else None
+    return render_template(
+        'community.html',
+        problems=problems,
+        selected_problem=selected,
+        outcomes=by_problem.get(selected, []),
+        quotes=insight_quotes(selected) if selected else {},
+        treatments=TREATMENTS,
+    )
+
+
+# Quotes shown per treatment and status, from the newest insights on a problem
+QUOTES_PER_STATUS = 2
+QUOTE_SCAN = 100
+
+
+def insight_quotes(problem_name):
+    """{(treatment name, status): [insight content]} for IMPROVED and WORSENED insights."""
+    problem_ids = list(Problem.objects(name=problem_name).scalar('id'))
+    insights = prefetch(
+        Insight.objects(problem__in=problem_ids, status__in=["IMPROVED", "WORSENED"])
+        .only('status', 'content', 'treatment')
+        .order_by('-id')
+        .limit(QUOTE_SCAN),
+        'treatment',
+        only=('name',),
+    )
+    quotes = {}
+    for insight in insights:
+        found = quotes.setdefault((insight.treatment.name, insight.status), [])
+        if len(found) < QUOTES_PER_STATUS:
+            found.append(insight.content)
+    return quotes
 
 @users.route('/register', methods=['GET', 'POST'])
 def register():
@@ -55,6 +104,7 @@ def login():
 @users.route('/logout')
 @login_required
 def logout():
+    user_cache.pop(current_user.get_id())
     logout_user()
     flash('You have been logged out.', 'info')
     return redirect(url_for('users.home'))
@@ -62,22 +112,49 @@ def logout():
 
 def log_problem(user, problem_name, details=""):
     """Logs a symptom/problem if not already logged."""
-    # Check if problem already exists for this user
-    existing_problem = Problem.objects(name=problem_name, user=user).first()
-    if existing_problem:
-        return False, f"'{problem_name}' has already been logged."
-    
-    # Create new problem
-    new_problem = Problem(
-        name=problem_name,  # Use the problem_name parameter
-        user=user,
-        details=details
-    )
-    new_problem.save()
-    user.problems.append(new_problem)
-    user.save()
-    return True, f"'{problem_name}' logged successfully."
+    return log_problems(user, [problem_name], details)[0]
+
+
+def log_problems(user, problem_names, details=""):
+    """Logs several symptoms/problems at once, skipping ones already logged.
+
+    Uses one $in lookup and one insert_many however many names are given, and
+    returns a (success, message) pair per name in the same order as log_problem.
+    """
+    # Check which problems already exist for this user
+    existing = set(Problem.objects(user=user, name__in=problem_names).scalar('name'))
 
+    new_problems = []
+    for name in dict.fromkeys(problem_names):
+        if name not in existing:
+            problem = Problem(name=name, user=user, details=details)
+            problem.validate()
+            new_problems.append(problem)
+
+    logged = {problem.name for problem in new_problems}
+    if new_problems:
+        try:
+            Problem._get_collection().insert_many(
+                [problem.to_mongo() for problem in new_problems], ordered=False
+            )
+        except BulkWriteError as e:
+            # The unique (user, name) index rejects anything a concurrent
+            # request logged after our lookup
+            for error in e.details["writeErrors"]:
+                if error["code"] != 11000:
+                    raise
+                logged.discard(new_problems[error["index"]].name)
+    if logged:
+        bump_data_version(user)
+
+    results = []
+    for name in problem_names:
+        if name in logged:
+            logged.discard(name)  # a repeated name in the same batch is a duplicate
+            results.append((True, f"'{name}' logged successfully."))
+        else:
+            results.append((False, f"'{name}' has already been logged."))
+    return results
 
 
 @users.route('/profile', methods=['GET', 'POST'])
@@ -90,32 +167,58 @@ def profile():
     problem_form.symptoms.choices = [(s, s) for s in SYMPTOMS]
 
     if problem_form.submit.data and problem_form.validate_on_submit():
+        selected = problem_form.symptoms.data
+        custom_symptom = problem_form.custom_symptom.data
+
+        # Log the selected symptoms and the custom one in a single batch
+        to_log = [symptom for symptom in selected if symptom in SYMPTOMS]
+        if custom_symptom:
+            to_log.append(custom_symptom)
+        results = iter(log_problems(user, to_log))
+
         messages = []
-        # Log selected symptoms from the dropdown
-        for symptom in problem_form.symptoms.data:
+        for symptom in selected:
             if symptom in SYMPTOMS:
-                success, msg = log_problem(user, symptom)  # Pass the symptom string
-                messages.append((success, msg))
+                messages.append(next(results))
             else:
                 messages.append((False, f"'{symptom}' is not a valid symptom."))
-        
-        # Log custom symptom
-        custom_symptom = problem_form.custom_symptom.data
         if custom_symptom:
-            success, msg = log_problem(user, custom_symptom)  # Pass the custom symptom string
-            messages.append((success, msg))
+            messages.append(next(results))
         
         for success, msg in messages:
             flash(msg, "success" if success else "warning")
         return redirect(url_for('users.profile'))
 
-    # Render page
-    user_symptoms = Problem.objects(user=user)
-    user_treatments = Log.objects(user=user, type="Treatment")
+    # The symptom and treatment lists are loaded from profile_data
     return render_template(
         "profile.html",
         problem_form=problem_form,
-        user_symptoms=user_symptoms,
-        user_treatments=user_treatments,
         user=user
     )
+
+
+@users.route('/profile/data')
+@login_required
+@conditional_on_user_data
+def profile_data():
+    """The profile's symptom and treatment lists as JSON; profile.html renders them."""
+    user_symptoms = Problem.objects(user=current_user).only('name', 'details')
+    user_treatments = log_store().find(
+        current_user,
+        fields=('treatment_name', 'description', 'start_date', 'end_date'),
+        match={"type": "Treatment"},
+    )
+    return jsonify({
+        # Problem.json_fields: id, name, details
+        "symptoms": list(user_symptoms),
+        "treatments": [
+            {
+                "id": t["_id"],
+                "treatment_name": t.get("treatment_name"),
+                "description": t.get("description"),
+                "start": t["start_date"],
+                "end": t["end_date"],
+            }
+            for t in user_treatments
+        ],
+    })
@@ -0,0 +1,18 @@
+# gunicorn -c gunicorn.conf.py
+#
+# Serves flask_app/asgi.py under uvicorn workers by default, so place searches
+# waiting on the Lambda don't hold threads the calendar needs. To run the
+# plain WSGI app instead:
+#   GUNICORN_APP=flask_app.run:app GUNICORN_WORKER_CLASS=gthread gunicorn -c gunicorn.conf.py
+import os
+
+wsgi_app = os.environ.get("GUNICORN_APP", "flask_app.asgi:app")
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "uvicorn.workers.UvicornWorker")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+# Only used by gthread workers; ASGI workers size their pool with ASGI_WSGI_THREADS
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+# Longer than LAMBDA_TIMEOUT, so a worker is never killed mid-search
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+# Each worker opens its own MongoDB pool after forking (see mongo.py)
+preload_app = False